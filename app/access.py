@@ -1,83 +1,131 @@
 #! python3
+# access.py - Login window of the app. Nothing is created on import, the window is built by LoginDialog.
 
 from tkinter import *
 from tkinter import messagebox
+import os
+
 import app.auth as auth
-from PIL import ImageTk, Image
 
-#global variable
-USERNAME = None 
+POLL_INTERVAL = 50 	#ms between checks of a running password verification
 
-def register():
-	username = entry_username.get()
-	password = entry_password.get()
+class LoginDialog:
+	'''
+	Login and signup window shown before the main app.
+	The password checks run on the credential store's worker pool so the window keeps responding.
+	run() shows the window and returns the logged in username (None if the window was closed).
 
-	if len(username) < 5:
-		messagebox.showerror('Error', 'Please use a longer username.')
-	elif len(password) < 5:
-		messagebox.showerror('Error', 'Please user a longer password.')
-	else:
-		register_result = auth.register(username, password)
+	GUI implementation is in the same file as the login flow to reduce file count and keep it secure.
 
-		if register_result: 
-			messagebox.showinfo('Success', 'User registered Successfully.\nLogin to Use B.O.B')
-		else:
-			messagebox.showerror('Error', 'Registration failed.')
+	Args:
+		store:	CredentialStore used for login and registration. The default store of auth if None.
+	'''
+	def __init__(self, store=None):
+		self.store = auth.get_store() if store is None else store
+		self.username = None
 
-def login():
-	global USERNAME 
+		self.login_window = Tk()
+		self.login_window.title("B.O.B LOGIN WINDOW")
+		self.login_window.geometry("800x500")
+		self.login_window.config(bg='white')
+		self.login_window.resizable(width = False, height = False)
 
-	username = entry_username.get()
-	password = entry_password.get()
+		from PIL import ImageTk, Image		#only needed once the window is actually built
+		tiles_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'assets', 'tiles.png'))
+		tiles = Image.open(tiles_path)
+		self.logo = ImageTk.PhotoImage(tiles)
+		logo_label = Label(self.login_window, image = self.logo, bd = 0)
+		logo_label.pack(side = TOP)
 
-	login_result = auth.login(username, password)
+		username_label = Label(self.login_window, text = 'Username:', bg='white', font = ('Ariel'))
+		password_label = Label(self.login_window, text = 'Password:', bg='white', font = ('Ariel'))
 
-	if login_result:
-		messagebox.showinfo('Success', 'Login successful.')
-		login_window.destroy()
-		USERNAME = username 
-	else:
-		messagebox.showerror('Error', 'Incorrect username or password.')
+		self.entry_username = Entry(self.login_window, bd = 2)
+		self.entry_password = Entry(self.login_window, show='*', bd = 2)
 
-def get_username():
-	global USERNAME
-	return USERNAME
-'''
-GUI implementation is in the same file to reduce file count and keep it secure.
-'''
-login_window = Tk()
-login_window.title("B.O.B LOGIN WINDOW")
-login_window.geometry("800x500")
-login_window.config(bg='white')
-login_window.resizable(width = False, height = False)
+		self.login_button = Button(self.login_window, text = 'LogIn', command = self.login, padx=4, pady=2)
+		self.signup_button = Button(self.login_window, text = 'Signup', command = self.register, padx=4, pady=2)
 
-tiles = Image.open('assets/tiles.png')
-logo = ImageTk.PhotoImage(tiles)
-logo_label = Label(login_window, image = logo, bd = 0)
-logo_label.pack(side = TOP)
+		new_user_label = Label(self.login_window, text = 'New User?', bg = 'white')
 
-username_label = Label(login_window, text = 'Username:', bg='white', font = ('Ariel'))
-password_label = Label(login_window, text = 'Password:', bg='white', font = ('Ariel'))
+		self.login_window.bind('<Return>', lambda event = None: self.login())
 
-entry_username = Entry(login_window, bd = 2)
-entry_password = Entry(login_window, show='*', bd = 2)
+		username_label.place(x = 247, y = 320)
+		password_label.place(x = 250, y = 350)
 
-login_button = Button(login_window, text = 'LogIn', command = login, padx=4, pady=2)
-signup_button = Button(login_window, text = 'Signup', command = register, padx=4, pady=2)
+		self.entry_username.place(x=330, y=320)
+		self.entry_password.place(x=330, y=350)
 
-new_user_label = Label(login_window, text = 'New User?', bg = 'white')
+		self.login_button.place(x=350, y=385)
+		new_user_label.place(x=343, y=415)
+		self.signup_button.place(x=347, y=440)
 
-login_window.bind('<Return>', lambda event = None: login())
+	def run(self):
+		#Shows the window until the user logs in or closes it
+		self.login_window.mainloop()
+		return self.username
 
-username_label.place(x = 247, y = 320)
-password_label.place(x = 250, y = 350)
+	def register(self):
+		username = self.entry_username.get()
+		password = self.entry_password.get()
 
-entry_username.place(x=330, y=320)
-entry_password.place(x=330, y=350)
+		if len(username) < 5:
+			messagebox.showerror('Error', 'Please use a longer username.')
+		elif len(password) < 5:
+			messagebox.showerror('Error', 'Please user a longer password.')
+		else:
+			self.set_busy(True)
+			#hashing the password runs on the auth worker pool, the window keeps responding
+			self.wait_for(self.store.register_async(username, password), self.finish_register)
 
-login_button.place(x=350, y=385)
-new_user_label.place(x=343, y=415)
-signup_button.place(x=347, y=440)
+	def finish_register(self, register_result):
+		self.set_busy(False)
+		if register_result:
+			messagebox.showinfo('Success', 'User registered Successfully.\nLogin to Use B.O.B')
+		else:
+			messagebox.showerror('Error', 'Registration failed.')
+
+	def login(self):
+		username = self.entry_username.get()
+		password = self.entry_password.get()
+
+		if self.login_button['state'] == DISABLED:	#a check is already running
+			return
 
-login_window.mainloop()
+		self.set_busy(True)
+		#verifying the password runs on the auth worker pool, the window keeps responding
+		self.wait_for(self.store.login_async(username, password), lambda result: self.finish_login(result, username))
 
+	def finish_login(self, login_result, username):
+		self.set_busy(False)
+		if login_result:
+			messagebox.showinfo('Success', 'Login successful.')
+			self.login_window.destroy()
+			self.username = username
+		else:
+			messagebox.showerror('Error', 'Incorrect username or password.')
+
+	def wait_for(self, future, callback):
+		#Polls the future from the Tk event loop and calls callback with its result once it is done
+		if future.done():
+			callback(future.exception() is None and future.result())	#a failed check counts as a failed login
+		else:
+			self.login_window.after(POLL_INTERVAL, lambda: self.wait_for(future, callback))
+
+	def set_busy(self, busy):
+		#Disables the buttons while a password is being checked
+		state = DISABLED if busy else NORMAL
+		self.login_button.config(state=state)
+		self.signup_button.config(state=state)
+
+def get_username(store=None):
+	'''
+	Shows the login window and returns the username of the user who logged in (None if the window was closed).
+	'''
+	return LoginDialog(store).run()
+
+def headless_login(username, password, store=None):
+	'''
+	Login without any window for batch tooling: returns the username if the credentials are valid, else None.
+	'''
+	return username if auth.authenticate(username, password, store) else None
@@ -0,0 +1,367 @@
+#! python3
+# analytics.py - Forgetting curve analytics over the 10 session histories of all cards of a user.
+#				The histories are read into a (cards x 10) uint8 matrix and everything else is vectorized over it:
+#				- retention curves: probability of recalling a card after s correct answers in a row,
+#				  a logistic curve fitted per box and for the whole deck
+#				- recall: each card's estimated probability of being recalled in its next session
+#				- leeches: cards that were forgotten again and again (LEECH_LAPSES times after being recalled)
+#				- response times of the right answers (latency.py buckets): a histogram per box and the median per
+#				  card, cards answered right but slower than most cards of their box (SLOW_QUANTILE) are slow
+#				Histories of fewer than 10 answers are padded with 0s at the start, and cards saved by older versions
+#				started with ten 0s that were never answered, so the 0s before the first correct answer may be
+#				sessions that never happened. Only the answers after a card's first correct answer are counted as observations.
+#
+# Usage: python -m app.analytics [USERNAME ...]		analyses the given users (all users in data/ if none)
+
+import math
+from itertools import chain, islice, repeat
+from operator import attrgetter, itemgetter
+
+import base64
+import numpy as np
+
+from app.models import Card, Box, DEFAULT_BOXES
+from app.latency import BUCKETS, UNMEASURED, bucket_seconds, histogram, quantiles
+from app.scheduling import gc_paused
+import app.metrics as metrics
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+SESSIONS = 10 			#length of a card's history
+LEECH_LAPSES = 3 		#a card forgotten this many times after being recalled is a leech
+RECENCY = 0.8 			#weight of a card's own answer per session it is older, in its recall estimate
+PRIOR_WEIGHT = 2.0 		#answers the retention curve of its box counts as in a card's recall estimate
+RIDGE = 1.0 			#regularization of the curve fits, boxes without answers get a flat 50% curve
+CHUNK = 65536 			#cards converted to arrays at once when reading card data
+SLOW_QUANTILE = 0.75 	#a card whose median response time is above this quantile of its box is slow
+
+def history_matrix(histories:list) -> np.ndarray:
+	#(cards x SESSIONS) uint8 matrix of the histories, shorter histories are padded with 0s at the start
+	count = len(histories)
+	if set(map(len, histories)) <= {SESSIONS}:
+		matrix = np.fromiter(chain.from_iterable(histories), np.uint8, count*SESSIONS).reshape(count, SESSIONS)
+	else: 			#histories saved by older versions
+		matrix = np.zeros((count, SESSIONS), np.uint8)
+		for row, history in enumerate(histories):
+			history = list(history)[-SESSIONS:]
+			if history:
+				matrix[row, SESSIONS - len(history):] = history
+	return np.minimum(matrix, 1, out=matrix)
+
+def latency_events(rows:list, logs:list) -> tuple:
+	'''
+	(rows, buckets) of the right answers with a response time, from the review logs of the cards at rows.
+	A log is (untimed, packed outcome bits, response time buckets of the timed answers) as in models.ReviewLog.
+	'''
+	measured = [(row, log) for row, log in zip(rows, logs) if log[2]]
+	if not measured:
+		return np.zeros(0, np.intp), np.zeros(0, np.uint8)
+	logs = [log for _, log in measured]
+	timed = np.fromiter(map(len, map(itemgetter(2), logs)), np.intp, len(logs))
+	buckets = np.frombuffer(b''.join(map(itemgetter(2), logs)), np.uint8)
+	bits = np.unpackbits(np.frombuffer(b''.join(map(itemgetter(1), logs)), np.uint8), bitorder='little')
+	#the timed answers of a log start untimed bits into its bits
+	bit_starts = np.cumsum([0] + [len(log[1])*8 for log in logs[:-1]]) + np.fromiter(map(itemgetter(0), logs), np.intp, len(logs))
+	event_starts = np.cumsum(timed) - timed
+	positions = np.repeat(bit_starts - event_starts, timed) + np.arange(len(buckets))
+	right = bits[positions].astype(bool) & (buckets != UNMEASURED)
+	card_rows = np.repeat(np.fromiter(map(itemgetter(0), measured), np.intp, len(measured)), timed)
+	return card_rows[right], buckets[right]
+
+def encoded_log(data:dict) -> tuple:
+	#latency_events log of the 'log' of card data (models.ReviewLog.encode)
+	log = data['log']
+	return log[1], base64.b64decode(log[2]), base64.b64decode(log[4]) if len(log) > 4 else b''
+
+def read_card_data(cards) -> tuple:
+	'''
+	(ids, boxes, histories, events) of an iterable of card data (as in Card.to_dict, e.g. Database.iter_cards()):
+	a list of ids, an int16 array of boxes, the history matrix and the latency_events of the review logs.
+	Converted CHUNK cards at a time, so only the arrays are kept for a large deck.
+	'''
+	ids, boxes, histories, rows, logs = [], [], [], [], []
+	iterator = iter(cards)
+	with gc_paused():
+		while True:
+			chunk = list(islice(iterator, CHUNK))
+			if not chunk:
+				break
+			logged = [row for row, data in enumerate(chunk, len(ids)) if 'log' in data]
+			rows.extend(logged)
+			logs.extend(encoded_log(chunk[row - len(ids)]) for row in logged)
+			ids.extend(map(dict.get, chunk, repeat('id')))
+			boxes.append(np.fromiter(map(dict.get, chunk, repeat('box'), repeat(1)), np.int16, len(chunk)))
+			histories.append(history_matrix(list(map(dict.get, chunk, repeat('history'), repeat(())))))
+	events = latency_events(rows, logs)
+	if not ids:
+		return [], np.zeros(0, np.int16), np.zeros((0, SESSIONS), np.uint8), events
+	return ids, np.concatenate(boxes), np.concatenate(histories), events
+
+def read_box(box:Box) -> tuple:
+	#(ids, boxes, histories, events) of the cards loaded in the box, like read_card_data
+	cards = list(chain.from_iterable(box.boxlist))
+	with gc_paused():
+		records = list(map(attrgetter('id', 'history', 'log'), cards))
+	boxes = np.repeat(np.arange(1, len(box.boxlist) + 1, dtype=np.int16), [len(individual_box) for individual_box in box.boxlist])
+	rows = [row for row, record in enumerate(records) if record[2].latencies]
+	events = latency_events(rows, [(log.untimed, log.bits, log.latencies) for log in (records[row][2] for row in rows)])
+	return [record[0] for record in records], boxes, history_matrix([record[1] for record in records]), events
+
+def streaks(histories:np.ndarray) -> tuple:
+	'''
+	(known, streak) matrices of the histories. known: the answer of the session follows an earlier correct
+	answer, so it is a real answer. streak: correct answers in a row right before the session.
+	'''
+	known = np.zeros(histories.shape, bool)
+	known[:, 1:] = np.maximum.accumulate(histories, axis=1)[:, :-1]
+	streak = np.zeros(histories.shape, np.uint8)
+	for session in range(1, SESSIONS):
+		streak[:, session] = (streak[:, session - 1] + 1)*histories[:, session - 1]
+	return known, streak
+
+def count_trials(boxes:np.ndarray, histories:np.ndarray, known:np.ndarray, streak:np.ndarray, box_count:int) -> tuple:
+	#(trials, successes): (box_count x SESSIONS) answers and correct answers per box and streak before the answer
+	index = ((boxes.astype(np.intp) - 1)[:, None]*SESSIONS + streak)[known]
+	size = box_count*SESSIONS
+	trials = np.bincount(index, minlength=size).reshape(box_count, SESSIONS)
+	successes = np.bincount(index, weights=histories[known], minlength=size).reshape(box_count, SESSIONS)
+	return trials, successes
+
+def sigmoid(values):
+	return 1/(1 + np.exp(-values))
+
+def fit_curves(trials:np.ndarray, successes:np.ndarray, iterations:int=25) -> np.ndarray:
+	'''
+	Fits p(s) = sigmoid(a + b*s), the probability of recalling a card after s correct answers in a row,
+	to every row of the (rows x SESSIONS) answer counts. Newton's method, vectorized over the rows.
+	Returns the (rows x 2) parameters [a, b].
+	'''
+	design = np.column_stack([np.ones(SESSIONS), np.arange(SESSIONS)])
+	params = np.zeros((len(trials), 2))
+	for _ in range(iterations):
+		recall = sigmoid(params @ design.T)
+		gradient = (successes - trials*recall) @ design - RIDGE*params
+		weights = trials*recall*(1 - recall)
+		hessian = np.einsum('rs,si,sj->rij', weights, design, design) + RIDGE*np.eye(2)
+		params += np.linalg.solve(hessian, gradient[..., None])[..., 0]
+	return params
+
+class Analysis:
+	'''
+	Result of analyze() for one deck. Arrays are in the order of ids.
+		ids, boxes:			card ids and boxes (1 - box_count)
+		recall:				estimated probability of recalling each card in its next session
+		lapses:				times each card was forgotten after being recalled, in its history
+		trials, successes:	(box_count x SESSIONS) answers and correct answers per box and streak before the answer
+		curves:				(box_count+1 x 2) fitted retention curves, row 0 is the whole deck, row k is box k
+		latency:			(box_count+1 x latency.BUCKETS) response times of the right answers, rows like curves
+		card_latency:		median response time bucket of each card's right answers (latency.UNMEASURED without)
+		slow:				cards whose median is above the SLOW_QUANTILE of their box
+	'''
+	def __init__(self, ids:list, boxes, recall, lapses, trials, successes, curves, latency=None, card_latency=None, slow=None):
+		self.ids = ids
+		self.boxes = boxes
+		self.recall = recall
+		self.lapses = lapses
+		self.trials = trials
+		self.successes = successes
+		self.curves = curves
+		self.latency = np.zeros((len(trials) + 1, BUCKETS), np.intp) if latency is None else latency
+		self.card_latency = np.full(len(ids), UNMEASURED, np.uint8) if card_latency is None else card_latency
+		self.slow = np.zeros(len(ids), bool) if slow is None else slow
+		self.rows = None 	#card id -> position, made on first use
+
+	def __len__(self):
+		return len(self.ids)
+
+	@property
+	def box_count(self) -> int:
+		return len(self.trials)
+
+	def leeches(self) -> list:
+		#Ids of the leeches, the most forgotten first
+		rows = np.flatnonzero(self.lapses >= LEECH_LAPSES)
+		rows = rows[np.argsort(-self.lapses[rows], kind='stable')]
+		return [self.ids[row] for row in rows.tolist()]
+
+	def curve(self, box:int=0) -> np.ndarray:
+		#Fitted recall probability after 0 - 9 correct answers in a row, of the deck (box 0) or of a box
+		a, b = self.curves[box]
+		return sigmoid(a + b*np.arange(SESSIONS))
+
+	def retention(self, box:int=0) -> np.ndarray:
+		#Observed recall rate after 0 - 9 correct answers in a row (nan without answers), of the deck or of a box
+		trials = self.trials.sum(axis=0) if box == 0 else self.trials[box - 1]
+		successes = self.successes.sum(axis=0) if box == 0 else self.successes[box - 1]
+		with np.errstate(invalid='ignore', divide='ignore'):
+			return successes/trials
+
+	def positions(self, card_ids) -> np.ndarray:
+		#Rows of the cards with the ids, -1 for cards not in the analysis
+		if self.rows is None:
+			self.rows = {card_id: row for row, card_id in enumerate(self.ids)}
+		return np.fromiter(map(self.rows.get, card_ids, repeat(-1)), np.intp)
+
+	def recall_of(self, card_ids) -> np.ndarray:
+		#Estimated recall of the cards with the ids, the mean recall of the deck for cards not in the analysis
+		positions = self.positions(card_ids)
+		if not len(self.recall):
+			return np.full(len(positions), 0.5)
+		return np.where(positions >= 0, self.recall[positions], self.recall.mean())
+
+	def slow_of(self, card_ids) -> np.ndarray:
+		#1.0 for the slow cards with the ids, 0.0 for the others and for cards not in the analysis
+		positions = self.positions(card_ids)
+		return np.where(positions >= 0, self.slow[positions], False).astype(np.float32)
+
+	def response_time(self, box:int=0, q:float=0.5) -> float:
+		#q quantile of the response times (seconds) of the right answers of the deck (box 0) or of a box, nan without any
+		return float(bucket_seconds(quantiles(self.latency[box], q)))
+
+	def summary(self) -> dict:
+		'''
+		Per box and deck totals for the stats window: cards, mean recall, leeches, observed and fitted curves.
+		'''
+		rows = []
+		for box in range(self.box_count + 1):
+			cards = self.boxes == box if box else np.ones(len(self.ids), bool)
+			rows.append({'box': box, 'cards': int(cards.sum()),
+				'recall': float(self.recall[cards].mean()) if cards.any() else None,
+				'leeches': int((self.lapses[cards] >= LEECH_LAPSES).sum()),
+				'answers': int(self.trials.sum() if box == 0 else self.trials[box - 1].sum()),
+				'median_time': self.time_or_none(box, 0.5), 'p90_time': self.time_or_none(box, 0.9),
+				'slow': int(self.slow[cards].sum()),
+				'retention': [None if math.isnan(value) else round(float(value), 4) for value in self.retention(box)],
+				'curve': [round(float(value), 4) for value in self.curve(box)]})
+		return {'cards': len(self.ids), 'leeches': rows[0]['leeches'], 'deck': rows[0], 'boxes': rows[1:]}
+
+	def time_or_none(self, box:int, q:float):
+		seconds = self.response_time(box, q)
+		return None if math.isnan(seconds) else round(seconds, 2)
+
+def response_times(boxes:np.ndarray, events:tuple, box_count:int) -> tuple:
+	'''
+	(latency, card_latency, slow) of Analysis from the latency_events of the cards: the histograms per box,
+	the median bucket of every card (from the events sorted by card and bucket) and the slow cards.
+	'''
+	card_rows, buckets = events
+	latency = histogram(buckets, boxes[card_rows], box_count + 1)
+	latency[0] = latency[1:].sum(axis=0)
+
+	answers = np.bincount(card_rows, minlength=len(boxes))
+	order = np.lexsort((buckets, card_rows))
+	starts = np.cumsum(answers) - answers
+	measured = answers > 0
+	card_latency = np.full(len(boxes), UNMEASURED, np.uint8)
+	card_latency[measured] = buckets[order][(starts + (answers - 1)//2)[measured]]
+
+	box_slow = quantiles(latency, SLOW_QUANTILE)
+	slow = measured & (card_latency > box_slow[boxes])
+	return latency, card_latency, slow
+
+@metrics.timed('analytics.analyze')
+def analyze(ids:list, boxes, histories, events:tuple=None, box_count:int=DEFAULT_BOXES) -> Analysis:
+	'''
+	Analysis of the cards given as arrays (read_card_data, read_box). Boxes above box_count count as the last box.
+	events are the latency_events of the cards, the cards have no response times if None.
+	'''
+	boxes = np.clip(boxes, 1, box_count).astype(np.int16)
+	known, streak = streaks(histories)
+	trials, successes = count_trials(boxes, histories, known, streak, box_count)
+	curves = fit_curves(np.vstack([trials.sum(axis=0), trials]), np.vstack([successes.sum(axis=0), successes]))
+
+	#recall: the card's own recent answers, with the retention curve of its box at its current streak as prior
+	current = (streak[:, -1] + 1)*histories[:, -1]
+	prior = sigmoid(curves[boxes, 0] + curves[boxes, 1]*current)
+	weights = (RECENCY**np.arange(SESSIONS - 1, -1, -1)).astype(np.float32)
+	evidence = known.astype(np.float32) @ weights
+	correct = (known & (histories == 1)).astype(np.float32) @ weights
+	recall = ((correct + PRIOR_WEIGHT*prior)/(evidence + PRIOR_WEIGHT)).astype(np.float32)
+
+	lapses = np.count_nonzero(histories[:, :-1] > histories[:, 1:], axis=1).astype(np.uint8)
+	if events is None:
+		events = np.zeros(0, np.intp), np.zeros(0, np.uint8)
+	return Analysis(ids, boxes, recall, lapses, trials, successes, curves, *response_times(boxes, events, box_count))
+
+class DeckAnalytics:
+	'''
+	Cached analysis of a user's cards: the cards file of the Database and the cards loaded in the Box.
+	The arrays of the cards file are read again only after the Database wrote the file (Database.version),
+	the analysis is redone after any card was answered (Card.reviews) or the file changed.
+	'''
+	def __init__(self, database, box:Box=None):
+		self.database = database
+		self.box = box
+		self.file_version = None
+		self.file_arrays = None
+		self.key = None
+		self.analysis = None
+
+	def invalidate(self):
+		self.file_version = None
+		self.key = None
+
+	def get(self) -> Analysis:
+		box_count = self.database.boxes if self.box is None else len(self.box.boxlist)
+		key = (self.database.version, Card.reviews, box_count)
+		if key == self.key:
+			return self.analysis
+
+		if self.file_version != self.database.version:
+			self.file_arrays = read_card_data(self.database.iter_file())
+			self.file_version = self.database.version
+		ids, boxes, histories, events = self.file_arrays
+		if self.box is not None:
+			box_ids, box_boxes, box_histories, box_events = read_box(self.box)
+			events = (np.concatenate([box_events[0], events[0] + len(box_ids)]), np.concatenate([box_events[1], events[1]]))
+			ids = box_ids + ids
+			boxes = np.concatenate([box_boxes, boxes])
+			histories = np.concatenate([box_histories, histories])
+		self.analysis = analyze(ids, boxes, histories, events, box_count)
+		self.key = key
+		logger.info(f'Analysed {len(ids)} cards of {self.database.username}')
+		return self.analysis
+
+	def leech_cards(self, limit:int=50) -> list:
+		'''
+		Data (as in Card.to_dict) of the first limit leeches of get(), found in the Box or in one pass over the cards file.
+		'''
+		leech_ids = self.get().leeches()[:limit]
+		wanted = set(leech_ids)
+		found = {}
+		if self.box is not None:
+			for individual_box in self.box.boxlist:
+				found.update((card.id, card.to_dict()) for card in individual_box if card.id in wanted)
+		if len(found) < len(wanted):
+			found.update((data.get('id'), data) for data in self.database.iter_file() if data.get('id') in wanted)
+		return [found[card_id] for card_id in leech_ids if card_id in found]
+
+def main(argv=None):
+	'''
+	Command line entry point: prints the deck and box summaries of the users.
+	'''
+	import argparse, os
+	from app.database import Database
+
+	parser = argparse.ArgumentParser(description='Retention curves and leeches of Leitner BoB users.')
+	parser.add_argument('usernames', nargs='*')
+	args = parser.parse_args(argv)
+
+	usernames = args.usernames
+	if not usernames:
+		basepath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+		usernames = sorted(name for name in os.listdir(basepath) if os.path.isdir(os.path.join(basepath, name)))
+	for username in usernames:
+		summary = DeckAnalytics(Database(username)).get().summary()
+		print(f'\n{username}: {summary["cards"]} cards, {summary["leeches"]} leeches')
+		print(f'{"box":>5}{"cards":>9}{"recall":>8}{"leeches":>9}{"time":>8}  fitted recall after 0 / 1 / 3 / 6 correct in a row')
+		for row in [summary['deck']] + summary['boxes']:
+			recall = '-' if row['recall'] is None else f'{row["recall"]:.0%}'
+			time = '-' if row['median_time'] is None else f'{row["median_time"]:.1f}s'
+			curve = ' / '.join(f'{row["curve"][streak]:.0%}' for streak in (0, 1, 3, 6))
+			print(f'{row["box"] or "all":>5}{row["cards"]:>9}{recall:>8}{row["leeches"]:>9}{time:>8}  {curve}')
+	return 0
+
+if __name__ == '__main__':
+	raise SystemExit(main())
@@ -1,22 +1,95 @@
 #!python3
+# app_logging.py - Logging setup of the app.
+#				Records are put on a queue by the logging call and written to stderr and logs/app.log
+#				(rotated at MAX_BYTES) by a background listener thread, so the UI thread never waits for the disk.
+#				Loggers of hot paths can be sampled: only 1 of every N records below WARNING is kept.
 
+import atexit
+import itertools
 import logging
+import logging.handlers
 import os
+import queue
 
 log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs') #creating a file path for the log files
 os.makedirs(log_dir, exist_ok=True)	#making dir for logs
 log_file = os.path.join(log_dir, 'app.log')	#Ensuring the log file is created inside the log folder
 
-#Setting up the logger with its format, level and file where it will be saved
-logging.basicConfig(
-	level = logging.INFO,
-	format='%(asctime)s -%(name)s - %(levelname)s - %(message)s',
-	handlers =[
-		logging.StreamHandler(),
-		logging.FileHandler(log_file)
-	]
-)
+LOG_FORMAT = '%(asctime)s -%(name)s - %(levelname)s - %(message)s'
+LOG_LEVEL = logging.INFO
+MAX_BYTES = 5*2**20 	#size of app.log before it is rotated to app.log.1
+BACKUP_COUNT = 3 		#rotated files kept
+SAMPLE_RATES = {'app.models': 100}	#per logger: 1 of every N records below WARNING is kept (per card logs)
+
+listener = None 	#QueueListener writing the records, None when logging synchronously
+
+class SampleFilter(logging.Filter):
+	'''
+	Keeps 1 of every `every` records below WARNING (the first one included). Warnings and errors always pass.
+	'''
+	def __init__(self, every:int):
+		super().__init__()
+		self.every = every
+		self.counter = itertools.count() 	#next() on it is atomic, records can be logged from several threads
+
+	def filter(self, record) -> bool:
+		if record.levelno >= logging.WARNING:
+			return True
+		return next(self.counter) % self.every == 0
+
+def make_handlers() -> list:
+	#Handlers writing the formatted records to stderr and the rotating log file
+	formatter = logging.Formatter(LOG_FORMAT)
+	handlers = [logging.StreamHandler(),
+		logging.handlers.RotatingFileHandler(log_file, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8')]
+	for handler in handlers:
+		handler.setFormatter(formatter)
+	return handlers
+
+def configure(asynchronous:bool=True, level:int=LOG_LEVEL):
+	'''
+	(Re)configures the root logger. With asynchronous=True the logging calls only queue the records and a
+	listener thread writes them, otherwise the handlers write in the calling thread (the old behaviour).
+	'''
+	global listener
+	root = logging.getLogger()
+	stop()
+	for handler in root.handlers[:]:
+		root.removeHandler(handler)
+		handler.close()
+
+	handlers = make_handlers()
+	if asynchronous:
+		log_queue = queue.SimpleQueue()
+		listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+		listener.start()
+		handlers = [logging.handlers.QueueHandler(log_queue)] 	#formats only the message, the listener does the rest
+	root.setLevel(level)
+	for handler in handlers:
+		root.addHandler(handler)
+
+def stop():
+	#Writes out the queued records and stops the listener thread
+	global listener
+	if listener is not None:
+		listener.stop()
+		listener = None
+
+def set_sampling(name:str, every:int):
+	#Keeps 1 of every `every` records below WARNING of the logger name (every=1 turns sampling off)
+	logger = logging.getLogger(name)
+	for log_filter in logger.filters[:]:
+		if isinstance(log_filter, SampleFilter):
+			logger.removeFilter(log_filter)
+	if every > 1:
+		logger.addFilter(SampleFilter(every))
 
 #method to create a logger for each file individually
 def get_logger(name):
+	if name in SAMPLE_RATES:
+		set_sampling(name, SAMPLE_RATES[name])
 	return logging.getLogger(name)
+
+if not logging.getLogger().handlers: 	#like basicConfig, an existing setup (e.g. of a test runner) is kept
+	configure()
+atexit.register(stop)
@@ -1,58 +1,334 @@
 #! python3
+# auth.py - Credential storage and password checks for the login.
+#			Importing the module does not touch any file. The key and the user database are opened 
+#			by CredentialStore on first use.
 
-import hashlib 
-from cryptography.fernet import Fernet
-import json, os 
+import hashlib, hmac
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json, os, sqlite3, threading
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
 
 #file names
 KEY_FILE = 'secret.key' #file that contains the key
-USER_DB_FILE = 'user.enc'	# .enc or encrypted file
+USER_DB_FILE = 'user.enc'	# .enc or encrypted file, old single-file user store (migrated on start)
+CREDENTIAL_DB_FILE = 'users.db'	#indexed store with one encrypted record per user
 
-def generate_key():
-	if not os.path.exists(KEY_FILE):
-		key = Fernet.generate_key()
-		with open(KEY_FILE, 'wb') as key_file:
-			key_file.write(key)
+#password hashing cost, new and upgraded records use these settings
+KDF = 'scrypt'								#'scrypt' or 'pbkdf2_sha256'
+KDF_PARAMS = {
+	'scrypt': {'n': 2**14, 'r': 8, 'p': 1},	#~16 MiB and tens of ms per hash
+	'pbkdf2_sha256': {'iterations': 600000},
+}
+SALT_SIZE = 16
+VERIFY_WORKERS = os.cpu_count() or 1		#threads for password checks, hashlib releases the GIL while hashing
+VERIFY_CACHE_SIZE = 256						#recently verified logins that skip the slow hash
+MIN_LENGTH = 5								#shortest username and password accepted by register and login
 
-def load_key():
-	return open(KEY_FILE, 'rb').read()
+def derive_key(password, salt, kdf, params):
+	#The deliberately slow part of a login
+	if kdf == 'scrypt':
+		return hashlib.scrypt(password.encode(), salt=salt, n=params['n'], r=params['r'], p=params['p'],
+			maxmem=params['n']*params['r']*256, dklen=32)
+	elif kdf == 'pbkdf2_sha256':
+		return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params['iterations'])
+	else:
+		raise ValueError(f'Unknown key derivation function: {kdf}')
 
-def hash_password(password):
-	return hashlib.sha256(password.encode()).hexdigest()
+def hash_password(password, kdf=None, params=None):
+	'''
+	Hashes the password with a fresh salt.
+	Returns the fields stored in a user's record: kdf name, cost parameters, salt and hash (hex).
+	'''
+	kdf = KDF if kdf is None else kdf
+	params = KDF_PARAMS[kdf] if params is None else params
+	salt = os.urandom(SALT_SIZE)
+	return {'kdf': kdf, 'params': params, 'salt': salt.hex(), 'hash': derive_key(password, salt, kdf, params).hex()}
 
-def load_users():
-	if not os.path.exists(USER_DB_FILE):
-		return {}
+def verify_password(record, password) -> bool:
+	'''
+	Checks the password against a user's record in constant time.
+	Records from before password hashing hold the plain password and are compared directly.
+	'''
+	if 'password' in record:
+		return hmac.compare_digest(record['password'].encode(), password.encode())
+	digest = derive_key(password, bytes.fromhex(record['salt']), record['kdf'], record['params'])
+	return hmac.compare_digest(digest.hex(), record['hash'])
 
-	with open(USER_DB_FILE, 'rb') as file:
-		decrypted_data = cipher.decrypt(file.read()).decode()
-		return json.loads(decrypted_data)
+def valid_credentials(username, password) -> bool:
+	return len(username) >= MIN_LENGTH and len(password) >= MIN_LENGTH
 
-def save_users(users):
-	encrypted_data = cipher.encrypt(json.dumps(users).encode())
-	with open(USER_DB_FILE, 'wb') as file:
-		file.write(encrypted_data)
+def user_key(username):
+	#Lookup key of a user's record, the plain username is never stored outside the encrypted record
+	return hashlib.sha256(username.encode()).hexdigest()
 
-generate_key()
-cipher = Fernet(load_key())
-users = load_users()
+class VerifyCache:
+	'''
+	Bounded LRU of recently verified logins so that repeated logins of the same user skip the slow hash.
+	Entries are keyed by the user's stored token, so changing the record invalidates them.
+	Passwords are never kept: an entry holds an HMAC of the password under a key that only lives in this process.
+	'''
+	def __init__(self, size:int):
+		self.size = size
+		self.entries = OrderedDict()		#user_key -> (token, password mac)
+		self.secret = os.urandom(32)
+		self.lock = threading.Lock()
 
-def register(username_input, password_input) -> bool:
+	def mac(self, password):
+		return hmac.new(self.secret, password.encode(), hashlib.sha256).digest()
 
-	if username_input in users.keys():
-		return False
+	def check(self, username, token, password) -> bool:
+		key = user_key(username)
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None or entry[0] != token:
+				return False
+			self.entries.move_to_end(key)
+		return hmac.compare_digest(entry[1], self.mac(password))
 
-	users[username_input] = password_input
-	save_users(users)
-	return True
+	def add(self, username, token, password):
+		key = user_key(username)
+		mac = self.mac(password)
+		with self.lock:
+			self.entries[key] = (token, mac)
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.size:
+				self.entries.popitem(last=False)	#dropping the least recently used login
 
-def login(username_input, password_input) -> bool:
+class CredentialStore:
+	'''
+	Encrypted credential store with one record per user.
+	Every user is one row of an SQLite table: the hashed username as primary key and a Fernet token of the user's record.
+	A login only decrypts the matching row and a registration is a single insert.
+	Nothing is read or created until the store is first used.
+
+	Args:
+		key_file:		file holding the Fernet key (created if missing)
+		db_file:		SQLite file holding the credentials
+		legacy_file:	old monolithic user file, migrated into db_file if present
+		kdf, params:	password hashing function and cost for new records (module settings if None)
+		cache_size:		size of the verify cache
+		workers:		threads used by login_async and register_async
+	'''
+	def __init__(self, key_file=KEY_FILE, db_file=CREDENTIAL_DB_FILE, legacy_file=USER_DB_FILE,
+		kdf=None, params=None, cache_size=VERIFY_CACHE_SIZE, workers=VERIFY_WORKERS):
+		self.key_file = key_file
+		self.db_file = db_file
+		self.legacy_file = legacy_file
+		self.kdf = KDF if kdf is None else kdf
+		self.params = KDF_PARAMS[self.kdf] if params is None else params
+		self.workers = workers
+
+		self.verify_cache = VerifyCache(cache_size)
+		self.lock = threading.Lock()		#guards the connection, which is shared with the verify workers
+		self._cipher = None
+		self._connection = None
+		self.executor = None 				#thread pool for password checks, created on first use
+
+	@property
+	def cipher(self):
+		if self._cipher is None:
+			from cryptography.fernet import Fernet		#imported here to keep importing auth cheap
+			if not os.path.exists(self.key_file):
+				with open(self.key_file, 'wb') as key_file:
+					key_file.write(Fernet.generate_key())
+			with open(self.key_file, 'rb') as key_file:
+				self._cipher = Fernet(key_file.read())
+		return self._cipher
+
+	@property
+	def connection(self):
+		if self._connection is None:
+			with self.lock:
+				if self._connection is None:
+					connection = sqlite3.connect(self.db_file, check_same_thread=False)
+					connection.execute('CREATE TABLE IF NOT EXISTS credentials (user_key TEXT PRIMARY KEY, token BLOB NOT NULL)')
+					connection.commit()
+					self.migrate_users(connection)
+					self._connection = connection
+		return self._connection
+
+	def load_users(self):
+		#Reads the old monolithic user file as a dict of username -> password
+		if not os.path.exists(self.legacy_file):
+			return {}
+
+		with open(self.legacy_file, 'rb') as file:
+			decrypted_data = self.cipher.decrypt(file.read()).decode()
+			return json.loads(decrypted_data)
+
+	def migrate_users(self, connection):
+		'''
+		Moves the users of the old monolithic user.enc file into the credential database (once).
+		The old file is renamed afterwards so it is not read again. Safe to run from several processes at once,
+		a file that can not be decrypted is logged and skipped.
+		'''
+		if not os.path.exists(self.legacy_file):
+			return
+
+		from cryptography.fernet import InvalidToken
+		try:
+			users = self.load_users()
+		except FileNotFoundError: 			#migrated by another process in the meantime
+			return
+		except InvalidToken: 				#corrupt or encrypted with another key, left for the admin to recover
+			logger.error(f'{self.legacy_file} can not be decrypted, its users are not migrated')
+			return
+		with connection:
+			connection.executemany('INSERT OR IGNORE INTO credentials (user_key, token) VALUES (?, ?)',
+				[(user_key(username), self.encrypt_record(username, password)) for username, password in users.items()])
+		try:
+			os.replace(self.legacy_file, self.legacy_file + '.migrated')
+		except FileNotFoundError: 			#another process migrated the same users (INSERT OR IGNORE) and renamed it first
+			pass
+
+	def encrypt_record(self, username, password):
+		#Migrated plain passwords are hashed on the user's next successful login
+		return self.cipher.encrypt(json.dumps({'username': username, 'password': password}).encode())
+
+	def encrypt_hashed_record(self, username, password):
+		record = {'username': username}
+		record.update(hash_password(password, self.kdf, self.params))
+		return self.cipher.encrypt(json.dumps(record).encode())
+
+	def needs_rehash(self, record) -> bool:
+		#True if the record is a plain password or was hashed with other cost settings than the store's
+		return 'password' in record or record['kdf'] != self.kdf or record['params'] != self.params
+
+	def load_record(self, username):
+		'''
+		Returns the decrypted record (dict) of the user and the stored token, or (None, None) if the user does not exist.
+		'''
+		connection = self.connection
+		with self.lock:
+			row = connection.execute('SELECT token FROM credentials WHERE user_key = ?', (user_key(username),)).fetchone()
+		if row is None:
+			return None, None
+
+		from cryptography.fernet import InvalidToken
+		try:
+			record = json.loads(self.cipher.decrypt(row[0]).decode())
+		except InvalidToken: 				#changed on disk or encrypted with another key
+			logger.error(f'The credential record of {username} can not be decrypted, rejecting it')
+			return None, None
+		if record['username'] != username:	#guarding against a hash collision
+			return None, None
+		return record, row[0]
+
+	def update_record(self, username, old_token, new_token):
+		#Replaces the record only if nobody changed it in the meantime
+		connection = self.connection
+		with self.lock, connection:
+			connection.execute('UPDATE credentials SET token = ? WHERE user_key = ? AND token = ?',
+				(new_token, user_key(username), old_token))
+
+	def register(self, username_input, password_input) -> bool:
+		#False if the username is taken or the username or password is too short to log in with
+		if not valid_credentials(username_input, password_input):
+			return False
+		token = self.encrypt_hashed_record(username_input, password_input)	#slow hash outside the lock
+		connection = self.connection
+		with self.lock, connection:
+			cursor = connection.execute('INSERT OR IGNORE INTO credentials (user_key, token) VALUES (?, ?)',
+				(user_key(username_input), token))
+		return cursor.rowcount == 1	#nothing inserted if the user already exists
 
-	if len(username_input) < 5 or len(password_input) < 5:
-		return False
-	elif username_input in users.keys() and users[username_input] == password_input:
+	def login(self, username_input, password_input) -> bool:
+		'''
+		Checks the user's password. Blocks for the duration of the slow hash, use login_async from a GUI or server.
+		Plain or outdated records are re-hashed with the current settings after a successful login.
+		'''
+		if not valid_credentials(username_input, password_input):
+			return False
+
+		record, token = self.load_record(username_input)
+		if record is None:
+			return False
+		if self.verify_cache.check(username_input, token, password_input):
+			return True
+		if not verify_password(record, password_input):
+			return False
+
+		if self.needs_rehash(record):
+			new_token = self.encrypt_hashed_record(username_input, password_input)
+			self.update_record(username_input, token, new_token)
+			token = new_token
+		self.verify_cache.add(username_input, token, password_input)
 		return True
+
+	def submit(self, function, *args):
+		'''
+		Runs function(*args) on the verify thread pool and returns its concurrent.futures.Future.
+		'''
+		if self.executor is None:
+			self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='verify')
+		return self.executor.submit(function, *args)
+
+	def login_async(self, username_input, password_input):
+		#Future holding the bool result of login
+		return self.submit(self.login, username_input, password_input)
+
+	def register_async(self, username_input, password_input):
+		#Future holding the bool result of register
+		return self.submit(self.register, username_input, password_input)
+
+	def close(self):
+		if self.executor is not None:
+			self.executor.shutdown(wait=True)
+			self.executor = None
+		if self._connection is not None:
+			self._connection.close()
+			self._connection = None
+
+default_store = None 	#store shared by the module level functions, created on first use
+
+def get_store() -> CredentialStore:
+	global default_store
+	if default_store is None:
+		default_store = CredentialStore()
+	return default_store
+
+#Module level API used by the login window and by tools, all going through the default store
+def register(username_input, password_input) -> bool:
+	return get_store().register(username_input, password_input)
+
+def login(username_input, password_input) -> bool:
+	return get_store().login(username_input, password_input)
+
+def login_async(username_input, password_input):
+	return get_store().login_async(username_input, password_input)
+
+def register_async(username_input, password_input):
+	return get_store().register_async(username_input, password_input)
+
+def authenticate(username_input, password_input, store=None) -> bool:
+	'''
+	Headless login for batch tooling and servers: checks the credentials without any GUI.
+	'''
+	store = get_store() if store is None else store
+	return store.login(username_input, password_input)
+
+def main(argv=None):
+	'''
+	Command line entry point: python -m app.auth (login|register) USERNAME
+	The password is read from stdin so it can be piped in by scripts. Exit code 0 means success.
+	'''
+	import argparse, getpass, sys
+
+	parser = argparse.ArgumentParser(description='Headless login and registration for Leitner BoB users.')
+	parser.add_argument('action', choices=['login', 'register'])
+	parser.add_argument('username')
+	args = parser.parse_args(argv)
+
+	password = getpass.getpass() if sys.stdin.isatty() else sys.stdin.readline().rstrip('\n')
+	if args.action == 'login':
+		ok = authenticate(args.username, password)
 	else:
-		return False
+		ok = register(args.username, password)
+	print('ok' if ok else 'failed')
+	return 0 if ok else 1
 
-	
\ No newline at end of file
+if __name__ == '__main__':
+	raise SystemExit(main())
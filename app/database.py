@@ -1,20 +1,51 @@
 #! python3
 #database.py - Handles all file loading and saving for leitnerbox app.
 
-import json, os, random
-from app.models import Card, Box
+import functools, json, os, random, shutil, tempfile, threading
+from app.models import Card, Box, DEFAULT_BOXES, check_box_count
+from app.storage import get_storage, detect_storage, write_json
+from app.search import SearchIndex
+from app.dedup import HashIndex, content_hash, merge_card_data
+import app.metrics as metrics
 
 from app.app_logging import get_logger
 logger = get_logger(__name__)
 
+BOX_STORAGE = 'json'		#format of the cards file of new users: 'json', 'gzip' or 'lzma' (see storage.py)
+CARDS_FILE = 'cards'		#name of the cards file, without the extension of the storage
+DECK_FILE = 'deck.json'		#deck configuration: {"boxes": number of boxes}
+LEGACY_BOXES = 5			#box files (box1.json ...) of the versions before the cards file
+
+def box_data(box:Box) -> list:
+	#Data (as in Card.to_dict) of the cards loaded in the box, with the box they are in
+	all_data = []
+	for number, individual_box in enumerate(box.boxlist, 1):
+		for card in individual_box:
+			data = card.to_dict()
+			data['box'] = number
+			all_data.append(data)
+	return all_data
+
+def locked(method):
+	#Runs the method holding the database lock, so a snapshot never sees a half finished change of several files
+	@functools.wraps(method)
+	def wrapper(self, *args, **kwargs):
+		with self.lock:
+			return method(self, *args, **kwargs)
+	return wrapper
+
 class Database:
 	'''
 	Database class. 
-	Takes one value: username.
+	Takes one value: username. Optionally the name of the card file storage ('json', 'gzip' or 'lzma'), 
+	by default the one of the user's existing files, or BOX_STORAGE for a new user.
+	All cards of the user are in one file (cards.json, or cards.jsonl.gz / cards.jsonl.xz), the box of a card
+	is its 'box' field. The number of boxes of the deck is in deck.json (boxes).
 	Has functions following functions:
 		check_dir() :		Checks if a folder exists for the username. 
 							If not present, creates a folder with the username inside /leitner_bob/data.
-							The folder contains 5 files (box1.json to box5.json) and a username.json file that stores user usage data.
+							The folder contains the cards file, deck.json and a username.json file that stores user usage data.
+							Box files of older versions (box1.json to box5.json) are moved into the cards file.
 		load_userdata():	Loads user activity data. Specifically data for number of successful answers per session.	
 							And data for user's pomodoro activity. 
 							Saved inside 'session_data' and 'pomodoro' as keys.
@@ -22,24 +53,45 @@ class Database:
 		save_userdata(userdata):Saves the user activity data.
 								Takes a dictionary to save the data in it.	
 		load_cards(Box):		First saves data currently in the boxes and cards. 
-							Then sequencially opens the files for the 5 boxes, selects 50 questions per file, 
-							deletes the selected questions from files, creates Card objects for the questions,
-							and finally adds them to the correct attribute (box1 for example) inside
+							Then reads the cards file, selects 50 questions per box, 
+							deletes the selected questions from the file, creates Card objects for the questions,
+							and finally adds them to the correct box (box1 for example) inside
 							the Box object passed when calling the function.
+		take_cards(Box, ids):	Moves the cards with the given ids from the cards file into the Box.
 		save_cards(Box):	Takes a Box object. 
-							Iterates over the 5 boxes saved as attributes. 
-							Calls the to_dict() for each card to get the dictionary format of the Card objets.
-							Appends the dictionary to the correct box file (e.g. box1.json). 
+							Calls the to_dict() for each card of every box to get the dictionary format of the Card objets.
+							Appends the dictionaries to the cards file. 
 							After saving, changes the passed Box object into an empty Box object.
+		set_box_count(n, Box):	Changes the number of boxes of the deck (and of the passed Box).
+		get_search_index(Box):	Returns the user's SearchIndex, loaded from search_index.json or built from all cards.
+								Attaches it to the passed Box so edits through the Box keep it up to date.
+		get_hash_index(Box):	Same for the HashIndex of card content hashes (hash_index.json) used for duplicate checks.
+		save_search_index():	Saves the search and hash indexes next to the user's data if they changed.
+		dedup_cards(Box):		One linear pass over all cards that removes duplicates, merging their questions.
+		read_cards(), write_cards(data), append_cards(data):	Read, replace or append to the cards file.
+		iter_cards(Box):		Streams the data of all cards without loading the cards file.
+		snapshot(Box):			Consistent point-in-time copy of the user's cards and user data (a Snapshot),
+								taken while no other method of the Database is changing the files.
+		convert_storage(name):	Rewrites the cards file in another storage format.
 	'''
 
-	def __init__(self, username:str):
+	def __init__(self, username:str, storage:str=None):
 		self.username = username
-		self.filenames = ['box1.json', 'box2.json', 'box3.json', 'box4.json', 'box5.json']
+		self.lock = threading.RLock() 	#held by every method that writes files
+		self.search_index = None 	#loaded on first use by get_search_index
+		self.hash_index = None 		#loaded on first use by get_hash_index
+		self.version = 0 			#changes every time the cards file is written (caches of its content compare it)
+		self.found_stamp = None 	#cards_stamp() of the cards file before this Database first wrote it
+		self.wrote_cards = False
 		logger.debug(f'Initializing Database for user: {username}')
 		try:
 			self.basepath = self.get_basepath('data') #file path for all files created in the class
+			user_path = os.path.join(self.basepath, self.username)
+			self.storage = detect_storage(user_path, BOX_STORAGE) if storage is None else get_storage(storage)
+			self.filename = CARDS_FILE + self.storage.extension
 			self.check_dir() #checking file dir exists, else create one with username and default files
+			self.migrate_box_files()
+			self.boxes = self.load_deck()['boxes'] #number of boxes of the deck
 			logger.info(f'Database initialized for user: {self.username}.')
 		except Exception as e:
 			logger.error(f'Failed to initialize database for user: {username}: {str(e)}')
@@ -82,18 +134,18 @@ class Database:
 		'''
 		Creates default files for the lietner_app for the username. 
 		The default files are:
-			- files for leitner boxes (e.g. box1.json to box5.json)
+			- file for the cards of all leitner boxes (e.g. cards.json)
+			- file for the deck configuration (deck.json)
 			- file for user usage data (username.json)
-		All box files are started with [] and all data will be appended or deleted from list.
+		The cards file is started with [] and all data will be appended or deleted from list.
 		username.json file is started as a dict {} and all data will be appended to the list returned 
 		for the keys 'session_data' and 'pomodoro'.
 		'''
 		try:
-			for filename in self.filenames: #iterating through all the file names
-				file_path = os.path.join(user_path, filename)
-				with open(file_path, 'w') as file: #creating json file for the filename
-					json.dump([], file, indent=4) #starting the list for data to be stored
-					logger.debug(f'Created file {file_path}')
+			file_path = os.path.join(user_path, self.filename)
+			self.storage.write(file_path, []) #starting the list for data to be stored
+			logger.debug(f'Created file {file_path}')
+			write_json(os.path.join(user_path, DECK_FILE), {'boxes': DEFAULT_BOXES})
 
 			with open(os.path.join(user_path, f'{self.username}.json'), 'w') as file: #creating username.json file
 				json.dump({}, file, indent=4) #saved as dict 
@@ -107,6 +159,57 @@ class Database:
 			logger.error(f'Unexpected error when creating default files for {self.username}: {str(e)}')
 			raise
 
+	def migrate_box_files(self):
+		'''
+		Moves the cards of the box files of older versions (box1.json to box5.json, in any storage) into the cards file
+		and deletes the box files. The cards are streamed, a card gets the box of the file it was in.
+		'''
+		user_path = os.path.join(self.basepath, self.username)
+		box_paths = [os.path.join(user_path, f'box{i}{self.storage.extension}') for i in range(1, LEGACY_BOXES + 1)]
+		box_paths = [(number, path) for number, path in enumerate(box_paths, 1) if os.path.exists(path)]
+		if not box_paths:
+			return
+
+		logger.info(f'Moving the box files of {self.username} into {self.filename}')
+		def legacy_cards():
+			yield from self.iter_file()
+			for number, path in box_paths:
+				for data in self.storage.iter(path):
+					data['box'] = number
+					yield data
+		self.write_cards(legacy_cards())
+		for number, path in box_paths:
+			os.remove(path)
+
+	def load_deck(self) -> dict:
+		#Deck configuration from deck.json, with the defaults for decks made before it existed
+		try:
+			with open(os.path.join(self.basepath, self.username, DECK_FILE), 'r') as file:
+				deck = json.load(file)
+		except (FileNotFoundError, json.JSONDecodeError):
+			deck = {}
+		return {'boxes': DEFAULT_BOXES, **deck}
+
+	@locked
+	def set_box_count(self, boxes:int, box:Box=None):
+		'''
+		Changes the number of boxes of the deck (models.MIN_BOXES to MAX_BOXES) and of the passed Box.
+		Cards in the boxes above the new count are moved to the new last box, in one pass over the cards file.
+		'''
+		check_box_count(boxes)
+		if boxes < self.boxes:
+			def capped(data):
+				if data.get('box', 1) > boxes:
+					data['box'] = boxes
+				return data
+			self.write_cards(map(capped, self.iter_file()))
+		write_json(os.path.join(self.basepath, self.username, DECK_FILE), {**self.load_deck(), 'boxes': boxes})
+		self.boxes = boxes
+		if box is not None:
+			box.resize(boxes)
+		logger.info(f'Deck of {self.username} now has {boxes} boxes.')
+
+	@metrics.timed('database.load_userdata')
 	def load_userdata(self) -> dict:
 		'''
 		Reads the username.json file and returns the read data. 
@@ -132,6 +235,8 @@ class Database:
 			logger.error(f'Failed to load user data for {self.username}: {str(e)}')
 			raise
 
+	@metrics.timed('database.save_userdata')
+	@locked
 	def save_userdata(self, userdata:dict):
 		'''
 		Takes the user's action data saved as a dict with keys 'session_data' for % correct answers and
@@ -141,9 +246,8 @@ class Database:
 		logger.debug(f'Saving user data to: {userdata_path}')
 
 		try:
-			with open(userdata_path,'w') as file:
-				json.dump(userdata, file, indent=4)
-				logger.info(f'Userdata stored successfully for {self.username}.')
+			write_json(userdata_path, userdata)
+			logger.info(f'Userdata stored successfully for {self.username}.')
 		except IOError as e:
 			logger.error(f'IO error when saving user data for {self.username}: {str(e)}')
 			raise
@@ -151,94 +255,427 @@ class Database:
 			logger.error(f'Failed to save user data for {self.username}: {str(e)}')
 			raise
 
+	@metrics.timed('database.save_cards')
+	@locked
 	def save_cards(self, box: Box):
 		'''
 		Takes Box object. 
-		Opens files according to the box attributes in Box object. 
-		Loads the Card object data from the file, appends the data in the Box object to the loaded data, 
-		and finally writes in the same file again.
-		Empties the box attribute of Box object after the data in it is saved.
+		Appends the data of the Card objects in all boxes of the Box object to the cards file, 
+		without reading the cards already in it.
+		Empties the boxes of Box object after the data in it is saved.
 		'''
 		logger.info(f'Saving Card data for {self.username}')
 
-		for i in range(5): #going over 5 files and 5 box attributes 
-			file_path = os.path.join(self.basepath, self.username, self.filenames[i])
-			logger.debug(f'Saving Card data for box{i+1} in {file_path}')
-
-			try:
-				logger.info(f'First loading prexisting data from {file_path}')
-				with open(file_path, 'r') as file:
-					existing_data = json.load(file)
-			except (FileNotFoundError, json.JSONDecodeError) as e:
-				logger.warning(f'Could not read existing data for box {i+1}: {str(e)}. Starting with empty list.')
-				existing_data = []
-
-			logger.debug(f'Adding Card data from box{i+1} to existing data')
-			for card in box.boxlist[i]:
-				existing_data.append(card.to_dict()) #adding new data to old data
-
-			try:
-				with open(file_path, 'w') as file:
-					json.dump(existing_data, file, indent=4) #writing both old and new data
-				logger.debug(f'Successfully saved Card data for box{i+1} in {file_path}')
-			except IOError as e:
-				logger.error(f'Failed to save Card data for box {i+1}: {str(e)}')
-				raise
+		new_data = box_data(box)
+		try:
+			self.append_cards(new_data)
+			logger.debug(f'Successfully saved {len(new_data)} cards in {self.filename}')
+		except IOError as e:
+			logger.error(f'Failed to save Card data: {str(e)}')
+			raise
 
-			box.boxlist[i] = [] #clearing out the box so there's no data duplication if data is loaded again
-			logger.debug(f'Cleared all data from box{i+1}')
+		for individual_box in box.boxlist:
+			individual_box.clear() #clearing out the box so there's no data duplication if data is loaded again
+		logger.debug(f'Cleared all data from the boxes')
 
+	@metrics.timed('database.load_cards')
+	@locked
 	def load_cards(self, box:Box):
 		'''
-		Takes a Box object and fills it with Card objects made with data in .json files. 
+		Takes a Box object and fills it with Card objects made with data in the cards file. 
 		As we do not want data to be lost or data duplication, we first save data already present in the Box.
-		Then we load the data from the files. We load data worth 50 Cards at a time. 
-		Then the chosen data for 50 cards is removed from the data inside the files to ensure no data duplication.
+		Then we load the data from the file. We load data worth 50 Cards per box at a time. 
+		Then the chosen data is removed from the data inside the file to ensure no data duplication.
+		Cards of a box above the boxes of the Box go to its last box.
 		'''
 		logger.info(f'Loading cards for {self.username}')
 
-		if len(box.box1) > 0 or len(box.box2) > 0: #checking if box currently holds data (unlikely 2 boxes will be empty)
+		if any(box.boxlist): #checking if box currently holds data
 			logger.debug(f'Box contains existing data. Saving data before loading new cards.')
 			self.save_cards(box) #saving data to make sure data is not lost or duplicated
 
-		for i in range(5):
-			file_path = os.path.join(self.basepath, self.username, self.filenames[i]) #creating file path per box
-			logger.debug(f'Loading Cards from {file_path}')
-			try:
-				with open(file_path,'r') as file:
-					all_data = json.load(file)
-				logger.debug(f'File ({file_path}) successfully read for card data.')
-			except (FileNotFoundError, json.JSONDecodeError):
-				logger.error(f'Could not read data for box{i+1}: {str(e)}. Starting with empty list.')
-				all_data = []
-
-			logger.info(f'Attempting to select 50 cards worth of data.')
-			select_data = random.sample(all_data, min(50, len(all_data))) #selecting data for 50 Cards randomly
-			logger.debug(f'{len(select_data)} data for cards selected for box{i+1}')
+		all_data = self.read_cards()
+		boxes = len(box.boxlist)
+		box_indices = [[] for _ in range(boxes)] #positions in all_data of the cards of every box
+		for index, data in enumerate(all_data):
+			box_indices[min(max(data.get('box', 1), 1), boxes) - 1].append(index)
 
+		logger.info(f'Attempting to select 50 cards worth of data per box.')
+		select_indices = set()
+		loaded = []
+		for i, indices in enumerate(box_indices):
+			chosen = random.sample(indices, min(50, len(indices))) #selecting data for 50 Cards randomly
 			try:
-				cards = [Card(data['answer'], data['questions'], data['history'], data['box']) for data in select_data] #card creation
+				cards = [Card(data['answer'], data['questions'], data['history'], i+1, data.get('id'), data.get('tags'),
+					data.get('state'), data.get('log')) for data in map(all_data.__getitem__, chosen)] #card creation
 				logger.debug(f'Created {len(cards)} Card objects for box{i+1}')
 			except Exception as e:
 				logger.error(f'Faield to create Card objects for box{i+1}: {str(e)}')
 				continue
+			select_indices.update(chosen)
+			loaded.append((i, cards))
 
-			remaining_data = [data for data in all_data if data not in select_data] #sorting data that is not selected to ensure no data duplication
-			try:
-				with open(file_path, 'w') as file:
-					json.dump(remaining_data, file, indent=4)
-				logger.debug(f'Updated box {i+1} file with the unselected data')
-			except Exception as e:
-				logger.error(f'Failed to update box {i+1} file after card selection. All data lost: {str(e)}')
-				continue
-			try:
-				box.boxlist[i].extend(cards)
-				logger.debug(f'Box{i+1} successfully extended with newly created Cards')
-			except Exception as e:
-				logger.error(f'Failed to populate box{i+1} attribute with created Cards: {str(e)}')
+		remaining_data = [data for index, data in enumerate(all_data) if index not in select_indices] #sorting data that is not selected to ensure no data duplication
+		try:
+			self.write_cards(remaining_data)
+			logger.debug(f'Updated {self.filename} with the unselected data')
+		except Exception as e:
+			logger.error(f'Failed to update {self.filename} after card selection: {str(e)}')
+			return
 
+		for i, cards in loaded:
+			box.boxlist[i].extend(cards)
 		logger.info(f'Successfully loaded cards for {self.username}')
 
+	@metrics.timed('database.take_cards')
+	@locked
+	def take_cards(self, box:Box, card_ids) -> list:
+		'''
+		Moves the cards with the given ids from the cards file into their boxes of the passed Box
+		(like load_cards, but chosen by id, e.g. the search hits that are not loaded). Returns the new Card objects.
+		'''
+		card_ids = set(card_ids)
+		if not card_ids:
+			return []
+		taken, remaining = [], []
+		for data in self.iter_file():
+			(taken if data.get('id') in card_ids else remaining).append(data)
+		if not taken:
+			return []
+		self.write_cards(remaining)
+
+		boxes = len(box.boxlist)
+		cards = []
+		for data in taken:
+			number = min(max(data.get('box', 1), 1), boxes)
+			card = Card(data['answer'], data['questions'], data['history'], number, data.get('id'), data.get('tags'),
+				data.get('state'), data.get('log'))
+			box.boxlist[number - 1].append(card)
+			cards.append(card)
+		logger.debug(f'Took {len(cards)} cards of {self.username} out of {self.filename}')
+		return cards
+
+	def cards_path(self) -> str:
+		return os.path.join(self.basepath, self.username, self.filename)
+
+	def cards_stamp(self):
+		#[file name, mtime, size] of the cards file (None if missing), saved in the indexes to detect stale ones
+		try:
+			stat = os.stat(self.cards_path())
+		except FileNotFoundError:
+			return None
+		return [self.filename, stat.st_mtime_ns, stat.st_size]
+
+	def before_cards_write(self):
+		#Keeps the stamp of the cards file as it was found, the indexes are checked against it
+		if not self.wrote_cards:
+			self.found_stamp = self.cards_stamp()
+			self.wrote_cards = True
+
+	def iter_file(self):
+		#Streams the card data stored in the cards file (nothing if it can not be read)
+		try:
+			yield from self.storage.iter(self.cards_path())
+		except (FileNotFoundError, ValueError) as e:
+			logger.warning(f'Could not read data from {self.filename}: {str(e)}')
+
+	@metrics.timed('database.read_cards')
+	def read_cards(self) -> list:
+		#Returns the card data stored in the cards file (empty list if it can not be read)
+		try:
+			return self.storage.read(self.cards_path())
+		except (FileNotFoundError, ValueError) as e:
+			logger.warning(f'Could not read data from {self.filename}: {str(e)}')
+			return []
+
+	@metrics.timed('database.write_cards')
+	@locked
+	def write_cards(self, all_data):
+		#Replaces the card data stored in the cards file, all_data can be any iterable of card data
+		self.before_cards_write()
+		self.storage.write(self.cards_path(), all_data)
+		self.version += 1
+
+	@metrics.timed('database.append_cards')
+	@locked
+	def append_cards(self, new_data:list, encoded:bool=False):
+		'''
+		Appends card data to the cards file without reading the cards already in it
+		(for json files the closing bracket of the list is overwritten with the new cards, one per line).
+		Falls back to reading and rewriting the file if it can not be appended to.
+		With encoded=True new_data holds the cards already encoded by self.storage.encode().
+		'''
+		if not new_data:
+			return
+		lines = new_data if encoded else [self.storage.encode(data) for data in new_data]
+
+		self.before_cards_write()
+		try:
+			if self.storage.append(self.cards_path(), lines):
+				self.version += 1
+				logger.debug(f'Appended {len(new_data)} cards to {self.filename}')
+				return
+		except FileNotFoundError:
+			pass
+
+		logger.warning(f'{self.filename} can not be appended to, rewriting it')
+		all_data = self.read_cards()
+		all_data.extend(self.storage.decode(line) for line in lines)
+		self.write_cards(all_data)
+
+	def get_search_index(self, box:Box=None) -> SearchIndex:
+		'''
+		Returns the search index of the user and attaches it to the passed Box.
+		It is read from search_index.json, or built from the cards in the cards file and the cards
+		currently loaded in the passed Box object if the file does not exist yet.
+		'''
+		self.open_indexes(box)
+		return self.search_index
+
+	def get_hash_index(self, box:Box=None) -> HashIndex:
+		'''
+		Returns the content hash index of the user and attaches it to the passed Box, like get_search_index.
+		'''
+		self.open_indexes(box)
+		return self.hash_index
+
+	@locked
+	def open_indexes(self, box:Box=None):
+		'''
+		Loads the search and hash indexes from their files. 
+		The ones that do not exist yet, or are stale (saved for another state of the cards file, e.g. after a manual
+		edit or by an older version), are built together in one pass over the cards file and the passed Box.
+		'''
+		user_path = os.path.join(self.basepath, self.username)
+		found = self.found_stamp if self.wrote_cards else self.cards_stamp()
+		def load(index_class, filename):
+			index = index_class.load(os.path.join(user_path, filename))
+			if index is not None and index.stamp != found:
+				logger.info(f'{filename} of {self.username} does not match the cards file, rebuilding it')
+				return None
+			return index
+
+		if self.search_index is None:
+			self.search_index = load(SearchIndex, 'search_index.json')
+			build_search = self.search_index is None
+			if build_search:
+				self.search_index = SearchIndex(os.path.join(user_path, 'search_index.json'))
+		else:
+			build_search = False
+		if self.hash_index is None:
+			self.hash_index = load(HashIndex, 'hash_index.json')
+			build_hash = self.hash_index is None
+			if build_hash:
+				self.hash_index = HashIndex(os.path.join(user_path, 'hash_index.json'))
+		else:
+			build_hash = False
+
+		if build_search or build_hash:
+			logger.info(f'Building card indexes for {self.username}')
+			indexes = [index for index, build in [(self.search_index, build_search), (self.hash_index, build_hash)] if build]
+			all_data = self.read_cards()
+			missing_ids = False
+			for data in all_data:
+				if 'id' not in data:		#cards saved before cards had ids
+					data['id'] = Card(data['answer'], data['questions']).id
+					missing_ids = True
+				for index in indexes:
+					index.add(data['id'], data['answer'], data['questions'])
+
+			if missing_ids:					#storing the new ids so the indexes stay valid
+				self.write_cards(all_data)
+				logger.debug(f'Assigned card ids in {self.filename}')
+
+			if box is not None:
+				for individual_box in box.boxlist:
+					for card in individual_box:
+						for index in indexes:
+							index.add_card(card)
+			self.save_search_index()
+
+		if box is not None:
+			box.search_index = self.search_index
+			box.hash_index = self.hash_index
+
+	def save_search_index(self):
+		#Saves the card indexes if they changed, stamped with the cards file they now match
+		stamp = self.cards_stamp()
+		for index in (self.search_index, self.hash_index):
+			if index is None:
+				continue
+			if index.stamp != stamp:
+				index.stamp = stamp
+				index.dirty = True
+			index.save()
+
+	@metrics.timed('database.dedup_cards')
+	@locked
+	def dedup_cards(self, box:Box=None) -> int:
+		'''
+		Removes duplicate cards of the user in one linear pass over the cards file and the passed Box.
+		Boxes are visited from the highest, so the copy with the most progress is kept. 
+		Question types missing in the kept card are merged in from its duplicates.
+		Rebuilds the hash index and returns the number of removed cards.
+		'''
+		logger.info(f'Removing duplicate cards for {self.username}')
+		self.open_indexes(box)
+		kept = {}						#content hash -> (True for cards in the file, Card or data dict)
+		changed = False					#the cards file has to be written again
+		removed = 0
+
+		def keep(key, card_id, questions) -> bool:
+			#True if this is the first card with the content, else merges its questions into the kept one
+			nonlocal removed, changed
+			if key not in kept:
+				return True
+			in_file, first = kept[key]
+			if isinstance(first, Card):
+				merged = merge_card_data({'questions': first.questions}, {'questions': questions})['questions']
+				if merged != first.questions:
+					first.questions = merged
+					self.search_index.add(first.id, first.answer, merged) 	#searchable by the merged question
+			else:
+				before = first['questions']
+				if merge_card_data(first, {'questions': questions})['questions'] != before:
+					self.search_index.add(first['id'], first['answer'], first['questions'])
+					changed = True
+			self.search_index.remove(card_id)
+			removed += 1
+			return False
+
+		all_data = self.read_cards()
+		boxes = max([self.boxes, len(box.boxlist) if box is not None else 0] + [data.get('box', 1) for data in all_data])
+		file_boxes = [[] for _ in range(boxes)] 	#positions in all_data of the cards of every box
+		for index, data in enumerate(all_data):
+			file_boxes[max(data.get('box', 1), 1) - 1].append(index)
+		duplicates = set()
+
+		for i in range(boxes - 1, -1, -1):
+			#cards loaded in the session are visited first, they are the ones the user sees
+			if box is not None and i < len(box.boxlist):
+				unique_cards = []
+				for card in box.boxlist[i]:
+					key = content_hash(card.answer, card.questions)
+					if keep(key, card.id, card.questions):
+						kept[key] = (False, card)
+						unique_cards.append(card)
+				box.boxlist[i][:] = unique_cards
+
+			for index in file_boxes[i]:
+				data = all_data[index]
+				key = content_hash(data['answer'], data['questions'])
+				if keep(key, data['id'], data['questions']):
+					kept[key] = (True, data)
+				else:
+					duplicates.add(index)
+
+		if duplicates or changed:
+			self.write_cards(data for index, data in enumerate(all_data) if index not in duplicates)
+
+		self.hash_index = HashIndex(self.hash_index.path)	#rebuilt from the kept cards
+		for key, (in_file, first) in kept.items():
+			card_id = first.id if isinstance(first, Card) else first['id']
+			self.hash_index.by_id[card_id] = key
+			self.hash_index.by_hash[key] = {card_id}
+		self.hash_index.dirty = True
+		if box is not None:
+			box.hash_index = self.hash_index
+		self.save_search_index()
+
+		logger.info(f'Removed {removed} duplicate cards for {self.username}')
+		return removed
+
+	def iter_cards(self, box:Box=None):
+		'''
+		Yields the data (as in Card.to_dict) of every card of the user.
+		The cards loaded in the passed Box come first, box by box, then the cards of the cards file, which is streamed.
+		The file may change while iterating, iterate over a snapshot() for a consistent view.
+		'''
+		if box is not None:
+			yield from box_data(box)
+		yield from self.iter_file()
+
+	@metrics.timed('database.snapshot')
+	@locked
+	def snapshot(self, box:Box=None, path:str=None):
+		'''
+		Copies the cards file, the deck configuration and the user data into path (a new temporary directory if None)
+		while holding the lock, so no save, load, import or dedup is halfway through (importer.import_file holds the
+		lock for the whole import, not only per batch).
+		The cards loaded in the passed Box are added to the copy.
+		Returns a Snapshot of the copy, reading it does not block the app.
+		'''
+		path = tempfile.mkdtemp(prefix=f'{self.username}-snapshot-') if path is None else path
+		os.makedirs(path, exist_ok=True)
+		user_path = os.path.join(self.basepath, self.username)
+		defaults = {self.filename: [], DECK_FILE: {'boxes': self.boxes}, f'{self.username}.json': {}}
+		for filename, default in defaults.items():
+			source = os.path.join(user_path, filename)
+			if os.path.exists(source):
+				shutil.copyfile(source, os.path.join(path, filename))
+			elif filename == self.filename:
+				self.storage.write(os.path.join(path, filename), default)
+			else:
+				write_json(os.path.join(path, filename), default)
+
+		if box is not None:
+			new_data = box_data(box)
+			cards_path = os.path.join(path, self.filename)
+			if new_data and not self.storage.append(cards_path, [self.storage.encode(data) for data in new_data]):
+				self.storage.write(cards_path, self.storage.read(cards_path) + new_data)
+		logger.info(f'Snapshot of {self.username} taken in {path}')
+		return Snapshot(self.username, path, self.storage)
+
+	@locked
+	def convert_storage(self, name:str):
+		'''
+		Rewrites the cards file in the storage format name ('json', 'gzip' or 'lzma') and deletes the old file.
+		The cards are streamed from the old file into the new one.
+		'''
+		storage = get_storage(name)
+		if storage.extension == self.storage.extension:
+			return
+
+		user_path = os.path.join(self.basepath, self.username)
+		filename = CARDS_FILE + storage.extension
+		self.before_cards_write()
+		storage.write(os.path.join(user_path, filename), self.iter_file())
+		if os.path.exists(self.cards_path()):
+			os.remove(self.cards_path())
+
+		logger.info(f'Cards of {self.username} converted from {self.storage.name} to {storage.name}')
+		self.storage = storage
+		self.filename = filename
+		self.version += 1
+
+	def disk_usage(self) -> int:
+		#Bytes used by the cards file
+		return os.path.getsize(self.cards_path()) if os.path.exists(self.cards_path()) else 0
+
+class Snapshot:
+	'''
+	Point-in-time copy of a user's cards, deck configuration and user data made by Database.snapshot().
+	Read with the same iter_cards() and load_userdata() as a Database, so exporters work on either.
+	Removes its directory on close() (or at the end of a with block).
+	'''
+	def __init__(self, username:str, path:str, storage):
+		self.username = username
+		self.path = path
+		self.storage = storage
+		self.filenames = [CARDS_FILE + storage.extension, DECK_FILE] 	#files of the deck, besides the user data
+
+	def iter_cards(self):
+		yield from self.storage.iter(os.path.join(self.path, self.filenames[0]))
+
+	def load_userdata(self) -> dict:
+		with open(os.path.join(self.path, f'{self.username}.json'), 'r') as file:
+			return json.load(file)
 
+	def close(self):
+		shutil.rmtree(self.path, ignore_errors=True)
 
+	def __enter__(self):
+		return self
 
+	def __exit__(self, *exc_info):
+		self.close()
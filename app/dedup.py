@@ -0,0 +1,129 @@
+#! python3
+# dedup.py - Duplicate card detection with a content hash index.
+#				Two cards are duplicates if their casefolded, whitespace-normalized answer and questions are equal
+#				(the order of MCQ options does not matter).
+
+import hashlib, json, os
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+def normalize(text) -> str:
+	if text is None:
+		return ''
+	return ' '.join(str(text).casefold().split())
+
+def content_hash(answer, questions) -> str:
+	'''
+	Normalized content hash of a card, takes the answer and questions of a Card (or of its dict).
+	'''
+	input_question = normalize(questions[0]) if len(questions) > 0 else ''
+	mcq = questions[1] if len(questions) > 1 and questions[1] is not None else ''
+	mcq_parts = [normalize(part) for part in mcq.split(',')]
+	mcq_key = mcq_parts[0] + '\x1e' + '\x1e'.join(sorted(mcq_parts[1:]))		#options in any order
+
+	content = '\x1f'.join([normalize(answer), input_question, mcq_key])
+	return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+def merge_card_data(kept:dict, duplicate:dict) -> dict:
+	'''
+	Merges the data of a duplicate card into the card that is kept.
+	Question types missing in the kept card are taken from the duplicate. The kept card keeps its id, box and history.
+	'''
+	questions = list(kept['questions'])
+	for i, question in enumerate(duplicate['questions']):
+		if i < len(questions) and questions[i] is None and question is not None:
+			questions[i] = question
+	kept['questions'] = questions
+	return kept
+
+class HashIndex:
+	'''
+	Index of the content hashes of all cards of one user, for O(1) duplicate checks on add, edit and import.
+	Persisted as a json file of card id -> hash; the reverse map is rebuilt on load.
+
+	Args:
+		path:	json file the index is saved to (None for an in-memory index)
+	'''
+	def __init__(self, path:str=None):
+		self.path = path
+		self.by_id = {}			#card id -> content hash
+		self.by_hash = {}		#content hash -> set of the ids of the cards with it (duplicates included)
+		self.dirty = False
+		self.stamp = None 		#Database.cards_stamp() of the cards file the index matches
+
+	def __len__(self):
+		return len(self.by_id)
+
+	def find(self, answer, questions):
+		#Id of a card with the same content, None if there is none
+		card_ids = self.by_hash.get(content_hash(answer, questions))
+		return next(iter(card_ids)) if card_ids else None
+
+	def is_duplicate(self, answer, questions, card_id=None) -> bool:
+		#True if another card than card_id has the same content
+		card_ids = self.by_hash.get(content_hash(answer, questions), ())
+		return len(card_ids) > (card_id in card_ids)
+
+	def add(self, card_id, answer, questions):
+		#Adds or replaces the hash of a card. Returns False if another card already has this content
+		return self.add_hash(card_id, content_hash(answer, questions))
+
+	def add_hash(self, card_id, key):
+		#add() with an already computed content hash
+		self.remove(card_id)
+		self.by_id[card_id] = key
+		self.dirty = True
+		card_ids = self.by_hash.setdefault(key, set())
+		card_ids.add(card_id)
+		return len(card_ids) == 1
+
+	def remove(self, card_id):
+		#Drops the hash of a card, its content stays known while a duplicate of it is left
+		key = self.by_id.pop(card_id, None)
+		if key is None:
+			return
+		card_ids = self.by_hash[key]
+		card_ids.discard(card_id)
+		if not card_ids:
+			del self.by_hash[key]
+		self.dirty = True
+
+	def add_card(self, card):
+		return self.add(card.id, card.answer, card.questions)
+
+	def update_card(self, card):
+		return self.add(card.id, card.answer, card.questions)
+
+	def remove_card(self, card):
+		self.remove(card.id)
+
+	def save(self):
+		#Writes the index to its file if it changed
+		if self.path is None or not self.dirty:
+			return
+
+		temp_path = self.path + '.tmp'
+		with open(temp_path, 'w') as file:
+			file.write(json.dumps({'version': 1, 'hashes': self.by_id, 'cards': self.stamp}))	#one encoder call, much faster than json.dump
+		os.replace(temp_path, self.path)
+		self.dirty = False
+		logger.debug(f'Hash index with {len(self.by_id)} cards saved to {self.path}')
+
+	@classmethod
+	def load(cls, path:str):
+		'''
+		Reads an index saved by save(). Returns None if the file is missing or unreadable.
+		'''
+		try:
+			with open(path, 'r') as file:
+				data = json.load(file)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return None
+
+		index = cls(path)
+		index.stamp = data.get('cards') 	#None for indexes saved before the stamp
+		index.by_id = data['hashes']
+		for card_id, key in index.by_id.items():
+			index.by_hash.setdefault(key, set()).add(card_id)
+		return index
@@ -0,0 +1,136 @@
+#! python3
+# export.py - Streaming export and backups of a user's whole deck.
+#				Cards are streamed from a Database or a Snapshot one at a time, so memory use does not
+#				depend on the size of the deck. Exports are always made from a snapshot when the app is running.
+#
+# Formats:	csv		cards only, in the columns read by the importer (question, answer, mcq question, mcq options, tags)
+#					followed by box and id
+#			jsonl	one json object per line: first {"username", "userdata"}, then one line per card
+#			tar.gz	archive of the cards file, the deck configuration and the user data as they are stored in data/<user>/, plus a manifest
+#
+# Usage: python -m app.export USERNAME FILE [--format csv|jsonl|tar.gz]
+
+import csv, io, json, os, tarfile, time
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+BACKUP_DIR = 'backups' 		#directory inside data/<user>/ that holds the backups
+KEEP_BACKUPS = 5 			#newest backups kept by backup()
+CSV_COLUMNS = ['question', 'answer', 'mcq question', 'mcq options', 'tags', 'box', 'id']
+
+def detect_format(path) -> str:
+	#Format of the export from the file name
+	name = path.lower()
+	if name.endswith('.csv'):
+		return 'csv'
+	elif name.endswith('.jsonl'):
+		return 'jsonl'
+	elif name.endswith(('.tar.gz', '.tgz')):
+		return 'tar.gz'
+	raise ValueError(f'Unknown export format for {path}, use csv, jsonl or tar.gz.')
+
+def csv_row(card:dict) -> list:
+	#Card data as a row of the csv export, the mcq question is split into its prompt and options
+	input_question, mcq = (card['questions'] + [None, None])[:2]
+	mcq_question, _, mcq_options = (mcq or '').partition(',')
+	return [input_question or '', card['answer'], mcq_question, mcq_options, ' '.join(card.get('tags', [])),
+		card['box'], card.get('id', '')]
+
+def write_csv(source, file) -> int:
+	writer = csv.writer(file)
+	writer.writerow(CSV_COLUMNS)
+	count = 0
+	for card in source.iter_cards():
+		writer.writerow(csv_row(card))
+		count += 1
+	return count
+
+def write_jsonl(source, file) -> int:
+	file.write(json.dumps({'username': source.username, 'userdata': source.load_userdata()}) + '\n')
+	count = 0
+	for card in source.iter_cards():
+		file.write(json.dumps(card) + '\n')
+		count += 1
+	return count
+
+def write_archive(snapshot, path) -> int:
+	'''
+	Writes the files of the snapshot into a gzip compressed tar archive, streamed file by file.
+	Extracting the archive into data/ restores the user.
+	'''
+	count = sum(1 for card in snapshot.iter_cards())
+	manifest = json.dumps({'username': snapshot.username, 'cards': count, 'created': time.time(), 'version': 1}).encode()
+	with tarfile.open(path, 'w:gz') as archive:
+		for filename in snapshot.filenames + [f'{snapshot.username}.json']:
+			archive.add(os.path.join(snapshot.path, filename), arcname=f'{snapshot.username}/{filename}')
+		info = tarfile.TarInfo('manifest.json')
+		info.size = len(manifest)
+		info.mtime = int(time.time())
+		archive.addfile(info, io.BytesIO(manifest))
+	return count
+
+def export_deck(database, path, fmt=None, box=None) -> int:
+	'''
+	Exports all cards of the user (and for jsonl and tar.gz the user data) to path.
+	A snapshot is taken first, so the export is consistent even while the app keeps saving or importing.
+	The file is written next to path and moved in place at the end, nothing is left behind if the export fails.
+	Returns the number of exported cards.
+
+	Args:
+		database:	Database of the user
+		path:		file to write
+		fmt:		'csv', 'jsonl' or 'tar.gz' (detected from the file name if None)
+		box:		Box of the running session, its loaded cards are exported too
+	'''
+	fmt = detect_format(path) if fmt is None else fmt
+	temp_path = path + '.tmp'
+	try:
+		with database.snapshot(box) as snapshot:
+			if fmt == 'tar.gz':
+				count = write_archive(snapshot, temp_path)
+			else:
+				with open(temp_path, 'w', newline='', encoding='utf-8') as file:
+					count = write_csv(snapshot, file) if fmt == 'csv' else write_jsonl(snapshot, file)
+		os.replace(temp_path, path)
+	except Exception:
+		if os.path.exists(temp_path): 		#no half written export is left next to path
+			os.remove(temp_path)
+		raise
+	logger.info(f'Exported {count} cards of {database.username} to {path}')
+	return count
+
+def backup(database, box=None, keep=KEEP_BACKUPS) -> str:
+	'''
+	Writes a tar.gz backup of the user into data/<user>/backups/ and deletes all but the newest keep backups.
+	Returns the path of the new backup.
+	'''
+	backup_dir = os.path.join(database.basepath, database.username, BACKUP_DIR)
+	os.makedirs(backup_dir, exist_ok=True)
+	path = os.path.join(backup_dir, time.strftime('%Y%m%d-%H%M%S') + '.tar.gz')
+	export_deck(database, path, 'tar.gz', box)
+
+	backups = sorted(name for name in os.listdir(backup_dir) if name.endswith('.tar.gz'))
+	for name in backups[:-keep]:
+		os.remove(os.path.join(backup_dir, name))
+	return path
+
+def main(argv=None):
+	'''
+	Command line entry point. The export is taken from a snapshot, so it can run while the app is open.
+	'''
+	import argparse
+	from app.database import Database
+
+	parser = argparse.ArgumentParser(description='Export all cards of a Leitner BoB user.')
+	parser.add_argument('username')
+	parser.add_argument('path')
+	parser.add_argument('--format', choices=['csv', 'jsonl', 'tar.gz'])
+	args = parser.parse_args(argv)
+
+	count = export_deck(Database(args.username), args.path, args.format)
+	print(f'{count} cards exported to {args.path}')
+	return 0
+
+if __name__ == '__main__':
+	raise SystemExit(main())
@@ -1,11 +1,12 @@
 #! python3
 # flashcard.py - Holds the logic and simple GUI for Flashcard implementation of Card objects
 
-import random
+import time
 import app.logic as logic
+import app.grading as grading
 from tkinter import *
 from tkinter import messagebox
-import re
+import app.metrics as metrics
 
 from app.app_logging import get_logger
 logger = get_logger(__name__)
@@ -37,6 +38,7 @@ class FlashCard:
 		logger.debug('Starting the quiz, asking the first question')
 		self.run_card(self.session_cards[self.curr_question]) #Does the quizzing with the selected cards
 
+	@metrics.timed('tk.flashcard.run_card')
 	def run_card(self, card):
 		'''
 		Handles the actual quiz mechanism for the app. 
@@ -98,6 +100,8 @@ class FlashCard:
 		Button(self.root, text='End session', font=('Ariel', 12, 'bold'),
 			command=self.exit_session).place(x=760,y=10)
 
+		self.shown_at = time.perf_counter() 	#the response time of the answer counts from here
+
 	def exit_session(self): #End the flashcard quiz by destroying the root panel
 		logger.info('Session ended before answering all questions')
 		self.root.destroy()
@@ -122,6 +126,8 @@ class FlashCard:
 			card:				the card whose question is currently being answered
 		'''
 
+		latency = time.perf_counter() - self.shown_at 	#before the answer message boxes
+
 		#Two different question types gives two different method to get user answer
 		try:
 			if hasattr(self, 'answer_box') and self.answer_box.winfo_exists(): #Input type question answer
@@ -132,14 +138,15 @@ class FlashCard:
 
 			#Checking if user answer the question correctly
 			result = self.is_correct(user_answer, card.get_answer())
+			metrics.count('flashcard.correct' if result else 'flashcard.incorrect')
 
 			if result:											#correct answer
 				messagebox.showinfo('Info', 'Your answer is correct.', parent=self.root)
 				self.correct_answers += 1
-				card.session_result(True) #Updating card history
+				card.session_result(True, latency) #Updating card history
 			else:												#Incorrect answer
 				messagebox.showerror('Error', 'Your answer is incorrect.', parent=self.root)
-				card.session_result(False) #Updating card history
+				card.session_result(False, latency) #Updating card history
 
 			self.curr_question += 1 		#Moving to next question
 			if self.curr_question < self.num:							#Question left to be asked
@@ -154,53 +161,9 @@ class FlashCard:
 			messagebox.showerror('Error', 'Please enter a valid answer.', parent=self.root)
 
 
-	def format_question(self, card):
-		'''
-		Unpacks the question form card object. 
-		Ensures random question type. If random question type does not exist, return the present question. 
-		Returns question, answer and options (which is None if input type question)
-		'''
-
-		answer = card.get_answer()
-		mcq_options = None 
-
-		question_type = [0,1]
-		random.shuffle(question_type)
-
-		question = card.get_question(question_type[0])
-		q_type = question_type[0]
-
-		if question == None:
-			question = card.get_question(question_type[1])
-			q_type = question_type[1]
-
-		if q_type == 1:
-			mcq_all = question.split(',')
-			question = mcq_all[0]
-			mcq_options = [answer, mcq_all[1], mcq_all[2], mcq_all[3]]
-			random.shuffle(mcq_options)
-
-		return question, answer, mcq_options
+	format_question = staticmethod(grading.format_question) 	#(question, answer, options) of a card, see grading.py
 
 	def get_stat(self):  				#User stat for total questions correct 
 		return self.correct_answers
 
-	def is_correct(self, user_input, correct_answer):
-		answer = correct_answer.strip().lower()
-		userinput = user_input.strip().lower()
-
-		#splitting the correct answer 
-		correct_cases = re.split(r'[,\s\-\.:;]', answer)
-
-		#creating regex pattern using the split parts of answer to match to user input 
-		pattern = ''.join(f'(?=.*{re.escape(case)})' for case in correct_cases)
-		full_pattern = f'^{pattern}.*$'
-
-		#matching the userinput against pattern
-		match = re.match(full_pattern, userinput, flags=re.IGNORECASE)
-
-		if match:
-			return True 	#correct answer
-		else:
-			return False 	#incorrect answer
-			
\ No newline at end of file
+	is_correct = staticmethod(grading.is_correct) 	#True if the user's answer matches the answer, see grading.py
@@ -0,0 +1,156 @@
+#! python3
+# forecast.py - Workload forecast: the number of cards coming due on each of the next 30 to 90 days.
+#				The cards are counted into a (boxes x days until due) histogram, which is then projected day by day:
+#				the cards due on a day are answered, move up a box with probability RECALL (or back to box 1)
+#				and come due again after the review interval of their new box. Every step is a numpy operation on
+#				the histogram, so the projection does not depend on the number of cards.
+#				Leitner cards have no due day, a box is reviewed once per interval, so its cards are spread evenly
+#				over the interval. sm2 and fsrs cards are due on the day of their state, cards new to them are spread like Leitner cards.
+
+import math
+from itertools import chain, islice, repeat
+from operator import attrgetter
+
+import numpy as np
+
+from app.models import Box
+from app.scheduling import SM2Scheduler, FSRSScheduler, box_intervals, gc_paused
+import app.metrics as metrics
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+HORIZON = 30 			#days forecast by default
+MAX_HORIZON = 90
+RECALL = 0.85 			#probability that a due card is answered right and moves up a box
+SESSION_SIZES = [10, 20, 50, 100] 	#session sizes offered in the work frame
+CHUNK = 65536 			#cards read from the cards file at once
+
+def review_intervals(boxes:int) -> np.ndarray:
+	'''
+	Days between two reviews of a card in every box: box 1 every day, box k after the interval that
+	moves a card up into box k+1 (scheduling.box_intervals), the last box after one more step of the same ratio.
+	'''
+	thresholds = list(box_intervals(boxes))
+	ratio = thresholds[-1]/thresholds[-2] if len(thresholds) > 1 else 3
+	intervals = [1] + thresholds[1:] + [thresholds[-1]*ratio]
+	return np.maximum(1, np.rint(intervals)).astype(np.intp)
+
+def due_days(card_states:list, name:str) -> np.ndarray:
+	#Day number on which every card is due for the sm2 or fsrs scheduler, nan for cards new to it
+	nan = math.nan
+	if name == SM2Scheduler.name:
+		days = [state[4] if state is not None and state[0] == name else nan for state in card_states]
+	elif name == FSRSScheduler.name: 	#retrievability drops to the target retention after stability days
+		days = [state[3] + state[1] if state is not None and state[0] == name else nan for state in card_states]
+	else:
+		days = []
+	return np.fromiter(days, float, len(days)) if days else np.full(len(card_states), nan)
+
+def histogram(box_counts:np.ndarray, boxes:np.ndarray, due:np.ndarray, intervals:np.ndarray, width:int, now:float) -> np.ndarray:
+	'''
+	(boxes x width) cards per box and days until due. box_counts are cards without a due day, spread evenly over
+	the interval of their box. boxes and due are the box and due day of the other cards (overdue cards are due today,
+	cards due after width days are left out).
+	'''
+	counts = np.zeros((len(intervals), width))
+	for box, (count, interval) in enumerate(zip(box_counts, intervals)):
+		counts[box, :min(interval, width)] += count/interval
+	if len(due):
+		offsets = np.maximum(np.floor(due - math.floor(now)), 0).astype(np.intp)
+		inside = offsets < width
+		np.add.at(counts, (boxes[inside] - 1, offsets[inside]), 1)
+	return counts
+
+def project(counts:np.ndarray, intervals:np.ndarray, days:int, recall=RECALL, new_cards:float=0) -> np.ndarray:
+	'''
+	Projects the histogram days days ahead. Returns the (days x boxes) expected number of cards due per day and box.
+	recall is the probability of a right answer, one for all boxes or one per box. new_cards are added to box 1 every day.
+	'''
+	counts = np.pad(counts, ((0, 0), (0, max(0, int(intervals.max()) - counts.shape[1])))) 	#a copy, wide enough for every interval
+	boxes = len(intervals)
+	recall = np.broadcast_to(np.asarray(recall, float), (boxes,))
+	up = np.minimum(np.arange(1, boxes + 1), boxes - 1) 		#box a right answer moves a card to
+	due = np.zeros((days, boxes))
+	for day in range(days):
+		today_due = counts[:, 0].copy()
+		today_due[0] += new_cards
+		due[day] = today_due
+		counts[:, :-1] = counts[:, 1:]
+		counts[:, -1] = 0
+		recalled = today_due*recall
+		np.add.at(counts, (up, intervals[up] - 1), recalled)
+		counts[0, intervals[0] - 1] += (today_due - recalled).sum()
+	return due
+
+def suggested_session(due:np.ndarray, days:int=7) -> int:
+	#Largest session size of the work frame that the cards due per day (days, or days x boxes) in the next days fill
+	mean = due[:days].sum()/min(days, len(due)) if len(due) else 0
+	return max([size for size in SESSION_SIZES if size <= mean] or [SESSION_SIZES[0]])
+
+class WorkloadForecast:
+	'''
+	Forecast of a user's cards: the cards file of the Database and the cards loaded in the Box. The boxes and due days of the cards file
+	are read again only after the Database wrote the file (Database.version), the loaded cards are counted on
+	every call, so the forecast after a session costs a pass over the loaded cards and the projection.
+	'''
+	def __init__(self, database, box:Box):
+		self.database = database
+		self.box = box
+		self.file_key = None
+		self.file_cards = None 		#(cards per box without a due day, boxes, due days) of the cards file
+
+	def read_file(self, name:str, boxes:int) -> tuple:
+		box_counts = np.zeros(boxes)
+		box_parts, due_parts = [], []
+		iterator = iter(self.database.iter_file())
+		with gc_paused():
+			while True:
+				chunk = list(islice(iterator, CHUNK))
+				if not chunk:
+					break
+				card_boxes = np.clip(np.fromiter(map(dict.get, chunk, repeat('box'), repeat(1)), np.intp, len(chunk)), 1, boxes)
+				if name in (SM2Scheduler.name, FSRSScheduler.name):
+					due = due_days(list(map(dict.get, chunk, repeat('state'))), name)
+					dated = ~np.isnan(due)
+					box_parts.append(card_boxes[dated])
+					due_parts.append(due[dated])
+					card_boxes = card_boxes[~dated]
+				box_counts += np.bincount(card_boxes - 1, minlength=boxes)
+		return (box_counts, np.concatenate(box_parts or [np.zeros(0, np.intp)]),
+			np.concatenate(due_parts or [np.zeros(0)]))
+
+	def read_box(self, name:str) -> tuple:
+		box_counts = np.array([len(individual_box) for individual_box in self.box.boxlist], float)
+		if name not in (SM2Scheduler.name, FSRSScheduler.name):
+			return box_counts, np.zeros(0, np.intp), np.zeros(0)
+		cards = list(chain.from_iterable(self.box.boxlist))
+		with gc_paused():
+			due = due_days(list(map(attrgetter('state'), cards)), name)
+		card_boxes = np.repeat(np.arange(1, len(box_counts) + 1), box_counts.astype(np.intp))
+		dated = ~np.isnan(due)
+		box_counts -= np.bincount(card_boxes[dated] - 1, minlength=len(box_counts))
+		return box_counts, card_boxes[dated], due[dated]
+
+	@metrics.timed('forecast.get')
+	def get(self, scheduler, days:int=HORIZON) -> np.ndarray:
+		'''
+		(days x boxes) expected number of cards due on each of the next days (1 - MAX_HORIZON), today first,
+		with the algorithm and the clock of the scheduler (scheduling.Scheduler).
+		'''
+		if not 1 <= days <= MAX_HORIZON:
+			raise ValueError(f'The forecast covers 1 to {MAX_HORIZON} days, not {days}')
+		name = scheduler.name
+		boxes = len(self.box.boxlist)
+		key = (self.database.version, name, boxes)
+		if key != self.file_key:
+			self.file_cards = self.read_file(name, boxes)
+			self.file_key = key
+
+		intervals = review_intervals(boxes)
+		box_counts, card_boxes, due = self.read_box(name)
+		file_counts, file_boxes, file_due = self.file_cards
+		width = days + 1 			#cards due later do not come due in the forecast
+		counts = histogram(box_counts + file_counts, np.concatenate([card_boxes, file_boxes]),
+			np.concatenate([due, file_due]), intervals, width, scheduler.clock())
+		return project(counts, intervals, days)
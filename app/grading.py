@@ -0,0 +1,54 @@
+#! python3
+# grading.py - Asking and grading a card, without any GUI: used by the flashcard window (flashcard.py)
+#				and by the study service (server.py).
+
+import random, re
+import app.metrics as metrics
+
+def format_question(card):
+	'''
+	Unpacks the question form card object.
+	Ensures random question type. If random question type does not exist, return the present question.
+	Returns question, answer and options (which is None if input type question)
+	'''
+
+	answer = card.get_answer()
+	mcq_options = None
+
+	question_type = [0,1]
+	random.shuffle(question_type)
+
+	question = card.get_question(question_type[0])
+	q_type = question_type[0]
+
+	if question == None:
+		question = card.get_question(question_type[1])
+		q_type = question_type[1]
+
+	if q_type == 1:
+		mcq_all = question.split(',')
+		question = mcq_all[0]
+		mcq_options = [answer, mcq_all[1], mcq_all[2], mcq_all[3]]
+		random.shuffle(mcq_options)
+
+	return question, answer, mcq_options
+
+@metrics.timed('flashcard.is_correct')
+def is_correct(user_input, correct_answer):
+	answer = correct_answer.strip().lower()
+	userinput = user_input.strip().lower()
+
+	#splitting the correct answer
+	correct_cases = re.split(r'[,\s\-\.:;]', answer)
+
+	#creating regex pattern using the split parts of answer to match to user input
+	pattern = ''.join(f'(?=.*{re.escape(case)})' for case in correct_cases)
+	full_pattern = f'^{pattern}.*$'
+
+	#matching the userinput against pattern
+	match = re.match(full_pattern, userinput, flags=re.IGNORECASE)
+
+	if match:
+		return True 	#correct answer
+	else:
+		return False 	#incorrect answer
@@ -5,9 +5,12 @@ import matplotlib.pyplot as plt
 import numpy as np 
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
+import app.metrics as metrics
+
 from app.app_logging import get_logger
 logger = get_logger(__name__)
 
+@metrics.timed('graph.create_graphframe')
 def create_graphframe(root, userdata):
 	'''
 	Handles all the GUI application of the graphframe. 
@@ -53,4 +56,68 @@ def create_graphframe(root, userdata):
 	canvas.draw()
 	canvas.get_tk_widget().pack(fill='both', expand=True)
 
-	return canvas #Return the canvas so it can be updated later
\ No newline at end of file
+	return canvas #Return the canvas so it can be updated later
+
+@metrics.timed('graph.create_retention_graph')
+def create_retention_graph(root, analysis):
+	'''
+	Displays the fitted retention curves (analytics.py) of the deck and of the boxes with answers,
+	and the observed recall rates of the deck as points.
+
+	Args:
+		analysis: analytics.Analysis of the user's cards
+	'''
+	logger.info('Creating the retention graph')
+	streaks = np.arange(len(analysis.curve()))
+	fig, ax = plt.subplots(figsize=(6, 2.8))
+
+	ax.plot(streaks, analysis.curve()*100, linewidth=4, color='#4CAF50', label='Deck')
+	ax.plot(streaks, analysis.retention()*100, marker='o', linestyle='', color='#4CAF50', markersize=6)
+	for box in range(1, analysis.box_count + 1):
+		if analysis.trials[box-1].sum():
+			ax.plot(streaks, analysis.curve(box)*100, linewidth=1.5, linestyle='--', label=f'Box {box}')
+
+	ax.set_title('Recall after correct answers in a row', fontsize=10, fontweight='bold')
+	ax.set_xlabel('Correct answers in a row', fontsize=9)
+	ax.set_ylabel('Recall %', fontsize=9)
+	ax.set_ylim(0, 100)
+	ax.grid(True, linestyle='--', alpha=0.6)
+	ax.legend(fontsize=7, ncol=2)
+	plt.tight_layout(pad=0.5)
+
+	canvas = FigureCanvasTkAgg(fig, master=root)
+	canvas.draw()
+	canvas.get_tk_widget().pack(fill='both', expand=True)
+
+	return canvas
+
+@metrics.timed('graph.create_forecast_graph')
+def create_forecast_graph(root, due):
+	'''
+	Displays the workload forecast (forecast.py) as bars of the cards due per day, stacked by box.
+
+	Args:
+		due: (days x boxes) expected number of cards due per day and box, today first
+	'''
+	logger.info('Creating the forecast graph')
+	days = np.arange(len(due))
+	fig, ax = plt.subplots(figsize=(6, 2.2))
+
+	bottom = np.zeros(len(due))
+	for box in range(due.shape[1]):
+		if due[:, box].any():
+			ax.bar(days, due[:, box], bottom=bottom, width=0.8, label=f'Box {box+1}')
+			bottom += due[:, box]
+
+	ax.set_title('Cards due per day', fontsize=10, fontweight='bold')
+	ax.set_xlabel('Days from today', fontsize=9)
+	ax.set_xlim(-0.5, len(due) - 0.5)
+	ax.grid(True, axis='y', linestyle='--', alpha=0.6)
+	ax.legend(fontsize=7, ncol=5)
+	plt.tight_layout(pad=0.5)
+
+	canvas = FigureCanvasTkAgg(fig, master=root)
+	canvas.draw()
+	canvas.get_tk_widget().pack(fill='both', expand=True)
+
+	return canvas
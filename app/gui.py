@@ -12,22 +12,34 @@ The main class, LeitnerApp, orchestrates the entire application flow and UI rend
 from tkinter import *
 from tkinter import ttk
 from tkinter import messagebox
+from tkinter import filedialog
+from tkinter import simpledialog
 from PIL import ImageTk, Image
 
 import os 
 import random
 
 from app.database import Database
-from app.models import Box, Card
+from app.models import Box, Card, MIN_BOXES, MAX_BOXES
 from app.graph import create_graphframe
 from app.pomodoro import PomodoroTimer
+from app.timers import TimerService
+from app.importer import import_file
+from app.export import export_deck, backup
 import app.logic as logic
-from app.window import QuestionWindow, QuestionListbox, HelpWindow
+from app.scheduling import SCHEDULERS
+from app.analytics import DeckAnalytics
+from app.forecast import WorkloadForecast, suggested_session
+import app.metrics as metrics
+from app.window import QuestionWindow, QuestionListbox, StatsWindow, ForecastWindow, HelpWindow
 from app.flashcard import FlashCard
 
-from app.app_logging import get_logger
+from app.app_logging import get_logger, log_dir
 logger = get_logger(__name__)
 
+AUTOSAVE_INTERVAL = 5*60 	#seconds between automatic saves of the user data
+METRICS_INTERVAL = 60 		#seconds between metrics exports to logs/ (only with LEITNER_METRICS=1)
+
 class LeitnerApp:
 	'''
 	Main application class that creates and manages the Leitner Box learning system GUI.
@@ -50,6 +62,7 @@ class LeitnerApp:
 		quickframe (Frame):	Contains buttons (links) for frequently excecuted/common functions.
 		pomodoroframe (Frame):	Frame containing the Pomodoro timer and displays user's total time 
 								spent on focused studying.
+		timers (TimerService):	Single timer service that drives the pomodoro clock, autosave and other periodic jobs.
 	'''
 	def __init__(self, username):
 		'''
@@ -60,19 +73,33 @@ class LeitnerApp:
 			username: The username for the database access and personalization.
 		'''
 		logger.info(f'Initializing LeitnerApp for user: {username}')
-		self.leitner_box = Box() #The Leitner boxes are all stored in the big Box
-		
 		#Open a database for the LeitnerApp
 		logger.info(f'Opening database connection')		
 		self.database = Database(username)
 
+		self.leitner_box = Box(boxes=self.database.boxes) #The Leitner boxes are all stored in the big Box
+
 		#Loading cards onto the app Box
 		logger.info(f'Loading flashcards from database')
 		self.database.load_cards(self.leitner_box)
 		
+		#Loading the search and duplicate check indexes over all cards and attaching them to the box
+		self.database.open_indexes(self.leitner_box)
+
 		#Loading user data 
 		self.userdata = self.database.load_userdata()
 
+		#Scheduling algorithm chosen by the user (Edit > Scheduling), the Leitner rules by default
+		logic.use_scheduler(self.userdata.get('scheduler', 'leitner'))
+
+		#Retention analytics of all cards, for the stats window and optionally the scheduler
+		self.analytics = DeckAnalytics(self.database, self.leitner_box)
+		if self.userdata.get('weak_cards', False):
+			logic.use_analytics(self.analytics)
+
+		#Cards coming due over the next days, shown above the session sizes and in View > Workload forecast
+		self.forecast = WorkloadForecast(self.database, self.leitner_box)
+
 		#creating base window for the entire app
 		logger.debug(f'Seeting up main application window for {username}')
 		self.root = Tk()
@@ -83,6 +110,12 @@ class LeitnerApp:
 		#autosaving on accidental or intentional window exit
 		self.root.protocol("WM_DELETE_WINDOW", self.quit_program)
 
+		#one timer service for every periodic job of the app
+		self.timers = TimerService(self.root)
+		self.timers.schedule('autosave', self.autosave, AUTOSAVE_INTERVAL)
+		if metrics.enabled:
+			self.timers.schedule('metrics', self.export_metrics, METRICS_INTERVAL)
+
 		#creating and implementing the menu bar
 		logger.debug("Creating application menu")
 		self.menubar = Menu(self.root)
@@ -109,7 +142,7 @@ class LeitnerApp:
 		#creating and implementing frame that holds a pomodoro timer clock 
 		self.pomodoroframe = Frame(self.root, bd=5, relief=RIDGE, width=200, height=500, bg='white')
 		self.pomodoroframe.place(x=1150, y=20)
-		self.pomodoro = PomodoroTimer(self.pomodoroframe, self.userdata)	#calling method to implement the UI and logic
+		self.pomodoro = PomodoroTimer(self.pomodoroframe, self.userdata, self.timers)	#calling method to implement the UI and logic
 
 		logger.info('Creation and intialization of LeitnerApp class complete')
 
@@ -140,6 +173,14 @@ class LeitnerApp:
 		filemenu.add_command(label='Save', command = lambda: self.database.save_cards(self.leitner_box))
 		filemenu.add_separator()
 
+		#Import command adds the cards of a CSV, TSV or Anki text file to box 1
+		filemenu.add_command(label='Import cards...', command = self.import_cards)
+
+		#Export command writes all cards to a CSV, JSONL or tar.gz file, Back up keeps a tar.gz in data/<user>/backups
+		filemenu.add_command(label='Export cards...', command = self.export_cards)
+		filemenu.add_command(label='Back up deck', command = self.backup_deck)
+		filemenu.add_separator()
+
 		#Quit command quits the entire app 
 		#However it also runs the save command and saves all current user data.
 		filemenu.add_command(label='Quit', command = self.quit_program)
@@ -158,13 +199,38 @@ class LeitnerApp:
 		#Edit question command
 		#Launches the QuestionListbox from window.py which will allow the user to choose a box, view the questions inside
 		#the box, choose a question to edit and then launch a QuestionWindow to edit the selected question
-		editmenu.add_command(label='Edit question', command=lambda: QuestionListbox(self.root, self.leitner_box,'EDIT'))
+		editmenu.add_command(label='Edit question', command=lambda: QuestionListbox(self.root, self.leitner_box,'EDIT', self.database))
 		editmenu.add_separator()
 
 		#Remove question command 
 		#Launches the QuestionListbox from window.py which will allow the user to choose a box, view the questions inside 
 		#the box, choose a question and remove or delete it from the box and hence the database
-		editmenu.add_command(label='Remove question', command=lambda: QuestionListbox(self.root, self.leitner_box, 'DELETE'))
+		editmenu.add_command(label='Remove question', command=lambda: QuestionListbox(self.root, self.leitner_box, 'DELETE', self.database))
+		editmenu.add_separator()
+
+		#Remove duplicates command
+		#One pass over all the user's cards that removes cards with the same question and answer
+		editmenu.add_command(label='Remove duplicate cards', command=self.remove_duplicates)
+		editmenu.add_separator()
+
+		#Scheduling submenu
+		#Chooses the algorithm that picks the session questions and the box of every card: Leitner, SM-2 or FSRS
+		schedulingmenu = Menu(editmenu, tearoff=0)
+		self.scheduler_name = StringVar(self.root, logic.scheduler.name)
+		for scheduler in SCHEDULERS.values():
+			schedulingmenu.add_radiobutton(label=scheduler.label, value=scheduler.name, variable=self.scheduler_name,
+				command=self.change_scheduler)
+		editmenu.add_cascade(label='Scheduling', menu=schedulingmenu)
+
+		#Number of boxes command
+		#Asks for the number of Leitner boxes of the deck, the quotas and thresholds follow from it
+		editmenu.add_command(label='Number of boxes', command=self.change_box_count)
+
+		#Weak cards command
+		#With the Leitner rules, asks the cards of a box most likely forgotten (see analytics.py) more often
+		self.ask_weak_cards = BooleanVar(self.root, self.userdata.get('weak_cards', False))
+		editmenu.add_checkbutton(label='Ask weak cards more often', variable=self.ask_weak_cards,
+			command=self.change_weak_cards)
 		menubar.add_cascade(label='Edit', menu=editmenu)
 
 		#VIEW MENU 
@@ -172,20 +238,27 @@ class LeitnerApp:
 		viewmenu = Menu(menubar, tearoff=0)
 
 		#View stats command 
-		#TODO 
-		viewmenu.add_command(label='View Stats', command=...)
+		#Launches the StatsWindow from window.py with the retention curves, recall per box and leeches of all cards
+		viewmenu.add_command(label='View Stats', command=lambda: StatsWindow(self.root, self.analytics))
+
+		#Workload forecast command
+		#Launches the ForecastWindow from window.py with the cards due per day over the next 30 to 90 days
+		viewmenu.add_command(label='Workload forecast', command=lambda: ForecastWindow(self.root, self.forecast, logic.scheduler))
 		viewmenu.add_separator()
 
 		#View questions by box command
 		#Launches the QuestionListbox from window.py and allows the user to view all questions of choosen box
 		#It has both the edit and delete button and can perform both actions
-		viewmenu.add_command(label='View questions by box', command=lambda: QuestionListbox(self.root, self.leitner_box, 'VIEW'))
+		viewmenu.add_command(label='View questions by box', command=lambda: QuestionListbox(self.root, self.leitner_box, 'VIEW', self.database))
 		menubar.add_cascade(label='View', menu = viewmenu)
 
 		#HELP MENU
 		#Allows the user to ask for help
 		helpmenu = Menu(menubar, tearoff=0)
 		helpmenu.add_command(label='Help', command =lambda: HelpWindow(self.root))
+		if metrics.enabled:		#performance metrics are only collected with LEITNER_METRICS=1
+			helpmenu.add_command(label='Export metrics', command=lambda: messagebox.showinfo('Metrics',
+				'Metrics written to:\n' + '\n'.join(self.export_metrics())))
 		menubar.add_cascade(label='Help', menu = helpmenu)
 
 	def create_workframe(self, frame):
@@ -216,6 +289,11 @@ class LeitnerApp:
 		Label(frame, text='Choose your difficulty for the day:', 
 			font=('Ariel', 20, 'bold'), bg='white').place(x=220, y=340)
 
+		#Cards due today and this week, with the session size they call for
+		self.forecast_label = Label(frame, font=('Ariel', 11), bg='white')
+		self.forecast_label.place(x=220, y=305)
+		self.update_forecast()
+
 		#Creating buttons with image so user can choose difficulty of session
 		button = Image.open(os.path.join(abs_image_path, 'button.png'))
 		self.button_photo = ImageTk.PhotoImage(button.resize((120, 70)))
@@ -232,6 +310,7 @@ class LeitnerApp:
 				bg='white',	borderwidth=0, highlightthickness=0)
 			btn.place(x=x_positions[i], y=390)
 
+	@metrics.timed('tk.app.create_flashcard_frame')
 	def create_flashcard_frame(self, root, leitner_box, question_num):
 		'''
 		Handles the creation and implementation of flashcard frame which will come to overlap the workframe. 
@@ -271,6 +350,9 @@ class LeitnerApp:
 		#Updating the graph with new data
 		self.update_graph()
 
+		#Updating the forecast, the answered cards are arranged into their new boxes when the app closes
+		self.update_forecast()
+
 	def create_quickframe(self, root, database, box):
 		'''
 		Frame that holds buttons for frequently executed actions for ease of access. 
@@ -321,6 +403,110 @@ class LeitnerApp:
 	def run(self):
 		self.root.mainloop()
 
+	def remove_duplicates(self):
+		#Removes duplicate cards from all boxes after the user confirms
+		if messagebox.askyesno('Remove duplicates', 'Remove all cards that have the same question and answer as another card?'):
+			removed = self.database.dedup_cards(self.leitner_box)
+			messagebox.showinfo('Info', f'{removed} duplicate card(s) removed.')
+
+	def import_cards(self):
+		'''
+		Asks for a CSV, TSV or Anki text file and imports its cards into box 1, showing the progress while it runs.
+		'''
+		path = filedialog.askopenfilename(title='Import cards', 
+			filetypes=[('Card files', '*.csv *.tsv *.txt'), ('All files', '*.*')])
+		if not path:
+			return
+
+		progress_window = Toplevel(self.root)
+		progress_window.title('Importing cards')
+		progress_label = Label(progress_window, text='Starting import...', padx=20, pady=20)
+		progress_label.pack()
+
+		def show_progress(report):
+			percent = report.bytes_read*100//max(report.total_bytes, 1)
+			progress_label.config(text=f'{percent}% read, {report.imported} cards imported')
+			progress_window.update()		#redrawing the window between batches
+
+		try:
+			report = import_file(self.database, path, box=self.leitner_box, progress=show_progress)
+		except (OSError, ValueError) as e:
+			logger.error(f'Import of {path} failed: {str(e)}')
+			messagebox.showerror('Error', f'Could not import the file: {str(e)}')
+			return
+		finally:
+			progress_window.destroy()
+
+		messagebox.showinfo('Import', f'{report.imported} cards imported.\n'
+			f'{report.duplicates} duplicates and {report.invalid} invalid rows skipped.')
+
+	def export_cards(self):
+		#Asks for a file name and exports all cards of the user (the loaded ones included) to it
+		path = filedialog.asksaveasfilename(title='Export cards', defaultextension='.csv',
+			filetypes=[('CSV', '*.csv'), ('JSON lines', '*.jsonl'), ('Archive', '*.tar.gz')])
+		if not path:
+			return
+
+		try:
+			count = export_deck(self.database, path, box=self.leitner_box)
+		except (OSError, ValueError) as e:
+			logger.error(f'Export to {path} failed: {str(e)}')
+			messagebox.showerror('Error', f'Could not export the cards: {str(e)}')
+			return
+		messagebox.showinfo('Export', f'{count} cards exported.')
+
+	def backup_deck(self):
+		#Writes a backup archive of all cards and user data
+		try:
+			path = backup(self.database, self.leitner_box)
+		except OSError as e:
+			logger.error(f'Backup failed: {str(e)}')
+			messagebox.showerror('Error', f'Could not back up the cards: {str(e)}')
+			return
+		messagebox.showinfo('Backup', f'Backup saved to {path}')
+
+	def export_metrics(self):
+		#Writes the collected timings and counters to logs/metrics.prom and logs/metrics.json
+		return metrics.write(log_dir)
+
+	def change_scheduler(self):
+		'''
+		Switches to the scheduling algorithm chosen in the Edit menu and keeps the choice in the user data.
+		The answers given so far are applied by the old algorithm first. With SM-2 or FSRS the cards stay
+		in their box until they are answered for the first time.
+		'''
+		logic.arrange_boxes(self.leitner_box)
+		name = self.scheduler_name.get()
+		logic.use_scheduler(name)
+		self.userdata['scheduler'] = name
+		logger.info(f'Scheduling algorithm changed to {name}')
+		self.update_forecast()
+
+	def change_weak_cards(self):
+		#Turns the use of the recall estimates by the scheduler on or off and keeps the choice in the user data
+		weak_cards = self.ask_weak_cards.get()
+		logic.use_analytics(self.analytics if weak_cards else None)
+		self.userdata['weak_cards'] = weak_cards
+		logger.info(f'Asking weak cards more often: {weak_cards}')
+
+	def change_box_count(self):
+		'''
+		Asks for the number of boxes of the deck and applies it to the cards file and the loaded cards.
+		Cards in removed boxes go to the new last box.
+		'''
+		boxes = simpledialog.askinteger('Number of boxes', f'Number of Leitner boxes ({MIN_BOXES} - {MAX_BOXES}):',
+			initialvalue=len(self.leitner_box.boxlist), minvalue=MIN_BOXES, maxvalue=MAX_BOXES, parent=self.root)
+		if boxes is None or boxes == len(self.leitner_box.boxlist):
+			return
+		self.database.set_box_count(boxes, self.leitner_box)
+		logger.info(f'Number of boxes changed to {boxes}')
+		self.update_forecast()
+
+	def autosave(self):
+		#Periodic job: stores the user activity data so a crash does not lose the session results
+		logger.debug('Autosaving user data')
+		self.database.save_userdata(self.userdata)
+
 	def quit_program(self):
 		'''
 		Function that is run every time the user performs an action that closes the app. 
@@ -329,16 +515,21 @@ class LeitnerApp:
 		logger.info('User choose to quit the application')
 
 		logger.debug('Attempting to save user data before closing')
+		self.timers.stop()							#no more ticks while closing
 		logic.arrange_boxes(self.leitner_box)		#arranging the cards in the current session 
-		self.database.save_cards(self.leitner_box)	#saving all the user cards back to their box files
+		self.database.save_cards(self.leitner_box)	#saving all the user cards back to the cards file
+		self.database.save_search_index()			#saving the card indexes if cards changed
 
 		self.pomodoro.save_session_time()			#saving user focus time
 		self.database.save_userdata(self.userdata)	#saving user's success with answering questoins
+		if metrics.enabled:
+			self.export_metrics()
 
 		logger.debug('Closing and quiting the application')
 		self.root.quit()	#quitting the app
 		self.root.destroy()	#deleting the window 
 
+	@metrics.timed('tk.app.update_graph')
 	def update_graph(self):
 		'''
 		Updates the graph with the latest user data.
@@ -351,4 +542,10 @@ class LeitnerApp:
 			widget.destroy()
 
 		#Recreate the graph with updated data
-		create_graphframe(self.graphframe, self.userdata)
\ No newline at end of file
+		create_graphframe(self.graphframe, self.userdata)
+
+	def update_forecast(self):
+		#Shows the cards due today and over the next week (forecast.py) in the work frame
+		due = self.forecast.get(logic.scheduler, 7).sum(axis=1)
+		self.forecast_label.config(text=f'Due today: {due[0]:.0f} cards, this week: {due.sum():.0f}. '
+			f'Suggested session: {suggested_session(due)} questions')
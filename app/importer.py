@@ -0,0 +1,317 @@
+#! python3
+# importer.py - Streaming bulk import of cards from CSV, TSV and Anki text exports.
+#				The file is read as a generator pipeline (parse -> validate/normalize -> dedup -> batch write),
+#				so memory use does not depend on the size of the file.
+#
+# Columns of CSV/TSV files:	question, answer[, mcq question, mcq options, tags]
+#							mcq options are the 3 wrong options separated by "," and tags are separated by spaces.
+#							A first row starting with "question" or "front" is taken as a header and skipped.
+# Anki "Notes in Plain Text" exports:	front, back[, tags]
+#							with the "#separator:", "#html:" and "#tags column:" header lines Anki writes.
+#
+# Usage: python -m app.importer USERNAME FILE [--format csv|tsv|anki] [--workers N]
+
+import csv, html, os, re, uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.dedup import content_hash
+from app.search import card_tokens
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+BATCH_SIZE = 1000				#cards written to the cards file at once
+CHUNK_SIZE = 4*2**20			#bytes of the file parsed by one job in parallel mode
+MAX_ERRORS = 100				#invalid rows kept in the report
+HEADER_WORDS = ('question', 'front')
+SEPARATORS = {'tab': '\t', 'comma': ',', 'semicolon': ';', 'pipe': '|', 'space': ' ', 'colon': ':'}
+HTML_TAG = re.compile(r'<[^>]+>')
+HTML_BREAK = re.compile(r'<br\s*/?>|</div>|</p>', re.IGNORECASE)
+
+class ImportReport:
+	'''
+	Counts of an import, passed to the progress callback after every written batch and returned at the end.
+	'''
+	def __init__(self, total_bytes:int=0):
+		self.total_bytes = total_bytes
+		self.bytes_read = 0
+		self.rows = 0 			#data rows read
+		self.imported = 0 		#cards written
+		self.duplicates = 0 	#rows skipped because the card already exists
+		self.invalid = 0 		#rows skipped because they are not a valid card
+		self.errors = [] 		#(row or byte offset, message) of the first MAX_ERRORS invalid rows
+
+	def add_error(self, where, message):
+		self.invalid += 1
+		if len(self.errors) < MAX_ERRORS:
+			self.errors.append((where, message))
+
+	def __repr__(self):
+		return (f'ImportReport(rows={self.rows}, imported={self.imported}, duplicates={self.duplicates}, '
+			f'invalid={self.invalid})')
+
+def detect_format(path) -> str:
+	#Format of the file from its extension, Anki exports are .txt files
+	extension = os.path.splitext(path)[1].lower()
+	if extension == '.csv':
+		return 'csv'
+	elif extension in ('.tsv', '.tab'):
+		return 'tsv'
+	elif extension == '.txt':
+		return 'anki'
+	raise ValueError(f'Unknown import format for {path}, use csv, tsv or anki.')
+
+def read_options(path, fmt) -> tuple:
+	'''
+	Reads the header of the file.
+	Returns the parsing options (delimiter, html, tags column) and the byte offset of the first data row.
+	'''
+	options = {'delimiter': {'csv': ',', 'tsv': '\t', 'anki': '\t'}[fmt], 'html': fmt == 'anki', 'tags_column': None}
+	with open(path, 'rb') as file:
+		offset = 0
+		for raw_line in file:
+			line = raw_line.decode('utf-8-sig' if offset == 0 else 'utf-8').strip()
+			if fmt == 'anki' and line.startswith('#'):
+				name, _, value = line[1:].partition(':')
+				name = name.strip().lower()
+				value = value.strip()
+				if name == 'separator':
+					options['delimiter'] = SEPARATORS.get(value.lower(), value)
+				elif name == 'html':
+					options['html'] = value.lower() == 'true'
+				elif name == 'tags column':
+					options['tags_column'] = int(value) - 1
+			elif not line:
+				pass
+			elif fmt != 'anki' and line.split(options['delimiter'])[0].strip('"').strip().lower() in HEADER_WORDS:
+				offset += len(raw_line)		#header row of a csv/tsv file
+				break
+			else:
+				break
+			offset += len(raw_line)
+	return options, offset
+
+def read_lines(file, end, report=None):
+	#Decoded lines of a binary file until the byte offset end, counting the bytes read
+	position = file.tell()
+	while end is None or position < end:
+		raw_line = file.readline()
+		if not raw_line:
+			return
+		position += len(raw_line)
+		if report is not None:
+			report.bytes_read = position
+		yield raw_line.decode('utf-8', errors='replace')
+
+def clean(text, is_html) -> str:
+	if is_html:
+		text = html.unescape(HTML_TAG.sub('', HTML_BREAK.sub(' ', text)))
+	return ' '.join(text.split())
+
+def to_record(fields, options) -> dict:
+	'''
+	Validates and normalizes one parsed row into the card data stored in the cards file (the format of Card.to_dict).
+	Raises ValueError if the row is not a valid card.
+	'''
+	is_html = options['html']
+	tags = []
+	if options['tags_column'] is not None and options['tags_column'] < len(fields):
+		tags = fields[options['tags_column']].split()
+		fields = fields[:options['tags_column']] + fields[options['tags_column']+1:]
+	elif len(fields) > 4:
+		tags = fields[4].split()
+	fields = [clean(field, is_html) for field in fields[:4]]
+	fields += ['']*(4 - len(fields))
+	input_question, answer, mcq_question, mcq_options = fields
+
+	if not answer:
+		raise ValueError('no answer')
+	if not input_question and not mcq_question:
+		raise ValueError('no question')
+
+	questions = [input_question or None, None]
+	if mcq_question:
+		options_list = [option.strip() for option in mcq_options.split(',') if option.strip()]
+		if len(options_list) != 3:
+			raise ValueError('an mcq question needs exactly 3 options')
+		questions[1] = mcq_question + ',' + ','.join(options_list)
+
+	return {'id': uuid.uuid4().hex, 'answer': answer, 'questions': questions, 'box': 1, 'history': [],
+		'tags': list(dict.fromkeys(tags))}
+
+def prepare(record, storage) -> tuple:
+	'''
+	Everything the store needs for a card that can be computed without the store: 
+	the card id, its content hash, its search tokens and its line for the cards file (encoded by the storage).
+	Done where the row is parsed, so in parallel mode it runs in the worker processes.
+	'''
+	return (record['id'], content_hash(record['answer'], record['questions']),
+		tuple(card_tokens(record['answer'], record['questions'])), storage.encode(record))
+
+def parse_records(lines, options, report):
+	'''
+	Generator of (position, prepared card or ValueError) for the rows of the lines.
+	The position is the row number within the lines.
+	'''
+	reader = csv.reader(lines, delimiter=options['delimiter'])
+	for fields in reader:
+		if not fields or not any(field.strip() for field in fields):
+			continue
+		report.rows += 1
+		try:
+			yield reader.line_num, prepare(to_record(fields, options), options['storage'])
+		except ValueError as e:
+			yield reader.line_num, e
+
+def parse_range(path, options, start, end) -> tuple:
+	'''
+	Parses the rows between two byte offsets of the file. Runs in a worker process in parallel mode.
+	Returns the number of rows, the prepared cards of the valid rows and (row, message) of the invalid ones.
+	'''
+	report = ImportReport()
+	records = []
+	errors = []
+	with open(path, 'rb') as file:
+		file.seek(start)
+		for position, record in parse_records(read_lines(file, end), options, report):
+			if isinstance(record, ValueError):
+				errors.append((f'byte {start} row {position}', str(record)))
+			else:
+				records.append(record)
+	return report.rows, records, errors
+
+def byte_ranges(path, start, chunk_size=None):
+	#Splits the file from start into ranges of about chunk_size bytes that end at a line break
+	chunk_size = CHUNK_SIZE if chunk_size is None else chunk_size
+	size = os.path.getsize(path)
+	with open(path, 'rb') as file:
+		while start < size:
+			file.seek(min(start + chunk_size, size))
+			file.readline()		#moving on to the end of the line
+			end = min(file.tell(), size)
+			yield start, end
+			start = end
+
+def stream_records(path, options, offset, report):
+	#Prepared cards of the file read in this process
+	with open(path, 'rb') as file:
+		file.seek(offset)
+		for position, record in parse_records(read_lines(file, None, report), options, report):
+			if isinstance(record, ValueError):
+				report.add_error(f'row {position}', str(record))
+			else:
+				yield record
+
+def parallel_records(path, options, offset, report, workers):
+	'''
+	Prepared cards of the file parsed by a pool of worker processes, each parsing one byte range at a time.
+	At most 2 ranges per worker are in flight, so memory use stays bounded. Records keep the order of the file.
+	Multi-line quoted fields are not supported in this mode: ranges are split at line breaks.
+	'''
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		ranges = byte_ranges(path, offset)
+		pending = deque()
+		while True:
+			while len(pending) < 2*workers:
+				next_range = next(ranges, None)
+				if next_range is None:
+					break
+				pending.append((next_range[1], executor.submit(parse_range, path, options, *next_range)))
+			if not pending:
+				return
+
+			end, future = pending.popleft()
+			rows, records, errors = future.result()
+			report.rows += rows
+			report.bytes_read = end
+			for where, message in errors:
+				report.add_error(where, message)
+			yield from records
+
+def unique_records(records, hash_index, report):
+	#Drops the cards that already exist, or that appeared earlier in the file
+	for prepared in records:
+		card_id, key = prepared[:2]
+		if key in hash_index.by_hash:
+			report.duplicates += 1
+			continue
+		hash_index.add_hash(card_id, key)
+		yield prepared
+
+def batched(records, size):
+	batch = []
+	for record in records:
+		batch.append(record)
+		if len(batch) == size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+def import_file(database, path, fmt=None, box=None, workers=0, batch_size=BATCH_SIZE, progress=None) -> ImportReport:
+	'''
+	Imports the cards of a CSV, TSV or Anki text file into box 1 of the user's store.
+	Cards that duplicate an existing card are skipped, the search and hash indexes are updated.
+	The database lock is held for the whole import, so a snapshot (and an export) sees all of it or none of it.
+
+	Args:
+		database:	Database of the user
+		path:		file to import
+		fmt:		'csv', 'tsv' or 'anki' (detected from the file extension if None)
+		box:		Box of the running session, passed so its indexes are the ones updated
+		workers:	number of processes parsing the file, 0 parses it in this process
+		batch_size:	cards appended to the cards file at once
+		progress:	function called with the ImportReport after every written batch
+	'''
+	fmt = detect_format(path) if fmt is None else fmt
+	options, offset = read_options(path, fmt)
+	options['storage'] = database.storage 		#the cards file lines are encoded where the rows are parsed
+	report = ImportReport(os.path.getsize(path))
+	logger.info(f'Importing {path} ({fmt}) for {database.username} with {workers or "no"} worker processes')
+
+	with database.lock:
+		database.open_indexes(box)
+		if workers > 0:
+			records = parallel_records(path, options, offset, report, workers)
+		else:
+			records = stream_records(path, options, offset, report)
+
+		for batch in batched(unique_records(records, database.hash_index, report), batch_size):
+			database.append_cards([line for card_id, key, tokens, line in batch], encoded=True)
+			for card_id, key, tokens, line in batch:
+				database.search_index.insert_tokens(card_id, tokens)
+			database.search_index.dirty = True
+			report.imported += len(batch)
+			if progress is not None:
+				progress(report)
+
+		database.save_search_index()
+	logger.info(f'Import of {path} finished: {report}')
+	return report
+
+def main(argv=None):
+	'''
+	Command line entry point, prints the progress and the final counts.
+	'''
+	import argparse
+	from app.database import Database
+
+	parser = argparse.ArgumentParser(description='Import cards from a CSV, TSV or Anki text file.')
+	parser.add_argument('username')
+	parser.add_argument('path')
+	parser.add_argument('--format', choices=['csv', 'tsv', 'anki'])
+	parser.add_argument('--workers', type=int, default=0)
+	args = parser.parse_args(argv)
+
+	def show_progress(report):
+		print(f'\r{report.bytes_read*100//max(report.total_bytes, 1)}% {report.imported} cards imported', end='')
+
+	report = import_file(Database(args.username), args.path, args.format, workers=args.workers, progress=show_progress)
+	print(f'\n{report.imported} imported, {report.duplicates} duplicates, {report.invalid} invalid rows')
+	for where, message in report.errors:
+		print(f'{where}: {message}')
+	return 0
+
+if __name__ == '__main__':
+	raise SystemExit(main())
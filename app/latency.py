@@ -0,0 +1,57 @@
+#! python3
+# latency.py - Response times of answers: the time from showing a card to submitting the answer.
+#				A time is kept as the index of its log-linear bucket (like an HDR histogram): SUB_BUCKETS buckets
+#				per doubling from UNIT seconds, so a time costs one byte and keeps 1/SUB_BUCKETS relative precision.
+#				Histograms are count arrays over the BUCKETS buckets, their quantiles are read with one cumulative
+#				sum over the fixed buckets, however many answers were counted.
+
+import math
+
+import numpy as np
+
+UNIT = 0.125 			#seconds, times below it are in bucket 0
+SUB_BUCKETS = 8 		#buckets per doubling of the time
+DOUBLINGS = 12 			#up to UNIT*2**DOUBLINGS = 512 seconds, longer times are in the last bucket
+BUCKETS = SUB_BUCKETS*DOUBLINGS + 2
+UNMEASURED = 255 		#bucket of an answer without a response time
+
+#upper bound (seconds) of every bucket, the last one is open
+UPPER_BOUNDS = np.array([UNIT] + [UNIT*2**doubling*(1 + (sub + 1)/SUB_BUCKETS)
+	for doubling in range(DOUBLINGS) for sub in range(SUB_BUCKETS)] + [math.inf])
+LOWER_BOUNDS = np.concatenate([[0.0], UPPER_BOUNDS[:-1]])
+
+def bucket_of(seconds:float) -> int:
+	#Bucket of a response time
+	if seconds < UNIT:
+		return 0
+	mantissa, exponent = math.frexp(seconds/UNIT) 		#seconds/UNIT = mantissa*2**exponent, 0.5 <= mantissa < 1
+	if exponent > DOUBLINGS:
+		return BUCKETS - 1
+	return 1 + (exponent - 1)*SUB_BUCKETS + int((mantissa*2 - 1)*SUB_BUCKETS)
+
+def bucket_seconds(buckets):
+	#Middle of the buckets in seconds (the lower bound for the last, open bucket), nan for UNMEASURED
+	buckets = np.asarray(buckets)
+	known = buckets < BUCKETS
+	safe = np.where(known, buckets, 0)
+	middle = np.where(safe == BUCKETS - 1, LOWER_BOUNDS[safe], (LOWER_BOUNDS[safe] + UPPER_BOUNDS[safe])/2)
+	return np.where(known, middle, np.nan)
+
+def quantiles(counts:np.ndarray, q:float) -> np.ndarray:
+	'''
+	Bucket of the q quantile of every row of a (rows x BUCKETS) count matrix (or of one count array),
+	UNMEASURED for rows without counts.
+	'''
+	counts = np.asarray(counts)
+	cumulative = np.cumsum(counts, axis=-1)
+	total = cumulative[..., -1:]
+	buckets = np.argmax(cumulative >= np.maximum(q*total, 1), axis=-1)
+	return np.where(total[..., 0] > 0, buckets, UNMEASURED)
+
+def histogram(buckets, rows=None, row_count:int=1) -> np.ndarray:
+	#(row_count x BUCKETS) counts of the buckets per row (all in row 0 if rows is None), UNMEASURED is left out
+	buckets = np.asarray(buckets, np.intp)
+	rows = np.zeros(len(buckets), np.intp) if rows is None else np.asarray(rows, np.intp)
+	measured = buckets < BUCKETS
+	index = rows[measured]*BUCKETS + buckets[measured]
+	return np.bincount(index, minlength=row_count*BUCKETS).reshape(row_count, BUCKETS)
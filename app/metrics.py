@@ -0,0 +1,177 @@
+#! python3
+# metrics.py - Lightweight in-process timing and counters for the hot paths of the app.
+#				Switched on with the environment variable LEITNER_METRICS=1 (or enable()). When it is off,
+#				timed functions only check one flag and timer()/count() return at once.
+#				The aggregated histograms can be exported as Prometheus text or as a json snapshot.
+
+import bisect, functools, json, os, threading, time
+
+ENV_VARIABLE = 'LEITNER_METRICS'
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)	#seconds
+PREFIX = 'leitner'
+
+enabled = os.environ.get(ENV_VARIABLE, '').strip().lower() not in ('', '0', 'false', 'off', 'no')
+
+class Histogram:
+	'''
+	Latency histogram with fixed buckets (upper bounds in seconds), like a Prometheus histogram.
+	'''
+	def __init__(self):
+		self.counts = [0]*(len(BUCKETS) + 1)		#the last bucket is +Inf
+		self.sum = 0.0
+		self.count = 0
+		self.max = 0.0
+
+	def observe(self, seconds):
+		self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+		self.sum += seconds
+		self.count += 1
+		if seconds > self.max:
+			self.max = seconds
+
+	def quantile(self, q) -> float:
+		#Upper bound of the bucket holding the q quantile (max for the +Inf bucket)
+		if self.count == 0:
+			return 0.0
+		rank = q*self.count
+		seen = 0
+		for bound, count in zip(BUCKETS, self.counts):
+			seen += count
+			if seen >= rank:
+				return min(bound, self.max)
+		return self.max
+
+class Registry:
+	'''
+	Histograms of operation durations and event counters, keyed by name (e.g. "database.load_cards").
+	'''
+	def __init__(self):
+		self.histograms = {}
+		self.counters = {}
+		self.lock = threading.Lock()
+
+	def observe(self, name, seconds):
+		with self.lock:
+			histogram = self.histograms.get(name)
+			if histogram is None:
+				histogram = self.histograms[name] = Histogram()
+			histogram.observe(seconds)
+
+	def count(self, name, value=1):
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + value
+
+	def reset(self):
+		with self.lock:
+			self.histograms.clear()
+			self.counters.clear()
+
+	def snapshot(self) -> dict:
+		#Current values as plain data
+		with self.lock:
+			return {
+				'time': time.time(),
+				'operations': {name: {'count': histogram.count, 'sum_seconds': histogram.sum, 'max_seconds': histogram.max,
+					'p50_seconds': histogram.quantile(0.5), 'p95_seconds': histogram.quantile(0.95),
+					'buckets': dict(zip([str(bound) for bound in BUCKETS] + ['+Inf'], histogram.counts))}
+					for name, histogram in sorted(self.histograms.items())},
+				'counters': dict(sorted(self.counters.items())),
+			}
+
+	def prometheus(self) -> str:
+		#Current values in the Prometheus text exposition format
+		lines = [f'# HELP {PREFIX}_operation_seconds Duration of instrumented operations.',
+			f'# TYPE {PREFIX}_operation_seconds histogram']
+		with self.lock:
+			for name, histogram in sorted(self.histograms.items()):
+				cumulative = 0
+				for bound, count in zip([str(bound) for bound in BUCKETS] + ['+Inf'], histogram.counts):
+					cumulative += count
+					lines.append(f'{PREFIX}_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {cumulative}')
+				lines.append(f'{PREFIX}_operation_seconds_sum{{operation="{name}"}} {histogram.sum}')
+				lines.append(f'{PREFIX}_operation_seconds_count{{operation="{name}"}} {histogram.count}')
+			lines += [f'# HELP {PREFIX}_events_total Counted events.', f'# TYPE {PREFIX}_events_total counter']
+			for name, value in sorted(self.counters.items()):
+				lines.append(f'{PREFIX}_events_total{{event="{name}"}} {value}')
+		return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+class Timer:
+	#Context manager that records the duration of its block
+	__slots__ = ('name', 'start')
+
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc_info):
+		registry.observe(self.name, time.perf_counter() - self.start)
+		return False
+
+class NullTimer:
+	#Timer used while metrics are off
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		return False
+
+null_timer = NullTimer()
+
+def enable():
+	global enabled
+	enabled = True
+
+def disable():
+	global enabled
+	enabled = False
+
+def timer(name):
+	'''
+	Times a block: with metrics.timer('graph.redraw'): ...
+	'''
+	return Timer(name) if enabled else null_timer
+
+def count(name, value=1):
+	#Adds value to the counter name
+	if enabled:
+		registry.count(name, value)
+
+def timed(name):
+	'''
+	Decorator recording the duration of every call of the function under name.
+	'''
+	def decorator(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return function(*args, **kwargs)
+			start = time.perf_counter()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				registry.observe(name, time.perf_counter() - start)
+		return wrapper
+	return decorator
+
+def snapshot() -> dict:
+	return registry.snapshot()
+
+def write(directory, basename='metrics') -> list:
+	'''
+	Writes the metrics as <basename>.prom (Prometheus text) and <basename>.json into directory.
+	Returns the paths of the written files.
+	'''
+	os.makedirs(directory, exist_ok=True)
+	paths = [os.path.join(directory, basename + '.prom'), os.path.join(directory, basename + '.json')]
+	contents = [registry.prometheus(), json.dumps(registry.snapshot(), indent=4)]
+	for path, content in zip(paths, contents):
+		temp_path = path + '.tmp'
+		with open(temp_path, 'w') as file:
+			file.write(content)
+		os.replace(temp_path, path)		#a scraper never reads a half written file
+	return paths
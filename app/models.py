@@ -1,9 +1,124 @@
 #! python3
 #models.py - Contains the implementation of Card and Box classes.
 
+import base64, sys, time, uuid
+from array import array
+from itertools import accumulate, chain
+from logging import DEBUG, INFO
+
+from app.latency import bucket_of, UNMEASURED
 from app.app_logging import get_logger
 logger = get_logger(__name__)
 
+DEFAULT_BOXES = 5 	#boxes of a new deck
+MIN_BOXES = 2
+MAX_BOXES = 10 		#the Leitner rules need at least one more correct answer of the 10 session history per box
+HISTORY = 10 		#answers in the history of a card (Card.history), all the Leitner rules look at
+BINARY_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+#the history list of every value of ReviewLog.recent (to_dict makes one per saved card)
+HISTORY_LISTS = [[(recent >> shift) & 1 for shift in range(HISTORY - 1, -1, -1)] for recent in range(1 << HISTORY)]
+
+def check_box_count(boxes:int):
+	if not MIN_BOXES <= boxes <= MAX_BOXES:
+		raise ValueError(f'A deck has {MIN_BOXES} to {MAX_BOXES} boxes, not {boxes}')
+
+class ReviewLog:
+	'''
+	Every answer given to a card. The outcomes are packed bits (1 right, 0 wrong, oldest first, 8 per byte) and the
+	times are the seconds since the previous answer (the first one since the epoch) in an array, with the response
+	time of the answer as one byte (its latency.py bucket), so a log of hundreds of answers costs a few hundred bytes.
+	Answers of a plain history list have no time (untimed), they come before the timed answers.
+	Long logs are queried on the packed bits (correct, outcome) without building lists.
+	'''
+	__slots__ = ('bits', 'count', 'recent', 'deltas', 'latencies', 'untimed', 'last_time')
+
+	def __init__(self, outcomes:list=()):
+		#outcomes: a history list, 1 (or any true value) for a right answer
+		self.count = len(outcomes)
+		self.untimed = self.count
+		self.deltas = None 			#array('I') of the time deltas, made at the first timed answer
+		self.latencies = None 		#bytearray of the response time buckets of the timed answers
+		self.last_time = 0
+		#one string of digits, oldest first: the newest answer is the lowest bit of recent
+		digits = bytes(map(bool, outcomes)).translate(BINARY_DIGITS)
+		self.recent = int(digits[-HISTORY:] or b'0', 2) 	#last HISTORY outcomes
+		self.bits = bytearray(int(digits[::-1] or b'0', 2).to_bytes((self.count + 7) >> 3, 'little'))
+
+	def __len__(self):
+		return self.count
+
+	def append(self, outcome:bool, timestamp:float=None, latency:float=None):
+		#Records an answer, at timestamp (seconds since the epoch) and with its response time latency (seconds) if given
+		index = self.count
+		if not index & 7:
+			self.bits.append(0)
+		if outcome:
+			self.bits[-1] |= 1 << (index & 7)
+		self.count = index + 1
+		self.recent = ((self.recent << 1) | bool(outcome)) & ((1 << HISTORY) - 1)
+		if timestamp is None and self.deltas is None:
+			self.untimed += 1
+			return
+		if self.deltas is None:
+			self.deltas = array('I')
+			self.latencies = bytearray()
+		self.latencies.append(UNMEASURED if latency is None else bucket_of(latency))
+		timestamp = self.last_time if timestamp is None else max(int(timestamp), self.last_time)
+		self.deltas.append(timestamp - self.last_time)
+		self.last_time = timestamp
+
+	def outcome(self, index:int) -> int:
+		#1 if the answer at index (negative: from the newest) was right
+		index = range(self.count)[index]
+		return (self.bits[index >> 3] >> (index & 7)) & 1
+
+	def correct(self, start:int=0, stop:int=None) -> int:
+		#Number of right answers in the slice start:stop of the log
+		start, stop, _ = slice(start, stop).indices(self.count)
+		if start >= stop:
+			return 0
+		value = int.from_bytes(self.bits[start >> 3:(stop + 7) >> 3], 'little') >> (start & 7)
+		return (value & ((1 << (stop - start)) - 1)).bit_count()
+
+	def history(self) -> list:
+		#The last HISTORY outcomes (all of them in a shorter log), oldest first
+		if self.count >= HISTORY:
+			return HISTORY_LISTS[self.recent].copy()
+		return HISTORY_LISTS[self.recent][HISTORY - self.count:]
+
+	def times(self) -> array:
+		#Time (seconds since the epoch) of every timed answer, the answers from self.untimed on
+		return array('q', accumulate(self.deltas)) if self.deltas is not None else array('q')
+
+	def encode(self) -> list:
+		#[count, untimed, base64 bits, base64 little endian time deltas, base64 response time buckets] for the cards file
+		deltas = b''
+		if self.deltas is not None:
+			values = array('I', self.deltas)
+			if sys.byteorder == 'big':
+				values.byteswap()
+			deltas = values.tobytes()
+		return [self.count, self.untimed, base64.b64encode(self.bits).decode(), base64.b64encode(deltas).decode(),
+			base64.b64encode(self.latencies or b'').decode()]
+
+	@classmethod
+	def decode(cls, encoded:list) -> 'ReviewLog':
+		count, untimed, bits, deltas = encoded[:4]
+		log = cls()
+		log.count = count
+		log.untimed = untimed
+		log.bits = bytearray(base64.b64decode(bits))
+		for index in range(max(count - HISTORY, 0), count): 	#the newest answer is the lowest bit of recent
+			log.recent = (log.recent << 1) | log.outcome(index)
+		if untimed < count:
+			log.deltas = array('I', base64.b64decode(deltas))
+			if sys.byteorder == 'big':
+				log.deltas.byteswap()
+			log.last_time = sum(log.deltas)
+			latencies = base64.b64decode(encoded[4]) if len(encoded) > 4 else b'' 	#logs saved before response times
+			log.latencies = bytearray(latencies.ljust(len(log.deltas), bytes([UNMEASURED])))
+		return log
+
 class Card:
 	'''
 	Class Card: It holds the data for the question and answer. 
@@ -16,14 +131,34 @@ class Card:
 				Multiple choice or 1 (questions that show multiple options and you have to choose the right one)
 				If the type of question does not exist, there will be a None in it's place.
 
+	card_id:	Unique id of the card (hex string). A new one is generated if None.
+				Used by the search index and other per-card indexes to refer to the card.
+
+	tags:		List of tags (strings) the user gave the card.
+
+	state:		Memory state of the card for the sm2 or fsrs scheduler (see scheduling.py), None if it has none.
+
+	log:		ReviewLog of every answer (or its encoded form). history is its view of the last HISTORY answers,
+				padded with 0s at the start while the card has fewer answers. If None a log is started from the
+				history, a new card starts with an empty log.
 	
 	'''
-	def __init__(self, answer: str, questions: list=[None,None], history = None, box:int = 1):
+	reviews = 0 	#answers recorded by all cards, caches of the analytics (analytics.py) compare it
+
+	def __init__(self, answer: str, questions: list=[None,None], history = None, box:int = 1, card_id:str = None,
+		tags:list = None, state:list = None, log = None):
+		self.id = uuid.uuid4().hex if card_id is None else card_id
 		self.answer = answer 
 		self.questions = questions #checking and assigning valid questions only
-		self.history = [0]*10 if history is None else history #makes sure history is present for 10 sessions
-		self.box = box  #Box levels from 1 to 5, new cards are in level 1
-		logger.info(f'Card created with answer: {self.get_answer}, in box: {self.box}')
+		if log is None:
+			log = ReviewLog(() if history is None else history)
+		self.log = ReviewLog.decode(log) if isinstance(log, list) else log
+		self.box = box  #Box levels from 1 to the number of boxes of the deck, new cards are in level 1
+		self.tags = [] if tags is None else tags
+		self.state = state
+		self.pending = [] 	#answers since the scheduler last arranged the boxes (not saved)
+		if logger.isEnabledFor(INFO): 	#hot path: formatted lazily and sampled (see app_logging.SAMPLE_RATES)
+			logger.info('Card created with answer: %s, in box: %s', answer, box)
 
 	def get_answer(self):
 		return self.answer
@@ -31,21 +166,35 @@ class Card:
 	def get_question(self, type:int=0):
 		return self.questions[type] #returns quesiton according to type
 
-	def session_result(self, result:bool):
+	def session_result(self, result:bool, latency:float=None):
 		'''
 		Takes the True or False for session result for one question. True is correct answer and False is wrong.
-		Then it updates the self.history for the card by appending the new value (1 for True, 0 for False)
-		and removing the first value to create a record for the last 10 sessions only.
-		'''
-		if result:
-			self.history.append(1) #record of correct answer
-			logger.info(f'Correct answer recorded for card: {self.get_answer}')
-		else:
-			self.history.append(0) #record of incorrect answer
-			logger.info(f'Incorrect answer recorded for card: {self.get_answer}')
-		
-		del self.history[0] #removing the oldest record
-		logger.debug(f'Updated history for card {self.answer}.') 
+		Then it records the answer, its time and its response time (latency, seconds) if measured in the review log
+		(self.log), self.history shows the last 10 sessions.
+		'''
+		self.log.append(result, time.time(), latency)
+		if logger.isEnabledFor(INFO):
+			if result:
+				logger.info('Correct answer recorded for card: %s', self.answer)
+			else:
+				logger.info('Incorrect answer recorded for card: %s', self.answer)
+
+		self.pending.append(result)
+		Card.reviews += 1
+		if logger.isEnabledFor(DEBUG):
+			logger.debug('Updated history for card %s.', self.answer)
+
+	@property
+	def history(self) -> list:
+		#Last HISTORY answers of the review log (1 for correct, 0 for incorrect), oldest first,
+		#with 0s at the start for the sessions a card with fewer answers has not had
+		return HISTORY_LISTS[self.log.recent].copy()
+
+	@history.setter
+	def history(self, history:list):
+		#Replaces the whole review log (times and response times included) with a new one of the plain history list.
+		#Meant for cards of old files and for tests, answers are recorded with session_result
+		self.log = ReviewLog(history)
 
 	def change_box(self, new_box:int):
 		'''
@@ -56,33 +205,71 @@ class Card:
 	def to_dict(self):
 		'''
 		Returns a dictionary of the card attributes. 
-		Details: {'answer':str or int, 'questions': list[question0, question1],
-		'box': int, 'history': list[0 and 1s]}
+		Details: {'id': str, 'answer':str or int, 'questions': list[question0, question1],
+		'box': int, 'history': list[0 and 1s] (the last 10 answers or fewer), 'tags': list[str]} and 'state': list if the card has a scheduler state,
+		'log': list (ReviewLog.encode) if the review log holds more than the history.
 		'''
-		return {'answer':self.answer, 'questions':self.questions, 'box':self.box, 'history':self.history}
+		log = self.log
+		data = {'id':self.id, 'answer':self.answer, 'questions':self.questions, 'box':self.box, 'history':log.history(),
+			'tags':self.tags}
+		if self.state is not None:
+			data['state'] = self.state
+		if log.count > HISTORY or log.deltas is not None:
+			data['log'] = log.encode()
+		return data
 
 	def get_history(self):
 		return self.history
 
 class Box:
 	'''
-	Class Box:	Holds five boxes filled with Card objects. 
+	Class Box:	Holds the boxes (DEFAULT_BOXES, or the number of boxes of the deck) filled with Card objects. 
+				The boxes are in boxlist and also named box1, box2 ... up to the last box.
+				Cards added, edited or deleted through the Box methods are also updated in the
+				search index (search_index) and content hash index (hash_index) of the user if they are attached.
+				With a hash index attached, add_question refuses cards that duplicate an existing card.
 	
 	'''
-	def __init__(self, cardlist:list[Card]=None):
-		self.box1 = []
-		self.box2 = []
-		self.box3 = []
-		self.box4 = []
-		self.box5 = []
-		self.boxlist = [self.box1, self.box2, self.box3, self.box4, self.box5] #list of boxes for iterations
+	def __init__(self, cardlist:list[Card]=None, boxes:int=DEFAULT_BOXES):
+		check_box_count(boxes)
+		self.boxlist = [[] for _ in range(boxes)] #list of boxes for iterations
+		self.name_boxes()
+		self.search_index = None 	#SearchIndex kept up to date with added, edited and deleted cards
+		self.hash_index = None 		#HashIndex of card contents for duplicate checks
 		logger.info('An empty leitner box if created successfully.')
 
 		if cardlist is not None: #save cards in respective boxes if a list of card objects is given
+			log = logger.isEnabledFor(INFO)
 			for card in cardlist:
+				if card.box > boxes: 	#card of a deck with more boxes
+					card.change_box(boxes)
 				box_index = card.box-1
 				self.boxlist[box_index].append(card)
-				logger.info(f'Card {card.get_answer} added to box: {card.box}.')
+				if log:
+					logger.info('Card %s added to box: %s.', card.answer, card.box)
+
+	def name_boxes(self):
+		#box1, box2 ... attributes pointing at the lists of boxlist
+		number = 1
+		while hasattr(self, f'box{number}'):
+			delattr(self, f'box{number}')
+			number += 1
+		for number, individual_box in enumerate(self.boxlist, 1):
+			setattr(self, f'box{number}', individual_box)
+
+	def resize(self, boxes:int):
+		'''
+		Changes the number of boxes. The cards of removed boxes are moved to the new last box.
+		'''
+		check_box_count(boxes)
+		removed = self.boxlist[boxes:]
+		del self.boxlist[boxes:]
+		self.boxlist.extend([] for _ in range(boxes - len(self.boxlist)))
+		for card in chain.from_iterable(removed):
+			card.change_box(boxes)
+			self.boxlist[-1].append(card)
+		self.name_boxes()
+		logger.info('Box resized to %s boxes.', boxes)
 
 	def change_box(self, card:Card, new_box:int):
 		'''
@@ -93,18 +280,118 @@ class Box:
 		self.boxlist[curr_box_index].remove(card) #removing card from old box 
 		self.boxlist[new_box-1].append(card)	#adding card to the new box 
 		card.change_box(new_box) 				#changing the internal value of box correctly
-
-
-		logger.info(f'Card with answer: {card.get_answer()} is moved from box {card.box} to {new_box}')
+		if logger.isEnabledFor(INFO):
+			logger.info('Card with answer: %s is moved from box %s to %s', card.answer, curr_box_index+1, new_box)
 
 	def add_question(self, answer:str, question:list):
 		'''
 		Takes the answer and question(s) and creates a card object from it. 
 		It also appends it to box 1 (as it has no record of sessions)
+		Returns the new card, or None if the card is a duplicate of an existing card.
 		'''
+		if self.is_duplicate(answer, question):
+			logger.debug(f'Card for answer {answer} not added, it duplicates an existing card.')
+			return None
+
 		new_card = Card(answer, question) #creating card object
 		self.box1.append(new_card)	#adding card object to the correct box
 		logger.debug(f'Card for answer {new_card.get_answer} and question "{new_card.questions}" created and added to box1.')
+		if self.search_index is not None:
+			self.search_index.add_card(new_card)
+		if self.hash_index is not None:
+			self.hash_index.add_card(new_card)
+		return new_card
+
+	def is_duplicate(self, answer:str, question:list, card:Card=None) -> bool:
+		'''
+		True if another card than the passed one has the same content. Always False without a hash index.
+		'''
+		if self.hash_index is None:
+			return False
+		return self.hash_index.is_duplicate(answer, question, None if card is None else card.id)
+
+	def edit_card(self, card:Card, answer:str, question:list):
+		'''
+		Changes the answer and question(s) of a card.
+		'''
+		card.answer = answer
+		card.questions = question
+		if self.search_index is not None:
+			self.search_index.update_card(card)
+		if self.hash_index is not None:
+			self.hash_index.update_card(card)
+		logger.debug(f'Card {card.id} edited.')
+
+	def split_cards(self, card_ids) -> list:
+		'''
+		Takes the cards with the given ids out of every box in one pass (the boxes keep their order).
+		Returns the cards that were taken out.
+		'''
+		card_ids = set(card_ids)
+		taken = []
+		for individual_box in self.boxlist:
+			kept = []
+			for card in individual_box:
+				if card.id in card_ids:
+					taken.append(card)
+				else:
+					kept.append(card)
+			individual_box[:] = kept 	#in place, so box1, box2 ... keep pointing at the same lists
+		return taken
+
+	def delete_cards(self, card_ids) -> list:
+		'''
+		Bulk delete: removes all cards with the given ids in one O(n) pass over the boxes.
+		Returns the deleted cards.
+		'''
+		deleted = self.split_cards(card_ids)
+		for card in deleted:
+			if self.search_index is not None:
+				self.search_index.remove_card(card)
+			if self.hash_index is not None:
+				self.hash_index.remove_card(card)
+		logger.info('%s cards deleted.', len(deleted))
+		return deleted
+
+	def move_cards(self, card_ids, new_box:int) -> list:
+		'''
+		Bulk move: moves all cards with the given ids to new_box in one O(n) pass over the boxes.
+		Returns the moved cards.
+		'''
+		moved = self.split_cards(card_ids)
+		for card in moved:
+			card.change_box(new_box)
+		self.boxlist[new_box-1].extend(moved)
+		logger.info('%s cards moved to box %s.', len(moved), new_box)
+		return moved
+
+	def retag_cards(self, card_ids, add:list=(), remove:list=()) -> list:
+		'''
+		Bulk retag: adds and removes tags on all cards with the given ids in one pass over the boxes.
+		Returns the changed cards.
+		'''
+		card_ids = set(card_ids)
+		changed = []
+		for individual_box in self.boxlist:
+			for card in individual_box:
+				if card.id in card_ids:
+					tags = [tag for tag in card.tags if tag not in remove]
+					tags.extend(tag for tag in add if tag not in tags)
+					card.tags = tags
+					changed.append(card)
+		logger.info('%s cards retagged.', len(changed))
+		return changed
+
+	def remove_card(self, card:Card):
+		'''
+		Deletes the card from its box (and from the user's cards, as it is no longer saved).
+		'''
+		self.boxlist[card.box-1].remove(card)
+		if self.search_index is not None:
+			self.search_index.remove_card(card)
+		if self.hash_index is not None:
+			self.hash_index.remove_card(card)
+		logger.debug(f'Card {card.id} deleted from box {card.box}.')
 
 
 
@@ -3,6 +3,9 @@
 
 from tkinter import *
 from tkinter import messagebox
+import math
+
+from app.timers import TimerService
 
 from app.app_logging import get_logger
 logger = get_logger(__name__)
@@ -13,17 +16,23 @@ class PomodoroTimer:
 	Allows the user to set the focus and break times and also stores the total focus time for the user to keep track of their 
 	progress. 
 
+	The countdown is kept as a time.monotonic() deadline and the clock face is recomputed from it on every tick,
+	so the timer does not drift when the event loop is busy.
+
 	Args:
 		root:		frame inside the main window where the pomodorotimer will be implemented
 		userdata:	previous userdata about their activity in pomodoro timer 
+		timers:		TimerService of the app that drives the ticks. A private one is created if None.
 
 	'''
 
-	def __init__(self, root, userdata):
+	def __init__(self, root, userdata, timers=None):
 		logger.info('Creating Pomodoro timer')
 		
 		self.root = root				#frame where pomodoro clock will be implemented
 		self.userdata = userdata		#past user data
+		self.timers = TimerService(root) if timers is None else timers
+		self.clock = self.timers.clock	#same monotonic clock as the timer service
 
 		self.focus_time = 25*60			#default focus time in seconds
 		self.break_time = 5*60			#default break time in seconds
@@ -31,8 +40,11 @@ class PomodoroTimer:
 		self.remaining_time = 25*60		#remaining time in seconds (initially configured for default focus time)
 		self.running = False			#checks if the timer is currently running or not
 
+		self.deadline = None			#monotonic time when the running countdown reaches zero
+		self.started_at = None			#monotonic time when the timer was last started
+
 		self.work = False				#is focus time or break time
-		self.session_total = 0 			#total focus time for this session
+		self.session_total = 0 			#total focus time for this session (excluding the running stretch)
 
 		#Label for the frame title
 		Label(self.root, text='Pomodoro Timer:', font=('Ariel', 15, 'bold'), bg='white').place(x=7, y=4)
@@ -86,6 +98,8 @@ class PomodoroTimer:
 		self.focus_time = int(self.focus_time_new.get())*60 #setting the new focus time
 		self.focus_time_new.delete(0,END)					#clearing the Entry
 		self.remaining_time = self.focus_time     			#remaining time update
+		if self.running:									#a running clock continues from the new focus time
+			self.deadline = self.clock() + self.remaining_time
 		self.time_label.config(text=self.format_time()) #update clock implement with the new focus time
 
 	def get_breaktime(self):
@@ -97,37 +111,56 @@ class PomodoroTimer:
 
 	def update_timer(self):
 		'''
-		Main logic for the pomodoro timer. 
-		If the start is pressed (self.running is True), counts down from the total time remaining. 
-		Also updates the text clock face.
+		Main logic for the pomodoro timer, called by the timer service every second while running. 
+		Recomputes the remaining time from the deadline instead of counting down, 
+		then updates the text clock face and the session label.
+		When the countdown reaches zero the timer stops.
 		'''
 		if not self.running:				#Timer is not running
 			self.update_session_label()		#If work session, update the label that shows total focus time for the session
 			return
-		if self.running == True and self.remaining_time>0:	#timer is running and there is time left in focus/break time
-			self.remaining_time -= 1  						#counting down 1 second 
-			if self.work == True:							#if it is focus time, add to the session focus time
-				self.session_total += 1
-			self.time_label.config(text=self.format_time())	#update the text clock face
-			self.root.after(1000, self.update_timer)		#calling itself after the second to count down another session if running is still True
-		self.update_session_label()							#if not running, then update the focus time for the session
+
+		self.remaining_time = max(0, math.ceil(self.deadline - self.clock()))	#whole seconds left on the clock
+		self.time_label.config(text=self.format_time())	#update the text clock face
+
+		if self.remaining_time == 0:						#focus/break time is over
+			self.stop_clock()
+		self.update_session_label()
 
 	def start(self):	#starts the pomodoro timer
 		logger.info('Starting the pomodoro timer')
 		if self.remaining_time == self.focus_time:		#catergorizing focus time and break time 
 			self.work = True
-		if not self.running:							#Starts the timer if it is not already running
+		if not self.running and self.remaining_time > 0:	#Starts the timer if it is not already running
 			self.running = True
+			self.started_at = self.clock()
+			self.deadline = self.started_at + self.remaining_time
+			#ticking on whole seconds of the deadline; replaces any older tick job so chains can not stack
+			self.timers.schedule('pomodoro', self.update_timer, 1.0)
 			self.update_timer()							#Show the timer in the text clock face
 
 	def pause(self):	#pauses the timer
 		logger.info('Pausing the pomodoro timer')
+		if self.running:
+			self.remaining_time = max(0, math.ceil(self.deadline - self.clock()))
+			self.stop_clock()
+			self.update_session_label()
+
+	def stop_clock(self):
+		'''
+		Stops the ticking and moves the time of the stretch that just ran into the session total if it was focus time.
+		'''
+		self.timers.cancel('pomodoro')
+		if self.running and self.work:
+			self.session_total += min(self.clock(), self.deadline) - self.started_at
 		self.running = False
+		self.deadline = None
+		self.started_at = None
 
 	def reset(self):	#resets the timer and moves from focus to break or vice versa
 		logger.info('Resetting the pomodoro timer')
 
-		self.running = False									#first, stop the timer from ticking down
+		self.stop_clock()										#first, stop the timer from ticking down
 		if self.remaining_time == self.focus_time:				#True if it is focus time
 			self.remaining_time = self.break_time  				#Change to break time
 		else:													#Else change to focus time
@@ -139,8 +172,14 @@ class PomodoroTimer:
 	def update_session_label(self):								#updates clock face
 		self.session_label.config(text=self.get_session_text())
 
+	def get_session_total(self):								#Focus time for this session including the running stretch
+		if self.running and self.work:
+			return self.session_total + min(self.clock(), self.deadline) - self.started_at
+		return self.session_total
+
 	def get_session_text(self):									#Shows the amount of focus time for this session
-		return f'Work done this session: \n{int(self.session_total)//60}  mins and {int(self.session_total)%60} secs'
+		total = int(self.get_session_total())
+		return f'Work done this session: \n{total//60}  mins and {total%60} secs'
 
 	def get_previous_sessions(self):							#Extracts and returns user history of focus work
 		try:
@@ -153,6 +192,6 @@ class PomodoroTimer:
 
 	def save_session_time(self):								#saving user's session data in seconds
 		logger.debug('Saving user data for pomodoro session')
-		self.userdata['pomodoro'] += self.session_total
+		self.userdata['pomodoro'] += self.get_session_total()
 
 		
@@ -0,0 +1,249 @@
+#! python3
+# pool.py - Sharded study service: a front process routing every user to one of N worker processes.
+#				Every worker is a StudyServer (server.py) on a port of localhost, with its own interpreter, so grading,
+#				arranging and the JSON of the Database run in parallel instead of taking turns on one GIL.
+#				A user is routed by consistent hashing of the username (HashRing) and the tokens of a worker start
+#				with its index, so all requests of a user go to the one worker owning their Box and files:
+#				no locking across processes. The front only reads the request head and relays the bytes.
+#				restart(index) restarts a worker gracefully: the requests of its users wait, it writes back every workspace
+#				and exits, a new process takes its place. Its users log in again (the old tokens died with it).
+#
+# Usage: python -m app.pool [--workers CORES] [--host 127.0.0.1] [--port 8080] [--idle-timeout 600] [--memory-budget 256 (MB)]
+# SIGHUP restarts the workers one at a time.
+
+import asyncio, bisect, hashlib, json, multiprocessing, os, signal
+
+import app.auth as auth
+from app.database import Database
+from app.server import StudyServer, HTTPError, IDLE_TIMEOUT, IO_WORKERS, read_response, serve_connection
+from app.workspace import MEMORY_BUDGET
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+REPLICAS = 64 			#points of every shard on the hash ring
+STOP_TIMEOUT = 60 		#seconds a worker gets to save its users before it is terminated
+
+def ring_hash(key:str) -> int:
+	#Position of key on the ring, the same in every process (unlike hash())
+	return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+	'''
+	Consistent hashing of usernames onto shards 0 - shards-1. Every shard owns REPLICAS points of the ring,
+	a username belongs to the shard of the first point after its hash. With one more shard only the users
+	taken over by the new shard move.
+	'''
+	def __init__(self, shards:int, replicas:int=REPLICAS):
+		points = sorted((ring_hash(f'{shard}:{replica}'), shard) for shard in range(shards) for replica in range(replicas))
+		self.hashes = [point for point, _ in points]
+		self.shards = [shard for _, shard in points]
+
+	def shard_of(self, key:str) -> int:
+		return self.shards[bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)]
+
+def run_worker(connection, index:int, store_args:dict, database_factory, idle_timeout:float, io_workers:int, memory_budget:int):
+	#Entry point of a worker process. Ctrl+C is left to the front, which stops the workers after their users are saved
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	asyncio.run(serve_worker(connection, index, store_args, database_factory, idle_timeout, io_workers, memory_budget))
+
+async def serve_worker(connection, index:int, store_args:dict, database_factory, idle_timeout:float, io_workers:int,
+	memory_budget:int):
+	#Serves on a free port of localhost and sends the port to the front, writes back every workspace and exits on 'stop'
+	store = auth.get_store() if store_args is None else auth.CredentialStore(**store_args)
+	server = StudyServer(store, database_factory, idle_timeout, io_workers, memory_budget, token_prefix=f'{index}.')
+	await server.start('127.0.0.1', 0)
+	connection.send(server.port)
+	try:
+		await asyncio.get_running_loop().run_in_executor(None, connection.recv)
+	except EOFError: 		#the front is gone
+		pass
+	finally:
+		await server.close()
+		store.close()
+	try:
+		connection.send('stopped')
+	except OSError:
+		pass
+
+class Worker:
+	#A worker process as seen by the front: its port, the idle keep-alive connections to it and the requests in flight
+	def __init__(self, index:int):
+		self.index = index
+		self.process = None
+		self.control = None 		#front end of the pipe to the process
+		self.port = None
+		self.ready = asyncio.Event() 	#cleared while the worker (re)starts, requests wait for it
+		self.restarting = asyncio.Lock()
+		self.connections = [] 		#idle (reader, writer) connections
+		self.in_flight = 0
+		self.idle = asyncio.Event() 	#set while no request is in flight, stop_worker waits for it
+		self.idle.set()
+
+def encode_request(method:str, path:str, headers:dict, body:bytes) -> bytes:
+	authorization = headers.get('authorization')
+	return (f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n'
+		+ (f'Authorization: {authorization}\r\n' if authorization else '') + '\r\n').encode() + body
+
+class ShardedServer:
+	'''
+	The front process of the sharded study service, with the endpoints of StudyServer. start() starts the workers
+	and listens on host:port (port 0: any free port, see self.port), close() saves every user and stops the workers.
+
+	Args:
+		workers:			number of worker processes (the cores of the machine if None)
+		store_args:			keyword arguments of the auth.CredentialStore of every worker (the default store of auth if None)
+		database_factory:	callable username -> Database of the workers, it has to be picklable (a class or a partial)
+		idle_timeout:		seconds without a request before a worker expires a token and writes back a workspace
+		io_workers:			threads for the blocking file I/O of every worker
+		memory_budget:		estimated bytes of the cached workspaces of every worker
+	'''
+	def __init__(self, workers:int=None, store_args:dict=None, database_factory=Database,
+		idle_timeout:float=IDLE_TIMEOUT, io_workers:int=IO_WORKERS, memory_budget:int=MEMORY_BUDGET):
+		count = workers or os.cpu_count() or 1
+		self.worker_args = (store_args, database_factory, idle_timeout, io_workers, memory_budget)
+		self.context = multiprocessing.get_context('spawn') 	#no threads or event loop copied into the workers
+		self.ring = HashRing(count)
+		self.workers = [Worker(index) for index in range(count)]
+		self.server = None
+		self.port = None
+
+	async def start(self, host:str='127.0.0.1', port:int=8080):
+		await asyncio.gather(*map(self.start_worker, self.workers))
+		self.server = await asyncio.start_server(self.handle, host, port)
+		self.port = self.server.sockets[0].getsockname()[1]
+		logger.info(f'Sharded study service listening on {host}:{self.port} with {len(self.workers)} workers')
+
+	async def close(self):
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+		await asyncio.gather(*map(self.stop_worker, self.workers))
+		logger.info('Sharded study service stopped')
+
+	#Workers
+	async def start_worker(self, worker:Worker):
+		loop = asyncio.get_running_loop()
+		worker.control, connection = self.context.Pipe()
+		worker.process = self.context.Process(target=run_worker, args=(connection, worker.index, *self.worker_args),
+			name=f'study-worker-{worker.index}', daemon=True)
+		worker.process.start()
+		connection.close()
+		worker.port = await loop.run_in_executor(None, worker.control.recv)
+		worker.ready.set()
+		logger.info(f'Worker {worker.index} (pid {worker.process.pid}) serving on port {worker.port}')
+
+	async def stop_worker(self, worker:Worker):
+		#Waits for the requests in flight, then lets the worker save its users and exit
+		loop = asyncio.get_running_loop()
+		worker.ready.clear()
+		await worker.idle.wait()
+		for _, writer in worker.connections:
+			writer.close()
+		worker.connections.clear()
+		try:
+			worker.control.send('stop')
+			if await loop.run_in_executor(None, worker.control.poll, STOP_TIMEOUT):
+				await loop.run_in_executor(None, worker.control.recv)
+			else:
+				logger.error(f'Worker {worker.index} did not stop within {STOP_TIMEOUT} s, terminating it')
+				worker.process.terminate()
+		except (OSError, EOFError): 		#the process had died
+			pass
+		await loop.run_in_executor(None, worker.process.join)
+		worker.control.close()
+
+	async def restart(self, index:int):
+		#Graceful restart of worker index: its users are saved by the old process before the new one serves them
+		worker = self.workers[index]
+		async with worker.restarting:
+			logger.info(f'Restarting worker {index}')
+			await self.stop_worker(worker)
+			await self.start_worker(worker)
+
+	async def restart_all(self):
+		#Rolling restart, one worker at a time, the users of the other workers are not held up
+		for index in range(len(self.workers)):
+			await self.restart(index)
+
+	#Routing
+	def route(self, path:str, headers:dict, body:bytes) -> Worker:
+		#Worker of the user of a request: by the username for a login, by the prefix of the token for the rest
+		if path == '/login':
+			try:
+				username = json.loads(body).get('username')
+			except (ValueError, AttributeError):
+				username = None
+			return self.workers[self.ring.shard_of(username if isinstance(username, str) else '')]
+		scheme, _, token = headers.get('authorization', '').partition(' ')
+		index, dot, _ = token.partition('.')
+		if scheme.lower() != 'bearer' or not dot or not index.isdigit() or int(index) >= len(self.workers):
+			raise HTTPError(401, 'Log in first')
+		return self.workers[int(index)]
+
+	async def forward(self, worker:Worker, method:str, path:str, headers:dict, body:bytes) -> tuple:
+		await worker.ready.wait()
+		worker.in_flight += 1
+		worker.idle.clear()
+		try:
+			if worker.connections:
+				reader, writer = worker.connections.pop()
+			else:
+				try:
+					reader, writer = await asyncio.open_connection('127.0.0.1', worker.port)
+				except OSError as error: 	#e.g. refused by a worker that died
+					raise HTTPError(502, f'Worker {worker.index} unreachable: {error}')
+			try:
+				writer.write(encode_request(method, path, headers, body))
+				await writer.drain()
+				response = await read_response(reader)
+			except (ConnectionError, asyncio.IncompleteReadError) as error:
+				writer.close()
+				raise HTTPError(502, f'Worker {worker.index} failed: {error}')
+			worker.connections.append((reader, writer))
+			return response
+		finally:
+			worker.in_flight -= 1
+			if not worker.in_flight:
+				worker.idle.set()
+
+	async def respond(self, method:str, path:str, headers:dict, body:bytes) -> tuple:
+		worker = None
+		try:
+			worker = self.route(path, headers, body)
+			return await self.forward(worker, method, path, headers, body)
+		except HTTPError as error:
+			if error.status == 502 and not worker.process.is_alive() and not worker.restarting.locked():
+				logger.error(f'Worker {worker.index} died, restarting it')
+				asyncio.ensure_future(self.restart(worker.index))
+			return error.status, json.dumps({'error': error.message}).encode()
+
+	async def handle(self, reader, writer):
+		await serve_connection(reader, writer, self.respond)
+
+async def serve(workers:int, host:str, port:int, idle_timeout:float, memory_budget:int):
+	server = ShardedServer(workers, idle_timeout=idle_timeout, memory_budget=memory_budget)
+	await server.start(host, port)
+	asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(server.restart_all()))
+	try:
+		await asyncio.Event().wait()
+	finally:
+		await server.close()
+
+def main(argv=None):
+	import argparse
+	parser = argparse.ArgumentParser(description='Sharded multi-process study service of Leitner BoB.')
+	parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8080)
+	parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT)
+	parser.add_argument('--memory-budget', type=float, default=MEMORY_BUDGET/2**20, help='MB of cached workspaces per worker')
+	args = parser.parse_args(argv)
+	try:
+		asyncio.run(serve(args.workers, args.host, args.port, args.idle_timeout, int(args.memory_budget*2**20)))
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+if __name__ == '__main__':
+	raise SystemExit(main())
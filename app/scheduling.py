@@ -0,0 +1,386 @@
+#! python3
+# scheduling.py - Scheduling algorithms: which cards a session asks and which box every card belongs in.
+#				leitner:	the original rules, fixed quotas per box and boxes by the sum of the 10 session history (default)
+#				sm2:		SuperMemo 2, with repetitions, interval and ease factor per card
+#				fsrs:		FSRS-style memory model, with stability, difficulty and retrievability per card
+#				sm2 and fsrs keep a short list per card in card.state (e.g. ['sm2', 3, 16, 2.36, 20391]).
+#				The states of the whole box are read into numpy arrays, and updated and re-boxed in one go.
+#				Cards are put in the boxes by interval/stability, so the rest of the app works with any algorithm.
+#				The tables below are the ones of the default 5 boxes, for decks with another number of boxes
+#				(models.MIN_BOXES - MAX_BOXES) the quotas, thresholds and intervals are derived from the box count.
+
+import gc, math, random, time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from itertools import chain, repeat
+from operator import attrgetter, is_, itemgetter
+
+import numpy as np
+
+from app.models import Box
+
+#Leitner: cards per box (box1 - box5) for the session sizes, sessions of other sizes use DEFAULT_ALLOCATION
+SESSION_ALLOCATIONS = {10: [4, 3, 2, 1, 0], 20: [8, 6, 4, 2, 0], 50: [20, 14, 9, 5, 2]}
+DEFAULT_ALLOCATION = [40, 28, 18, 10, 4]
+#Leitner: (minimum correct answers in the 10 session history, box), checked in order; cards below all of them go to box 1
+BOX_THRESHOLDS = [(8, 5), (6, 4), (4, 3), (2, 2)]
+#sm2 and fsrs: cards with an interval/stability (days) from 1 are in box 2, from 3 in box 3, from 7 in box 4, from 21 in box 5
+BOX_INTERVALS = [1, 3, 7, 21]
+ALLOCATION_WEIGHT = 1.5 	#derived quotas: box k of n gets a share of the session in proportion to (n - k + 1)**ALLOCATION_WEIGHT
+
+def session_allocation(total_question:int, boxes:int, allocations:dict=None) -> list:
+	'''
+	Leitner: number of cards per box for a session. SESSION_ALLOCATIONS (or the allocations table given, and
+	DEFAULT_ALLOCATION) for a deck with as many boxes as the tables, else total_question cards shared out with
+	the lower boxes getting more. With 5 boxes the derived quotas are the ones of the tables.
+	'''
+	allocation = (SESSION_ALLOCATIONS if allocations is None else allocations).get(total_question, DEFAULT_ALLOCATION)
+	if len(allocation) == boxes:
+		return allocation
+	weights = [(boxes - k)**ALLOCATION_WEIGHT for k in range(boxes)]
+	allocation = [round(total_question*weight/sum(weights)) for weight in weights]
+	excess = sum(allocation) - total_question
+	for k in range(boxes - 1, -1, -1): 	#rounding errors are taken from the highest boxes
+		if excess <= 0:
+			break
+		taken = min(excess, allocation[k])
+		allocation[k] -= taken
+		excess -= taken
+	allocation[0] -= min(excess, 0) 	#or given to box 1
+	return allocation
+
+def box_thresholds(boxes:int, thresholds:list=None) -> list:
+	#Leitner: BOX_THRESHOLDS (or the thresholds given) for a deck of boxes boxes, else box k needs 10*(k-1)/boxes
+	#correct answers (rounded)
+	thresholds = BOX_THRESHOLDS if thresholds is None else thresholds
+	if len(thresholds) == boxes - 1:
+		return thresholds
+	return [(round(10*(number - 1)/boxes), number) for number in range(boxes, 1, -1)]
+
+def box_intervals(boxes:int) -> list:
+	#sm2 and fsrs: BOX_INTERVALS for a deck of boxes boxes, spread evenly on a log scale over the same 1 - 21 days
+	if len(BOX_INTERVALS) == boxes - 1:
+		return BOX_INTERVALS
+	if boxes == 2:
+		return BOX_INTERVALS[:1]
+	return [BOX_INTERVALS[-1]**(j/(boxes - 2)) for j in range(boxes - 1)]
+
+def today() -> float:
+	#Current day number (days since the epoch, with the fraction of the day)
+	return time.time()/86400
+
+def all_cards(box:Box) -> list:
+	return list(chain.from_iterable(box.boxlist))
+
+@contextmanager
+def gc_paused():
+	#The passes over a whole deck make a short lived object per card, at 1M cards the garbage collector
+	#would otherwise run many times over all of them. Nothing made there is part of a reference cycle
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		yield
+	finally:
+		if enabled:
+			gc.enable()
+
+class Scheduler(ABC):
+	'''
+	Interface of the scheduling algorithms. logic.get_session_cards and logic.arrange_boxes delegate to
+	the active scheduler (logic.use_scheduler).
+
+	Args:
+		clock:	function returning the current day number, today() if None (simulations pass their own)
+		rng:	random.Random the cards are drawn with, the random module if None (simulations pass a seeded one)
+	'''
+	name = None
+	label = None 	#name shown to the user
+	analytics = None 	#analytics.DeckAnalytics of the deck, if the recall estimates of the cards should be used
+
+	def __init__(self, clock=None, rng=None):
+		self.clock = clock or today
+		self.rng = rng or random
+
+	@abstractmethod
+	def select(self, box:Box, total_question:int) -> list:
+		#Cards for a session of total_question questions, in random order
+		...
+
+	@abstractmethod
+	def arrange(self, box:Box) -> int:
+		#Applies the answers of the sessions since the last call and moves the cards to their boxes.
+		#Returns the number of moved cards
+		...
+
+class LeitnerScheduler(Scheduler):
+	'''
+	The original Leitner rules: fixed quotas per box for a session (session_allocation) and boxes by the
+	number of correct answers in the last 10 sessions (box_thresholds).
+	The cards of a box are picked at random, or with analytics attached, weighted to the cards least likely recalled
+	and to the cards answered right but slowly.
+
+	Args:
+		allocations:	session size -> cards per box, in place of SESSION_ALLOCATIONS (e.g. a tuned variant)
+		thresholds:		(minimum correct answers, box) pairs, in place of BOX_THRESHOLDS
+	'''
+	MIN_WEIGHT = 0.05 	#weight of a card sure to be recalled, so every card can still be asked
+	SLOW_WEIGHT = 0.25 	#extra weight of a card answered right but slowly (analytics.SLOW_QUANTILE), it is not fluent yet
+	name = 'leitner'
+	label = 'Leitner boxes'
+
+	def __init__(self, clock=None, rng=None, allocations:dict=None, thresholds:list=None):
+		super().__init__(clock, rng)
+		self.allocations = allocations
+		self.thresholds = thresholds
+
+	def select(self, box:Box, total_question:int) -> list:
+		session_cards = []
+
+		#how many quesitons from every box according to total cards of the session
+		box_allocation = session_allocation(total_question, len(box.boxlist), self.allocations)
+
+		curr_num = 0 #record of how many questions need to be loaded
+
+		for i in range(len(box.boxlist), 0, -1): #working in reverse: in beginning the high boxes might not have enough questions
+			if box_allocation[i-1] == 0: #if zero questions are required, skip logic
+				continue
+			else:
+				curr_num = curr_num + box_allocation[i-1]
+				box_length = len(box.boxlist[i-1])
+
+				if curr_num <= box_length: #there are enough questions in the box to fulfill requirement
+					cards = self.sample(box.boxlist[i-1], curr_num)
+					session_cards.extend(cards)
+					curr_num = 0 #all required questions got
+				else: #not enough questions
+					if box_length == 0:
+						continue
+					else:
+						session_cards.extend(box.boxlist[i-1])
+						curr_num -= box_length #number of cards required remaining
+
+		self.rng.shuffle(session_cards) #shuffle the questions
+		return session_cards
+
+	def sample(self, cards:list, count:int) -> list:
+		if self.analytics is None:
+			return self.rng.sample(cards, count)
+		#weighted sampling without replacement: the count largest of random^(1/weight)
+		analysis = self.analytics.get()
+		card_ids = [card.id for card in cards]
+		weights = 1 - analysis.recall_of(card_ids) + self.MIN_WEIGHT + self.SLOW_WEIGHT*analysis.slow_of(card_ids)
+		keys = np.random.default_rng(self.rng.getrandbits(32)).random(len(cards))**(1/weights)
+		chosen = np.argpartition(-keys, count - 1)[:count] if count < len(cards) else np.arange(len(cards))
+		return [cards[index] for index in chosen.tolist()]
+
+	def arrange(self, box:Box) -> int:
+		cards_to_move = []
+		#box for every possible number of correct answers (0 - 10)
+		thresholds = box_thresholds(len(box.boxlist), self.thresholds)
+		targets = [next((target for minimum, target in thresholds if correct >= minimum), 1) for correct in range(11)]
+
+		for box_index, individual_box in enumerate(box.boxlist):
+			for card in individual_box:
+				if card.pending:
+					card.pending.clear() 	#the history is all the leitner rules need
+
+				card_value = card.log.recent.bit_count() 	#correct answers of the history, from its packed bits
+				target_box = targets[min(card_value, 10)]
+
+				if card.box != target_box:
+					cards_to_move.append((card, target_box))
+
+		for card, target_box in cards_to_move:
+			box.change_box(card, target_box)
+		return len(cards_to_move)
+
+class ArrayScheduler(Scheduler):
+	'''
+	Base of the schedulers with a numeric state per card: card.state = [name, value of every field in fields].
+	Cards without a state of this scheduler are new to it: they stay in their box until they are answered.
+	Subclasses vectorize over the rows of a (cards x fields) array:
+		update(states, new, correct, now):	the states after one answer per row (new: rows without a state yet)
+		priority(states, new, now):			session order, the lowest first
+		box_of(states, boxes):				box (1 - boxes) of every row
+	'''
+	fields = ()
+	digits = () 	#decimals kept per field in card.state (0: stored as int)
+	initial = () 	#values of a new card, only used to fill the arrays
+
+	def read_states(self, card_states:list) -> tuple:
+		#(states array, new mask) of the card.state values of the cards
+		name = self.name
+		blank = [name, *self.initial]
+		rows = [state if state is not None and state[0] == name else blank for state in card_states]
+		count = len(rows)
+		new = np.fromiter(map(is_, rows, repeat(blank)), bool, count)
+		values = np.fromiter(chain.from_iterable(map(itemgetter(slice(1, None)), rows)), float, count*len(self.fields))
+		return values.reshape(count, len(self.fields)), new
+
+	def encode_state(self, values) -> list:
+		#card.state of a row of the states array, rounded so the files stay small
+		return [self.name] + [int(round(value)) if digits == 0 else round(value, digits)
+			for value, digits in zip(values, self.digits)]
+
+	def select(self, box:Box, total_question:int) -> list:
+		cards = all_cards(box)
+		if not cards or total_question <= 0:
+			return []
+		with gc_paused():
+			states, new = self.read_states(list(map(attrgetter('state'), cards)))
+		#a tiny random part breaks ties (e.g. between new cards) in a different way every session
+		keys = self.priority(states, new, self.clock()) + np.random.default_rng(self.rng.getrandbits(32)).random(len(cards))*1e-6
+		count = min(total_question, len(cards))
+		chosen = np.argpartition(keys, count - 1)[:count] if count < len(cards) else np.arange(len(cards))
+		session_cards = [cards[index] for index in chosen.tolist()]
+		self.rng.shuffle(session_cards)
+		return session_cards
+
+	def arrange(self, box:Box) -> int:
+		with gc_paused():
+			return self.arrange_cards(box)
+
+	def arrange_cards(self, box:Box) -> int:
+		cards = all_cards(box)
+		if not cards:
+			return 0
+		now = self.clock()
+		#the one pass over the card objects: at 1M cards every pass costs more than all the numpy work
+		records = list(map(attrgetter('state', 'pending'), cards))
+		pending = list(map(itemgetter(1), records))
+		states, new = self.read_states(list(map(itemgetter(0), records)))
+
+		answered = np.flatnonzero(np.fromiter(map(bool, pending), bool, len(cards))).tolist()
+		reviewed = answered
+		answer = 0
+		while reviewed: 	#one vectorized update per answer, most cards are answered once between two calls
+			rows = np.array(reviewed)
+			correct = np.array([pending[index][answer] for index in reviewed], dtype=bool)
+			states[rows] = self.update(states[rows], new[rows], correct, now)
+			new[rows] = False
+			answer += 1
+			reviewed = [index for index in reviewed if len(pending[index]) > answer]
+
+		for index, values in zip(answered, states[answered].tolist()):
+			cards[index].state = self.encode_state(values)
+			pending[index].clear()
+
+		boxes = len(box.boxlist)
+		sources = np.repeat(np.arange(1, boxes + 1), [len(individual_box) for individual_box in box.boxlist])
+		targets = np.where(new, sources, self.box_of(states, boxes))
+		return rebox(box, cards, sources, targets)
+
+MAX_DELETES = 512 	#a box losing more cards than this is rebuilt instead of deleting the cards one by one
+
+def rebox(box:Box, cards:list, sources, targets) -> int:
+	'''
+	Moves the cards (all_cards(box)) from their box (sources) to their target box (targets), appending them
+	to the target box like Box.change_box. Only the moved cards are touched: a box loses its cards by position.
+	Returns the number of moved cards.
+	'''
+	moved = np.flatnonzero(targets != sources)
+	if not len(moved):
+		return 0
+	incoming = [[] for _ in box.boxlist]
+	for index, target in zip(moved.tolist(), targets[moved].tolist()):
+		card = cards[index]
+		card.box = target
+		incoming[target-1].append(card)
+
+	offset = 0
+	for number, individual_box in enumerate(box.boxlist, 1):
+		leaving = (moved[sources[moved] == number] - offset).tolist()
+		offset += len(individual_box)
+		if len(leaving) > MAX_DELETES:
+			kept = np.delete(np.arange(len(individual_box)), leaving).tolist()
+			individual_box[:] = list(map(individual_box.__getitem__, kept)) 	#in place, box1, box2 ... keep their lists
+		else:
+			for position in reversed(leaving):
+				del individual_box[position]
+	for individual_box, cards_in in zip(box.boxlist, incoming):
+		individual_box.extend(cards_in)
+	return len(moved)
+
+class SM2Scheduler(ArrayScheduler):
+	'''
+	SuperMemo 2. A correct answer counts as grade 4 and a wrong one as grade 1 (the app only knows right and wrong).
+	Cards are due on their due day, the most overdue ones are asked first, then new cards, then cards ahead of time.
+	'''
+	name = 'sm2'
+	label = 'SM-2'
+	fields = ('repetitions', 'interval', 'ease', 'due')
+	digits = (0, 0, 3, 0)
+	initial = (0, 0, 2.5, 0)
+	GRADES = (1, 4) 	#grade of a wrong and of a correct answer
+	MIN_EASE = 1.3
+
+	def update(self, states, new, correct, now):
+		repetitions, interval, ease, due = states.T
+		grade = np.where(correct, self.GRADES[1], self.GRADES[0])
+		next_interval = np.where(repetitions == 0, 1, np.where(repetitions == 1, 6, np.rint(interval*ease)))
+		interval = np.where(correct, next_interval, 1)
+		repetitions = np.where(correct, repetitions + 1, 0)
+		ease = np.maximum(self.MIN_EASE, ease + 0.1 - (5 - grade)*(0.08 + (5 - grade)*0.02))
+		return np.column_stack([repetitions, interval, ease, math.floor(now) + interval])
+
+	def priority(self, states, new, now):
+		return np.where(new, 0.5, states[:, 3] - math.floor(now))
+
+	def box_of(self, states, boxes):
+		return np.where(states[:, 0] == 0, 1, np.searchsorted(box_intervals(boxes), states[:, 1], side='right') + 1)
+
+class FSRSScheduler(ArrayScheduler):
+	'''
+	FSRS-style memory model (the FSRS 4.5 formulas and default weights). A card t days after its last review
+	is recalled with probability R = (1 + FACTOR*t/S)^DECAY, so the stability S is the interval at which R
+	drops to 90%. Answers are graded Again (wrong) or Good (correct). Cards with the lowest R are asked first,
+	cards under RETENTION are due.
+	'''
+	name = 'fsrs'
+	label = 'FSRS'
+	fields = ('stability', 'difficulty', 'last_review', 'reviews')
+	digits = (4, 4, 3, 0)
+	initial = (0, 0, 0, 0)
+	WEIGHTS = (0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474, 0.1367, 1.0461, 2.1072,
+		0.0793, 0.3246, 1.587, 0.2272, 2.8755)
+	DECAY = -0.5
+	FACTOR = 19/81
+	RETENTION = 0.9
+	GRADES = (1, 3) 	#Again and Good
+
+	def retrievability(self, states, now):
+		elapsed = np.maximum(now - states[:, 2], 0)
+		return (1 + self.FACTOR*elapsed/np.maximum(states[:, 0], 0.01))**self.DECAY
+
+	def update(self, states, new, correct, now):
+		w = self.WEIGHTS
+		stability, difficulty = np.maximum(states[:, 0], 0.01), np.clip(states[:, 1], 1, 10) 	#new rows are replaced below
+		grade = np.where(correct, self.GRADES[1], self.GRADES[0])
+		recall = self.retrievability(states, now)
+
+		recalled_stability = stability*(1 + math.exp(w[8])*(11 - difficulty)*stability**-w[9]
+			*(np.exp(w[10]*(1 - recall)) - 1))
+		forgotten_stability = np.minimum(stability, w[11]*difficulty**-w[12]*((stability + 1)**w[13] - 1)
+			*np.exp(w[14]*(1 - recall)))
+		next_stability = np.where(correct, recalled_stability, forgotten_stability)
+		next_difficulty = w[7]*w[4] + (1 - w[7])*(difficulty - w[6]*(grade - 3)) 	#mean reversion to the initial difficulty
+
+		#first answer: initial stability and difficulty of the grade
+		next_stability = np.where(new, np.array(w)[grade - 1], next_stability)
+		next_difficulty = np.where(new, w[4] - (grade - 3)*w[5], next_difficulty)
+		return np.column_stack([np.maximum(next_stability, 0.01), np.clip(next_difficulty, 1, 10),
+			np.full(len(states), now), states[:, 3] + 1])
+
+	def priority(self, states, new, now):
+		return np.where(new, self.RETENTION, self.retrievability(states, now))
+
+	def box_of(self, states, boxes):
+		return np.searchsorted(box_intervals(boxes), states[:, 0], side='right') + 1
+
+SCHEDULERS = {scheduler.name: scheduler for scheduler in (LeitnerScheduler, SM2Scheduler, FSRSScheduler)}
+
+def get_scheduler(name:str, clock=None, rng=None, **options) -> Scheduler:
+	#options: arguments of the scheduler class (allocations and thresholds of the Leitner rules)
+	if name not in SCHEDULERS:
+		raise ValueError(f'Unknown scheduler: {name}')
+	return SCHEDULERS[name](clock, rng, **options)
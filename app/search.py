@@ -0,0 +1,190 @@
+#! python3
+# search.py - In-process full-text search over a user's cards.
+#				An inverted index (token -> card ids) plus a trigram index over the vocabulary
+#				for substring and typo-tolerant lookup.
+
+import heapq, json, math, os, re
+from collections import defaultdict
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MAX_EXPANSIONS = 20 		#vocabulary words a fuzzy or substring query word can expand to
+MIN_SIMILARITY = 0.4		#trigram similarity (dice) needed for a typo match
+
+def tokenize(text) -> list:
+	#Casefolded words of the text
+	if not text:
+		return []
+	return TOKEN_PATTERN.findall(str(text).casefold())
+
+def trigrams(word) -> set:
+	#Trigrams of the word padded with $ so short words and word starts/ends are matched too
+	padded = f'${word}$'
+	return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+def card_tokens(answer, questions) -> list:
+	'''
+	Searchable words of a card: the answer, the input question and the MCQ question with its options.
+	Takes the answer and questions of a Card (or of its dict) and returns the unique tokens.
+	'''
+	words = tokenize(answer)
+	for question in questions:
+		words.extend(tokenize(question))		#the MCQ's commas are split away like any other punctuation
+	return list(dict.fromkeys(words))
+
+class SearchIndex:
+	'''
+	Search index over the cards of one user.
+	Kept up to date incrementally through add_card/update_card/remove_card and persisted as a json file
+	holding the tokens of every card; the posting lists are rebuilt from it on load.
+
+	Args:
+		path:	json file the index is saved to (None for an in-memory index)
+	'''
+	def __init__(self, path:str=None):
+		self.path = path
+		self.docs = {}						#card id -> tuple of tokens
+		self.postings = defaultdict(set)	#token -> card ids
+		self.grams = defaultdict(set)		#trigram -> tokens of the vocabulary
+		self.dirty = False 					#changed since last save
+		self.stamp = None 					#Database.cards_stamp() of the cards file the index matches
+
+	def __len__(self):
+		return len(self.docs)
+
+	def add(self, card_id, answer, questions):
+		#Adds or replaces the document of a card
+		if card_id in self.docs:
+			self.remove(card_id)
+
+		self.insert_tokens(card_id, tuple(card_tokens(answer, questions)))
+		self.dirty = True
+
+	def insert_tokens(self, card_id, tokens:tuple):
+		#Adds an already tokenized card to the posting lists and the trigram index
+		self.docs[card_id] = tokens
+		for token in tokens:
+			postings = self.postings[token]
+			if not postings:				#new word in the vocabulary
+				for gram in trigrams(token):
+					self.grams[gram].add(token)
+			postings.add(card_id)
+
+	def remove(self, card_id):
+		tokens = self.docs.pop(card_id, None)
+		if tokens is None:
+			return
+
+		for token in tokens:
+			postings = self.postings[token]
+			postings.discard(card_id)
+			if not postings:				#word left the vocabulary
+				del self.postings[token]
+				for gram in trigrams(token):
+					self.grams[gram].discard(token)
+					if not self.grams[gram]:
+						del self.grams[gram]
+		self.dirty = True
+
+	def add_card(self, card):
+		self.add(card.id, card.answer, card.questions)
+
+	def update_card(self, card):
+		self.add(card.id, card.answer, card.questions)
+
+	def remove_card(self, card):
+		self.remove(card.id)
+
+	def expand(self, word) -> list:
+		'''
+		Vocabulary words matching a query word with their match quality (0-1):
+		the word itself (1.0), words containing it (0.9) and words with similar trigrams (their similarity).
+		'''
+		if word in self.postings:
+			return [(word, 1.0)]
+
+		query_grams = trigrams(word)
+		shared = defaultdict(int)
+		for gram in query_grams:
+			for token in self.grams.get(gram, ()):
+				shared[token] += 1
+
+		matches = []
+		for token, count in shared.items():
+			if word in token:
+				matches.append((token, 0.9))
+			else:
+				similarity = 2*count/(len(query_grams) + len(token))	#dice of the trigram sets (a word has len(word) trigrams)
+				if similarity >= MIN_SIMILARITY:
+					matches.append((token, similarity))
+		return heapq.nlargest(MAX_EXPANSIONS, matches, key=lambda match: match[1])
+
+	def search(self, query:str, limit:int=100, within=None) -> list:
+		'''
+		Returns up to limit card ids for the query, best match first.
+		If within (a set of card ids) is given, only those cards are considered.
+		Cards matching every query word rank first, if there are none, cards matching any word are returned.
+		The score of a card is the sum of idf x match quality of the query words it contains.
+		'''
+		words = tokenize(query)
+		if not words or not self.docs:
+			return []
+
+		total = len(self.docs)
+		word_scores = []				#per query word: card id -> best score for this word
+		for word in dict.fromkeys(words):
+			scores = {}
+			for token, quality in self.expand(word):
+				postings = self.postings[token]
+				score = quality*math.log(1 + total/len(postings))
+				for card_id in postings:
+					if scores.get(card_id, 0) < score:
+						scores[card_id] = score
+			word_scores.append(scores)
+
+		word_scores.sort(key=len)		#intersecting from the rarest word
+		candidates = set(word_scores[0])
+		if within is not None:
+			candidates.intersection_update(within)
+		for scores in word_scores[1:]:
+			candidates.intersection_update(scores)
+		if not candidates:				#no card has every word
+			candidates = set().union(*word_scores)
+			if within is not None:
+				candidates.intersection_update(within)
+
+		ranked = heapq.nlargest(limit, candidates,
+			key=lambda card_id: sum(scores.get(card_id, 0) for scores in word_scores))
+		logger.debug(f'Search for "{query}" returned {len(ranked)} cards')
+		return ranked
+
+	def save(self):
+		#Writes the index to its file if it changed
+		if self.path is None or not self.dirty:
+			return
+
+		temp_path = self.path + '.tmp'
+		with open(temp_path, 'w') as file:
+			file.write(json.dumps({'version': 1, 'docs': self.docs, 'cards': self.stamp}))	#one encoder call, much faster than json.dump
+		os.replace(temp_path, self.path)	#never leaving a half written index behind
+		self.dirty = False
+		logger.debug(f'Search index with {len(self.docs)} cards saved to {self.path}')
+
+	@classmethod
+	def load(cls, path:str):
+		'''
+		Reads an index saved by save(). Returns None if the file is missing or unreadable.
+		'''
+		try:
+			with open(path, 'r') as file:
+				data = json.load(file)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return None
+
+		index = cls(path)
+		index.stamp = data.get('cards') 	#None for indexes saved before the stamp
+		for card_id, tokens in data['docs'].items():
+			index.insert_tokens(card_id, tuple(tokens))
+		return index
@@ -0,0 +1,306 @@
+#! python3
+# server.py - Multi-user study service: HTTP/JSON on asyncio, standard library only.
+#				One event loop serves every learner. The workspaces of the users (their Database, loaded Box,
+#				user data and scheduler, workspace.py) are kept in a WorkspaceCache under a memory budget, a user
+#				logging in again or coming back finds theirs loaded. Workspaces are written back when the cache
+#				evicts them: least recently used first when over the budget, after IDLE_TIMEOUT seconds without a
+#				request, and on close. Tokens expire after IDLE_TIMEOUT seconds without a request.
+#				Password checks run on the credential store's pool, file I/O (loading and writing back workspaces)
+#				on the server's I/O pool, so the loop only grades answers and picks cards.
+#
+# Endpoints (JSON bodies, the token of /login as "Authorization: Bearer TOKEN"):
+#	POST /login		{"username", "password"}	-> {"token", "boxes"}
+#	POST /session	{"questions": 10}			-> {"questions"}				starts a session
+#	GET  /card									-> {"position", "total", "question", "options"} or {"done": true}
+#	POST /answer	{"answer"}					-> {"correct", "answer", "score", "remaining", "done"}
+#	GET  /stats									-> {"boxes", "sessions", "scores", "session"}
+#	POST /logout								-> {"logged_out": true}
+#
+# Usage: python -m app.server [--host 127.0.0.1] [--port 8080] [--idle-timeout 600] [--memory-budget 256 (MB)]
+
+import asyncio, json, secrets, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+import app.auth as auth
+import app.grading as grading
+from app.database import Database
+from app.forecast import SESSION_SIZES
+from app.workspace import Workspace, WorkspaceCache, open_workspace, MEMORY_BUDGET
+import app.metrics as metrics
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+IDLE_TIMEOUT = 600 		#seconds without a request before a user's workspace is written back and dropped
+IO_WORKERS = 8 			#threads for the blocking file I/O
+MAX_BODY = 64*1024 		#bytes of a request body
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 405: 'Method Not Allowed',
+	409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error', 502: 'Bad Gateway'}
+
+class HTTPError(Exception):
+	def __init__(self, status:int, message:str):
+		super().__init__(message)
+		self.status = status
+		self.message = message
+
+async def read_head(reader) -> tuple:
+	#Start line and lower-cased headers of the next request or response, (None, None) once the peer closed the connection
+	start_line = await reader.readline()
+	if not start_line:
+		return None, None
+	headers = {}
+	while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+		name, _, value = line.decode('latin-1').partition(':')
+		headers[name.strip().lower()] = value.strip()
+	return start_line.decode('latin-1').split(), headers
+
+async def read_body(reader, headers:dict) -> bytes:
+	length = int(headers.get('content-length', 0))
+	if length > MAX_BODY:
+		raise HTTPError(413, 'Request body too large')
+	return await reader.readexactly(length) if length else b''
+
+async def read_request(reader) -> tuple:
+	#(method, path, headers, body, keep_alive) of the next request, None once the client closed the connection
+	start_line, headers = await read_head(reader)
+	if start_line is None:
+		return None
+	method, target, version = start_line
+	keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+	return method, urlsplit(target).path, headers, await read_body(reader, headers), keep_alive
+
+async def read_response(reader) -> tuple:
+	#(status, body) of the next response
+	start_line, headers = await read_head(reader)
+	if start_line is None:
+		raise ConnectionError('The server closed the connection')
+	return int(start_line[1]), await read_body(reader, headers)
+
+def encode_response(status:int, body:bytes, keep_alive:bool) -> bytes:
+	return (f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+		f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n').encode() + body
+
+async def serve_connection(reader, writer, respond):
+	'''
+	Serves the HTTP/1.1 requests of one connection, with keep-alive until the client closes it.
+	respond(method, path, headers, body) returns the status and the JSON body of the response.
+	'''
+	try:
+		while (request := await read_request(reader)) is not None:
+			method, path, headers, body, keep_alive = request
+			status, response = await respond(method, path, headers, body)
+			writer.write(encode_response(status, response, keep_alive))
+			await writer.drain()
+			if not keep_alive:
+				break
+	except HTTPError as error:
+		writer.write(encode_response(error.status, json.dumps({'error': error.message}).encode(), False))
+	except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+		pass
+	finally:
+		writer.close()
+
+def count_boxes(database, boxes:int) -> list:
+	#Blocking: cards per box in the cards file
+	counts = [0]*boxes
+	for data in database.iter_file():
+		counts[min(max(data.get('box', 1), 1), boxes) - 1] += 1
+	return counts
+
+class StudyServer:
+	'''
+	The study service. start() listens on host:port (port 0: any free port, see self.port), close() writes back
+	every workspace and stops.
+
+	Args:
+		store:				auth.CredentialStore checking the logins (the default store of auth if None)
+		database_factory:	callable username -> Database, Database itself by default
+		idle_timeout:		seconds without a request before a token expires and a workspace is written back and dropped
+		io_workers:			threads for the blocking file I/O
+		memory_budget:		estimated bytes of the cached workspaces
+		token_prefix:		start of every token given out (pool.py routes the requests of a token by it)
+	'''
+	def __init__(self, store=None, database_factory=Database, idle_timeout:float=IDLE_TIMEOUT, io_workers:int=IO_WORKERS,
+		memory_budget:int=MEMORY_BUDGET, token_prefix:str=''):
+		self.store = auth.get_store() if store is None else store
+		self.token_prefix = token_prefix
+		self.idle_timeout = idle_timeout
+		self.executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='study-io')
+		self.cache = WorkspaceCache(partial(open_workspace, database_factory), self.run_io, memory_budget)
+		self.tokens = {} 		#token -> [username, time.monotonic() of its last request]
+		self.server = None
+		self.evictor = None
+		self.port = None
+		self.routes = {('POST', '/login'): self.login, ('POST', '/session'): self.start_session,
+			('GET', '/card'): self.next_card, ('POST', '/answer'): self.submit_answer,
+			('GET', '/stats'): self.stats, ('POST', '/logout'): self.logout}
+
+	async def start(self, host:str='127.0.0.1', port:int=8080):
+		self.server = await asyncio.start_server(self.handle, host, port)
+		self.port = self.server.sockets[0].getsockname()[1]
+		self.evictor = asyncio.create_task(self.evict_idle())
+		logger.info(f'Study service listening on {host}:{self.port}')
+
+	async def close(self):
+		if self.evictor is not None:
+			self.evictor.cancel()
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+		await self.cache.close()
+		self.executor.shutdown(wait=True)
+		logger.info('Study service stopped')
+
+	def run_io(self, function, *args):
+		return asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+	#HTTP
+	async def handle(self, reader, writer):
+		await serve_connection(reader, writer, self.respond)
+
+	async def respond(self, method:str, path:str, headers:dict, body:bytes) -> tuple:
+		status, payload = await self.dispatch(method, path, headers, body)
+		return status, json.dumps(payload).encode()
+
+	async def dispatch(self, method:str, path:str, headers:dict, body:bytes) -> tuple:
+		route = self.routes.get((method, path))
+		if route is None:
+			known = any(route_path == path for _, route_path in self.routes)
+			return (405, {'error': f'{method} not allowed on {path}'}) if known else (404, {'error': f'No endpoint {path}'})
+		with metrics.timer(f'server{path.replace("/", ".")}'):
+			try:
+				data = json.loads(body) if body else {}
+				if not isinstance(data, dict):
+					raise HTTPError(400, 'The body must be a JSON object')
+				if route == self.login:
+					return 200, await self.login(data)
+				token, username = self.authorize(headers)
+				if route == self.logout:
+					return 200, self.logout(token)
+				async with self.cache.use(username) as workspace:
+					return 200, await route(workspace, data)
+			except HTTPError as error:
+				return error.status, {'error': error.message}
+			except json.JSONDecodeError:
+				return 400, {'error': 'The body is not valid JSON'}
+			except Exception as error:
+				logger.exception(f'Request {method} {path} failed: {error}')
+				return 500, {'error': 'Internal error'}
+
+	def authorize(self, headers:dict) -> tuple:
+		#(token, username) of the token of a request
+		scheme, _, token = headers.get('authorization', '').partition(' ')
+		session = self.tokens.get(token) if scheme.lower() == 'bearer' else None
+		if session is None:
+			raise HTTPError(401, 'Log in first')
+		session[1] = time.monotonic()
+		return token, session[0]
+
+	#Endpoints
+	async def login(self, data:dict) -> dict:
+		username, password = data.get('username'), data.get('password')
+		if not isinstance(username, str) or not isinstance(password, str):
+			raise HTTPError(400, 'username and password are required')
+		if not await asyncio.wrap_future(self.store.login_async(username, password)):
+			raise HTTPError(401, 'Wrong username or password')
+
+		async with self.cache.use(username) as workspace: 	#loaded now unless it is still cached
+			boxes = len(workspace.box.boxlist)
+		token = self.token_prefix + secrets.token_urlsafe(24)
+		self.tokens[token] = [username, time.monotonic()]
+		logger.info(f'{username} logged in to the study service')
+		return {'token': token, 'boxes': boxes}
+
+	async def start_session(self, workspace:Workspace, data:dict) -> dict:
+		questions = data.get('questions', 10)
+		if questions not in SESSION_SIZES: 		#the session sizes of the work frame
+			raise HTTPError(400, f'questions must be one of {SESSION_SIZES}')
+		workspace.end_session()
+		workspace.session = workspace.scheduler.select(workspace.box, questions)
+		return {'questions': len(workspace.session)}
+
+	async def next_card(self, workspace:Workspace, data:dict) -> dict:
+		if not workspace.session:
+			raise HTTPError(409, 'No session started')
+		if workspace.position >= len(workspace.session):
+			return {'done': True, 'score': workspace.correct}
+		if workspace.question is None: 		#the same question until it is answered
+			workspace.question = grading.format_question(workspace.session[workspace.position])
+			workspace.shown_at = time.perf_counter()
+		question, answer, options = workspace.question
+		return {'position': workspace.position + 1, 'total': len(workspace.session), 'question': question, 'options': options}
+
+	async def submit_answer(self, workspace:Workspace, data:dict) -> dict:
+		user_answer = data.get('answer')
+		if not isinstance(user_answer, str):
+			raise HTTPError(400, 'answer is required')
+		if workspace.question is None:
+			raise HTTPError(409, 'Get a card first')
+		card = workspace.session[workspace.position]
+		answer = workspace.question[1]
+		result = grading.is_correct(user_answer, answer)
+		card.session_result(result, time.perf_counter() - workspace.shown_at)
+		workspace.correct += result
+		workspace.position += 1
+		workspace.question = None
+
+		done = workspace.position >= len(workspace.session)
+		if done: 	#like the app: the answered cards are arranged, the cards and the score are written back later
+			workspace.userdata['session_data'].append(workspace.correct/len(workspace.session)*100)
+			workspace.changed = True
+			workspace.scheduler.arrange(workspace.box)
+		return {'correct': result, 'answer': answer, 'score': workspace.correct,
+			'remaining': len(workspace.session) - workspace.position, 'done': done}
+
+	async def stats(self, workspace:Workspace, data:dict) -> dict:
+		boxes = len(workspace.box.boxlist)
+		if workspace.file_boxes is None or workspace.file_boxes[0] != workspace.database.version:
+			version = workspace.database.version
+			workspace.file_boxes = (version, await self.run_io(count_boxes, workspace.database, boxes))
+		counts = [stored + len(loaded) for stored, loaded in zip(workspace.file_boxes[1], workspace.box.boxlist)]
+		session_data = workspace.userdata['session_data']
+		return {'boxes': counts, 'sessions': len(session_data), 'scores': session_data[-10:],
+			'session': {'position': workspace.position, 'total': len(workspace.session), 'correct': workspace.correct}}
+
+	def logout(self, token:str) -> dict:
+		#Ends the token, the workspace stays cached for the next login
+		del self.tokens[token]
+		return {'logged_out': True}
+
+	async def evict_idle(self):
+		#Background task: expires the tokens and writes back the workspaces idle for longer than idle_timeout
+		interval = max(min(self.idle_timeout/4, 30), 0.05)
+		while True:
+			await asyncio.sleep(interval)
+			deadline = time.monotonic() - self.idle_timeout
+			for token, (username, last_seen) in list(self.tokens.items()):
+				if last_seen < deadline:
+					del self.tokens[token]
+			await self.cache.evict_idle(deadline)
+
+async def serve(host:str, port:int, idle_timeout:float, memory_budget:int):
+	server = StudyServer(idle_timeout=idle_timeout, memory_budget=memory_budget)
+	await server.start(host, port)
+	try:
+		await asyncio.Event().wait()
+	finally:
+		await server.close()
+
+def main(argv=None):
+	import argparse
+	parser = argparse.ArgumentParser(description='Multi-user HTTP/JSON study service of Leitner BoB.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8080)
+	parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT)
+	parser.add_argument('--memory-budget', type=float, default=MEMORY_BUDGET/2**20, help='MB of cached workspaces')
+	args = parser.parse_args(argv)
+	try:
+		asyncio.run(serve(args.host, args.port, args.idle_timeout, int(args.memory_budget*2**20)))
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+if __name__ == '__main__':
+	raise SystemExit(main())
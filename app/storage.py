@@ -0,0 +1,221 @@
+#! python3
+# storage.py - File formats of the cards file (and of the box files of older versions).
+#				json:	the original format, a json list of card dicts written with indent=4 (cards.json)
+#				gzip, lzma:	compressed json lines (cards.jsonl.gz / cards.jsonl.xz), one key-less card record per line
+#							after a header line that names the fields. Read line by line from the decompressor,
+#							so the decompressed text of a deck is never held in memory.
+#
+# Usage: python -m app.storage USERNAME json|gzip|lzma		converts the cards file of a user
+
+import gzip, json, lzma, os, re
+
+STORAGES = ['json', 'gzip', 'lzma']
+FIELDS = ['id', 'answer', 'questions', 'box', 'history', 'tags']
+SKIP_SEPARATORS = re.compile(r'[\s,]*')
+
+def write_json(file_path, data):
+	#Writes the json file atomically: readers see either the old or the new file, never a half written one
+	temp_path = file_path + '.tmp'
+	with open(temp_path, 'w') as file:
+		json.dump(data, file, indent=4)
+	os.replace(temp_path, file_path)
+
+def write_json_list(file_path, items):
+	'''
+	Writes the items as a json list exactly like json.dump(list, indent=4) would, atomically.
+	Items are encoded one at a time, so any iterable (also a generator) can be written without building the list.
+	'''
+	temp_path = file_path + '.tmp'
+	with open(temp_path, 'w') as file:
+		separator = '[\n'
+		for item in items:
+			file.write(separator + '    ' + json.dumps(item, indent=4).replace('\n', '\n    '))
+			separator = ',\n'
+		file.write('[]' if separator == '[\n' else '\n]')
+	os.replace(temp_path, file_path)
+
+def iter_json_list(file_path, chunk_size=2**16):
+	'''
+	Yields the items of a json list file one at a time. The file is decoded in chunks,
+	so only one chunk and one item are in memory however large the file is.
+	'''
+	decoder = json.JSONDecoder()
+	with open(file_path, 'r', encoding='utf-8') as file:
+		buffer = file.read(chunk_size).lstrip()
+		if not buffer.startswith('['):
+			raise ValueError(f'{file_path} is not a json list')
+		position = 1
+		while True:
+			position = SKIP_SEPARATORS.match(buffer, position).end()
+			if position < len(buffer) and buffer[position] == ']':
+				return
+			try:
+				if position == len(buffer):
+					raise json.JSONDecodeError('Buffer empty', buffer, position)
+				item, position = decoder.raw_decode(buffer, position)
+			except json.JSONDecodeError:
+				chunk = file.read(chunk_size)
+				if not chunk:
+					raise
+				buffer = buffer[position:] + chunk		#the item continues in the next chunk
+				position = 0
+				continue
+			yield item
+
+def append_json_list(file_path, lines) -> bool:
+	'''
+	Appends json encoded items to a json list file without reading it: the closing bracket is overwritten.
+	Returns False if the file does not end like a json list.
+	'''
+	items = ',\n'.join('    ' + line for line in lines).encode()
+	with open(file_path, 'rb+') as file:
+		size = file.seek(0, os.SEEK_END)
+		file.seek(max(0, size - 4096))
+		tail = file.read()
+		body = tail.rstrip()
+		if not body.endswith(b']'):
+			return False
+		empty = body[:-1].rstrip().endswith(b'[')		#only "[]" has "[" right before the last "]"
+		file.seek(size - len(tail) + len(body) - 1)		#position of the closing bracket
+		file.truncate()
+		file.write((b'\n' if empty else b',\n') + items + b'\n]')
+	return True
+
+def encode_record(data:dict) -> list:
+	'''
+	Key-less record of a card: the values in the order of FIELDS.
+	A history of only 0s and 1s is stored as a string ("0010..."), other keys of the card follow as a dict.
+	'''
+	history = data.get('history')
+	if history is not None and all(value in (0, 1) for value in history):
+		history = ''.join('1' if value else '0' for value in history)
+	record = [data.get('id'), data['answer'], data['questions'], data.get('box', 1), history, data.get('tags', [])]
+	extra = {key: value for key, value in data.items() if key not in FIELDS}
+	if extra:
+		record.append(extra)
+	return record
+
+def decode_record(record:list) -> dict:
+	#Card data (as in Card.to_dict) of a record made by encode_record
+	card_id, answer, questions, box, history, tags = record[:6]
+	data = {'id': card_id, 'answer': answer, 'questions': questions, 'box': box,
+		'history': [int(value) for value in history] if isinstance(history, str) else history, 'tags': tags}
+	if card_id is None:
+		del data['id']		#card saved before cards had ids, the indexes assign one
+	if len(record) > 6:
+		data.update(record[6])
+	return data
+
+class JsonStorage:
+	'''
+	The original file format: one json list of card dicts.
+	'''
+	name = 'json'
+	extension = '.json'
+
+	def read(self, path) -> list:
+		with open(path, 'r') as file:
+			return json.load(file)
+
+	def iter(self, path):
+		return iter_json_list(path)
+
+	def write(self, path, records):
+		write_json_list(path, records)
+
+	def encode(self, data:dict) -> str:
+		#One card as the text appended by append()
+		return json.dumps(data)
+
+	def decode(self, line:str) -> dict:
+		return json.loads(line)
+
+	def append(self, path, lines) -> bool:
+		return append_json_list(path, lines)
+
+class CompressedStorage:
+	'''
+	Compressed card files: a header line with the field names, then one json encoded record (encode_record) per line.
+	Appending adds a new compressed member/stream at the end of the file, which both gzip and xz readers join.
+
+	Args:
+		compression:	'gzip' or 'lzma'
+	'''
+	OPENERS = {'gzip': gzip.open, 'lzma': lzma.open}
+	EXTENSIONS = {'gzip': '.jsonl.gz', 'lzma': '.jsonl.xz'}
+
+	def __init__(self, compression:str='gzip'):
+		if compression not in self.OPENERS:
+			raise ValueError(f'Unknown compression: {compression}')
+		self.name = compression
+		self.extension = self.EXTENSIONS[compression]
+		self.open = self.OPENERS[compression]
+		self.header = json.dumps({'format': 'leitner-box', 'version': 1, 'fields': FIELDS})
+
+	def read(self, path) -> list:
+		return list(self.iter(path))
+
+	def iter(self, path):
+		with self.open(path, 'rt', encoding='utf-8') as file:
+			header = json.loads(file.readline() or '{}')
+			if header.get('format') != 'leitner-box':
+				raise ValueError(f'{path} is not a compressed box file')
+			for line in file:
+				if line.strip():
+					yield decode_record(json.loads(line))
+
+	def write(self, path, records):
+		temp_path = path + '.tmp'
+		with self.open(temp_path, 'wt', encoding='utf-8') as file:
+			file.write(self.header + '\n')
+			for data in records:
+				file.write(json.dumps(encode_record(data), separators=(',', ':')) + '\n')
+		os.replace(temp_path, path)
+
+	def encode(self, data:dict) -> str:
+		return json.dumps(encode_record(data), separators=(',', ':'))
+
+	def decode(self, line:str) -> dict:
+		return decode_record(json.loads(line))
+
+	def append(self, path, lines) -> bool:
+		if not os.path.exists(path):
+			raise FileNotFoundError(path)
+		with self.open(path, 'at', encoding='utf-8') as file:
+			file.write(''.join(line + '\n' for line in lines))
+		return True
+
+def get_storage(name:str):
+	#Storage for the name used in settings: 'json', 'gzip' or 'lzma'
+	if name == 'json':
+		return JsonStorage()
+	return CompressedStorage(name)
+
+def detect_storage(user_path:str, default:str='json'):
+	#Storage of the cards file (or of the old box files) found in the user's directory, the default one if there are none yet
+	for name in STORAGES:
+		storage = get_storage(name)
+		if any(os.path.exists(os.path.join(user_path, filename + storage.extension)) for filename in ('cards', 'box1')):
+			return storage
+	return get_storage(default)
+
+def main(argv=None):
+	'''
+	Command line entry point: converts the cards file of a user to another storage format.
+	'''
+	import argparse
+	from app.database import Database
+
+	parser = argparse.ArgumentParser(description='Convert the cards file of a Leitner BoB user.')
+	parser.add_argument('username')
+	parser.add_argument('storage', choices=STORAGES)
+	args = parser.parse_args(argv)
+
+	database = Database(args.username)
+	before = database.disk_usage()
+	database.convert_storage(args.storage)
+	print(f'{args.username}: {before} bytes -> {database.disk_usage()} bytes ({args.storage})')
+	return 0
+
+if __name__ == '__main__':
+	raise SystemExit(main())
@@ -0,0 +1,115 @@
+#! python3
+# timers.py - App-wide timer service that drives every periodic job from one coalesced Tk tick
+
+import math, time
+
+import app.metrics as metrics
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+class TimerService:
+	'''
+	Keeps all periodic and one-shot jobs of the app (pomodoro clock, autosave, etc.) on a single root.after() chain.
+	Each job has a deadline on the time.monotonic() clock. The service only wakes up for the earliest deadline,
+	runs every job that is due and then re-arms itself for the next one. When no job is scheduled nothing is armed.
+
+	Scheduling a job with a name that already exists replaces the old job, so pressing a button twice can never
+	stack a second callback chain. Repeating jobs are re-armed from their deadline and not from the time they ran,
+	so they do not drift with event loop latency. Missed ticks (e.g. the window was busy) are coalesced into one call.
+
+	Args:
+		root:	Any Tk widget, used for after() and after_cancel()
+		clock:	Function returning the current time in seconds (time.monotonic by default)
+	'''
+
+	def __init__(self, root, clock=time.monotonic):
+		self.root = root
+		self.clock = clock
+
+		self.jobs = {}				#name -> [deadline, interval, callback]
+		self.after_id = None		#id of the single pending root.after call
+		self.armed_for = None		#deadline the pending root.after call was armed for
+
+	def schedule(self, name:str, callback, interval:float, repeat:bool=True, delay:float=None):
+		'''
+		Adds (or replaces) a job.
+		The callback is called with no arguments after delay seconds (interval if delay is None)
+		and then every interval seconds if repeat is True.
+		'''
+		first = interval if delay is None else delay
+		self.jobs[name] = [self.clock() + first, interval if repeat else None, callback]
+		logger.debug(f'Timer job "{name}" scheduled every {interval}s (repeat: {repeat})')
+		self.arm()
+
+	def cancel(self, name:str):
+		#Removes the job if it exists and re-arms for the remaining jobs
+		if self.jobs.pop(name, None) is not None:
+			logger.debug(f'Timer job "{name}" cancelled')
+			self.arm()
+
+	def stop(self):
+		#Removes every job, used when the app is closing
+		self.jobs.clear()
+		self.disarm()
+
+	def is_scheduled(self, name:str) -> bool:
+		return name in self.jobs
+
+	def time_left(self, name:str) -> float:
+		#Seconds until the job is due next, None if there is no such job
+		job = self.jobs.get(name)
+		if job is None:
+			return None
+		return max(0.0, job[0] - self.clock())
+
+	def arm(self):
+		'''
+		Makes sure exactly one root.after call is pending, set for the earliest deadline.
+		'''
+		if not self.jobs:							#idle, no need to wake up at all
+			self.disarm()
+			return
+
+		deadline = min(job[0] for job in self.jobs.values())
+		if self.after_id is not None and self.armed_for == deadline:	#already armed for it
+			return
+
+		self.disarm()
+		delay_ms = max(0, math.ceil((deadline - self.clock())*1000)) 	#rounded up, so the tick is never early
+		self.armed_for = deadline
+		self.after_id = self.root.after(delay_ms, self.tick)
+
+	def disarm(self):
+		if self.after_id is not None:
+			self.root.after_cancel(self.after_id)
+		self.after_id = None
+		self.armed_for = None
+
+	@metrics.timed('tk.timers.tick')
+	def tick(self):
+		'''
+		Runs every job that is due. Repeating jobs get their next deadline on their own grid,
+		skipping any ticks that were missed. One-shot jobs are removed before they are run.
+		'''
+		self.after_id = None
+		self.armed_for = None
+		now = self.clock()
+
+		due = [(name, job) for name, job in self.jobs.items() if job[0] <= now]
+		for name, job in due:
+			if self.jobs.get(name) is not job:		#cancelled or replaced by an earlier callback of this tick
+				continue
+			deadline, interval, callback = job
+			if interval is None:
+				self.jobs.pop(name, None)
+			else:
+				missed = int((now - deadline)//interval)		#coalescing missed ticks into this one
+				job[0] = deadline + (missed + 1)*interval
+
+			try:
+				callback()
+			except Exception as e:
+				logger.error(f'Timer job "{name}" failed: {str(e)}')
+
+		self.arm()
@@ -6,6 +6,9 @@ from tkinter import messagebox
 from tkinter import ttk
 
 import os
+from collections import OrderedDict
+
+import app.metrics as metrics
 
 from app.app_logging import get_logger
 logger = get_logger(__name__)
@@ -155,6 +158,12 @@ class QuestionWindow(Toplevel):
 			if len(mcq_question) > 0 and len(mcq_options) == 3:
 				question[1] = mcq_question+','+mcq_options_joined	#Joining the question with options for Card creation
 
+			#condition that it must not be the same as another card (O(1) check in the user's hash index)
+			if self.leitner_box.is_duplicate(answer, question, card):
+				messagebox.showerror('Error', 'A card with the same question and answer already exists.', parent=self)
+				logger.debug('Card not created/edited as it duplicates an existing card')
+				return
+
 			#New Card creation
 			if card == None:
 				self.leitner_box.add_question(answer, question) #New card creation and addition to box1
@@ -169,19 +178,76 @@ class QuestionWindow(Toplevel):
 			
 			#Editing an existing card
 			else:
-				card.answer = answer 		#Updating Card answer
-				card.questions = question 	#Updating Card questions
+				self.leitner_box.edit_card(card, answer, question) 	#Updating Card answer and questions
 				messagebox.showinfo('Info', 'The question has been edited.', parent=self)
 				logger.debug('Successful editing of card')
 				#Destroying window as editing is One time activity 
 				self.destroy()
 
+def question_label(card):
+	'''
+	Text shown for a card in question lists.
+	Ideal selection is the Input question (0), else the MCQ question without its options.
+	'''
+	question = card.get_question(0)
+	if question is None:
+		question = card.get_question(1).split(',')[0]
+	return question
+
+class QuestionListModel:
+	'''
+	Index-backed model of the questions in one box for the virtualized list in QuestionListbox.
+	Labels are only built for the pages that are looked at and a few recently used pages are kept, 
+	so memory and opening time do not depend on the number of cards in the box.
+
+	Args:
+		cards:	list of Card objects (a box of the Box object), read by index and never copied
+	'''
+	PAGE_SIZE = 64		#rows per cached page of labels
+	MAX_PAGES = 8		#pages kept in the cache
+
+	def __init__(self, cards):
+		self.cards = cards
+		self.pages = OrderedDict()	#page number -> list of labels
+
+	def __len__(self):
+		return len(self.cards)
+
+	def card(self, index):
+		return self.cards[index]
+
+	def rows(self, start, count):
+		#Labels for rows start to start+count (less at the end of the list)
+		end = min(start + count, len(self.cards))
+		return [self.label(index) for index in range(start, end)]
+
+	def label(self, index):
+		page_number = index // self.PAGE_SIZE
+		page = self.pages.get(page_number)
+		if page is None:
+			first = page_number*self.PAGE_SIZE
+			page = [question_label(card) for card in self.cards[first:first + self.PAGE_SIZE]]
+			self.pages[page_number] = page
+			if len(self.pages) > self.MAX_PAGES:
+				self.pages.popitem(last=False)		#dropping the least recently used page
+		else:
+			self.pages.move_to_end(page_number)
+		return page[index - page_number*self.PAGE_SIZE]
+
+	def invalidate(self):
+		#Called after cards were added, edited or removed
+		self.pages.clear()
+
 class QuestionListbox(Toplevel):
 	'''
 	Class created while inheriting Toplevel to display a small window on the main Tk() root window.
 	This window opens the user chosen box attribute in Box object and displays the questions.
 	According to type, one or both types of button will be displayed. 
 	The types are EDIT, DELETE or else which has a value of VIEW.
+	The list is virtualized: the Listbox only ever holds the visible rows, which are taken from a QuestionListModel
+	as the user scrolls. Row i of the Listbox is card self.offset+i of the box.
+	Several cards can be selected (also across scrolling), they are deleted or moved as one batch through
+	the bulk operations of the Box with one confirmation and one re-render.
 
 	Args:
 		root:	Main Tk() window reference. 
@@ -189,10 +255,17 @@ class QuestionListbox(Toplevel):
 		type:	Type of action to be executed (EDIT, DELETE, VIEW)
 				EDIT - 		Displays only edit button
 				DELETE - 	Displys only delete button
-				VIEW - 		Displays both buttons  
+				VIEW - 		Displays both buttons and a control to move the selected cards to another box
+		database:	Database of the user (optional). With it the search covers every card of the deck:
+					hits that are not loaded are taken out of the cards file into the Box.
 
+	If the box has a search index, a search box lists the cards matching a query instead of a box.
 	'''
-	def __init__(self, root, box, type):
+	VISIBLE_ROWS = 12 		#rows of the listbox
+
+	SEARCH_LIMIT = 500 		#most search hits listed
+
+	def __init__(self, root, box, type, database=None):
 		'''
 		Creates the window that displays the question. 
 		The user can choose the box to view questions through a drop down list and submit button. 
@@ -205,6 +278,8 @@ class QuestionListbox(Toplevel):
 		self.root = root
 		self.leitner_box = box
 		self.type = type
+		self.database = database
+		self.query = None 		#search shown in the list, None while a box is shown
 
 		#Config for the created topwindow
 		self.title('Questions List')
@@ -221,22 +296,37 @@ class QuestionListbox(Toplevel):
 		#Creation and deploying of combobox 
 
 		#Creating and deploying the drop down list (Combobox)
-		self.select_box = ttk.Combobox(self, values=[1,2,3,4,5], width=5, state='readonly')
+		self.select_box = ttk.Combobox(self, values=list(range(1, len(self.leitner_box.boxlist)+1)), width=5, state='readonly')
 		self.select_box.place(x=130, y=12)
 
 		#Creating and deploying an area for questions (Listbox)
-		self.question_listbox = Listbox(self, height=12, width=45, 
-			selectmode=SINGLE)
+		self.question_listbox = Listbox(self, height=self.VISIBLE_ROWS, width=45, 
+			selectmode=EXTENDED)
 		self.question_listbox.place(x=7, y=50)			
+		self.question_listbox.bind('<<ListboxSelect>>', lambda event: self.sync_selection())
+
+		self.model = None 		#QuestionListModel of the displayed box
+		self.offset = 0 		#index of the card shown in the first row
+		self.selected_ids = set()	#ids of the selected cards, kept while the rows scroll in and out of the listbox
 
 		#Creating and deplying button to take user selection from combobox and display the questions in the listbox
 		Button(self, text='Submit', font=('Ariel', 10, 'bold'), 
 			command=self.display_questions).place(x=200, y=8)
 
-		#Adding a scroll bar to the listbox in order to display all questions
-		scrollbar = Scrollbar(self, orient=VERTICAL, command=self.question_listbox.yview)
-		scrollbar.pack(side=RIGHT, fill=Y)
-		self.question_listbox.config(yscrollcommand=scrollbar.set)
+		#Adding a scroll bar that moves through the whole box, not only the rows inside the listbox
+		self.scrollbar = Scrollbar(self, orient=VERTICAL, command=self.scroll)
+		self.scrollbar.pack(side=RIGHT, fill=Y)
+		self.question_listbox.bind('<MouseWheel>', lambda event: self.scroll('scroll', -1 if event.delta > 0 else 1, 'units'))
+		self.question_listbox.bind('<Button-4>', lambda event: self.scroll('scroll', -1, 'units'))
+		self.question_listbox.bind('<Button-5>', lambda event: self.scroll('scroll', 1, 'units'))
+
+		#Search box over all questions and answers, only if there is an index to search
+		if self.leitner_box.search_index is not None:
+			self.search_entry = Entry(self, bg='white', bd=2, relief=RIDGE, width=30)
+			self.search_entry.place(x=7, y=262)
+			self.search_entry.bind('<Return>', lambda event: self.search_questions())
+			Button(self, text='Search', font=('Ariel', 10, 'bold'),
+				command=self.search_questions).place(x=270, y=258)
 
 		#Creating and deplying buttons according to value of type arg
 		if self.type == "EDIT":			#Displays only Edit button
@@ -249,15 +339,22 @@ class QuestionListbox(Toplevel):
 			logger.debug('Successful creation of DELETE questionlist window')
 		else:							#Displays both buttons (usual value "VIEW")
 			Button(self, text='Edit', font=('Ariel', 10, 'bold'),
-				command=self.edit_selected_question, padx=15).place(x=110, y=300)
+				command=self.edit_selected_question, padx=15).place(x=20, y=300)
 			Button(self, text='Delete', font=('Ariel', 10, 'bold'),
-				command=self.delete_selected_question).place(x=220, y=300)
+				command=self.delete_selected_question).place(x=110, y=300)
+
+			#Moving the selected cards to the box chosen in the combobox
+			self.move_box = ttk.Combobox(self, values=list(range(1, len(self.leitner_box.boxlist)+1)), width=3, state='readonly')
+			self.move_box.place(x=190, y=303)
+			Button(self, text='Move', font=('Ariel', 10, 'bold'),
+				command=self.move_selected_questions).place(x=245, y=300)
 			logger.debug('Successful creation of VIEW questionlist window')
 
+	@metrics.timed('tk.question_list.display_questions')
 	def display_questions(self):
 		'''
 		Gets the user choice box value from Combobox. 
-		Loops through the selected box, gets a question from each Card and displays it. 
+		Points the list model at the selected box and displays the first page of questions. 
 		'''
 
 		self.question_listbox.delete(0, END) #making sure that listbox is empty
@@ -272,62 +369,267 @@ class QuestionListbox(Toplevel):
 
 		logger.info(f'Attemting to display question for selected box: {selected_box}')
 
-		#Loop through the box to display all questions
-		for card in self.leitner_box.boxlist[selected_box]:
+		self.query = None
+		cards = self.leitner_box.boxlist[selected_box]
+		if self.model is None or self.model.cards is not cards:		#new box selected, starting from the top
+			self.model = QuestionListModel(cards)
+			self.offset = 0
+			self.selected_ids.clear()
+		else:														#same box, cards might have changed
+			self.model.invalidate()
 
-			#Get question from Card object 
-			#Ideal selection is Input question (0)
-			question = card.get_question()	#Get question type 0
-			if question == None: #No question type 0
-			#Get question type 1 after formatting the return value
-				question_and_options = card.get_question(1)
-				questions_options_split = question_and_options.split(',')
-				question = questions_options_split[0]
-
-			self.question_listbox.insert(END, card.get_question()) #Displaying the question inside listbox
+		self.render()
 		logger.debug(f'Successfully displyed questions of cards inside user selected box: {selected_box}')
-	
+
+	@metrics.timed('tk.question_list.search_questions')
+	def search_questions(self):
+		'''
+		Lists the cards that match the text in the search box, best match first.
+		With a database all cards of the deck are searched, else only the loaded ones.
+		'''
+		query = self.search_entry.get().strip()
+		if not query:
+			messagebox.showerror('Error', 'Please enter something to search for.', parent=self)
+			return
+
+		logger.info(f'Searching questions for: {query}')
+		loaded = {card.id: card for individual_box in self.leitner_box.boxlist for card in individual_box}
+		if self.database is None:
+			card_ids = self.leitner_box.search_index.search(query, self.SEARCH_LIMIT, loaded.keys())
+		else:
+			card_ids = self.leitner_box.search_index.search(query, self.SEARCH_LIMIT)
+			missing = [card_id for card_id in card_ids if card_id not in loaded]
+			loaded.update((card.id, card) for card in self.database.take_cards(self.leitner_box, missing))
+		hits = [loaded[card_id] for card_id in card_ids if card_id in loaded]
+
+		self.query = query
+		self.model = QuestionListModel(hits)
+		self.offset = 0
+		self.selected_ids.clear()
+		self.render()
+
+	def refresh(self):
+		#Shows the current box or search again after cards changed
+		if self.query is not None:
+			self.search_entry.delete(0, END)
+			self.search_entry.insert(0, self.query)
+			self.search_questions()
+		else:
+			self.display_questions()
+
+	@metrics.timed('tk.question_list.render')
+	def render(self):
+		'''
+		Fills the listbox with the rows visible at the current offset and updates the scrollbar.
+		'''
+		total = len(self.model)
+		self.offset = max(0, min(self.offset, total - self.VISIBLE_ROWS))
+
+		self.question_listbox.delete(0, END)
+		rows = self.model.rows(self.offset, self.VISIBLE_ROWS)
+		if rows:
+			self.question_listbox.insert(END, *rows)	#one insert for the visible page
+		for index in range(len(rows)):					#restoring the selection of the visible cards
+			if self.model.card(self.offset + index).id in self.selected_ids:
+				self.question_listbox.selection_set(index)
+
+		if total > 0:
+			self.scrollbar.set(self.offset/total, (self.offset + len(rows))/total)
+		else:
+			self.scrollbar.set(0, 1)
+
+	def scroll(self, action, amount, unit=None):
+		'''
+		Scrollbar and mouse wheel command. Moves the offset through the box and renders the new rows.
+		Takes the arguments Tk passes to a yscrollcommand: ('moveto', fraction) or ('scroll', n, 'units'/'pages').
+		'''
+		if self.model is None:
+			return
+
+		self.sync_selection()
+		if action == 'moveto':
+			self.offset = int(float(amount)*len(self.model))
+		elif unit == 'pages':
+			self.offset += int(amount)*self.VISIBLE_ROWS
+		else:
+			self.offset += int(amount)
+		self.render()
+
+	def sync_selection(self):
+		#Copies the selection state of the visible rows into selected_ids
+		if self.model is None:
+			return
+		selected = set(self.question_listbox.curselection())
+		for index in range(min(self.VISIBLE_ROWS, len(self.model) - self.offset)):
+			card_id = self.model.card(self.offset + index).id
+			if index in selected:
+				self.selected_ids.add(card_id)
+			else:
+				self.selected_ids.discard(card_id)
+
+	def selected_cards(self):
+		#Card objects of all selected rows, visible or not
+		self.sync_selection()
+		if self.model is None or not self.selected_ids:
+			return []
+		return [card for card in self.model.cards if card.id in self.selected_ids]
+
 	def edit_selected_question(self):
 		'''
 		Action upon pressing the "Edit" button.
 		It takes the user selection(s) from Listbox and opens QuestionWindow of the selected question's Card. 
 		'''
 		logger.info('Attempting to edit the user selected question from Edit Window')
-		selected_indices = self.question_listbox.curselection()		#fetching selected card indices
+		selected_cards = self.selected_cards()		#fetching selected cards
 
 		#Making sure that the user has selected at least one card
-		if selected_indices == ():
+		if not selected_cards:
 			messagebox.showerror('Error', 'You have selected no questions to edit', parent=self)
 			return
 
-		#Looping through the indices to view each selected card
-		for index in selected_indices:
-			card = self.leitner_box.boxlist[int(self.select_box.get())-1][index]
+		#Looping through the selected cards to view each one
+		for card in selected_cards:
 			QuestionWindow(self.root, self.leitner_box, card)		#Displaying the selected card
 			logger.debug('Edit window is attempting to call method to display Question Window.')
-			self.display_questions()	#refreshing the window
+		self.refresh()	#refreshing the window
 		logger.info('Successfully edited user selected question(s)')
 
 	def delete_selected_question(self):
 		'''
 		Action upon pressing the "Delete" button. 
-		It takes the user selection(s) from Listbox and deletes the Card from the chosen box.
+		Deletes all selected cards as one batch after a single confirmation, then re-renders the list once.
 		'''
 		logger.debug('Attempting to delete user selected question in Delete/View Window')
-		selected_indices = self.question_listbox.curselection()		#fetching user selections
+		selected_cards = self.selected_cards()		#fetching user selections
 
 		#Making sure that the user has selected at least one card
-		if selected_indices == ():
+		if not selected_cards:
 			messagebox.showerror('Error', 'You have selected no questions to delete.', parent=self)
 			return
 
-		#Looping through the indices to delete each selected card
-		for index in selected_indices:
-			self.leitner_box.boxlist[int(self.select_box.get())-1].pop(index)		#Deleting the selected card
-			messagebox.showinfo('Info','Question deleted successfully.', parent=self)
-			self.display_questions()	#refreshing the window
-		logger.info('Successfully deleted user selected question')
+		if not messagebox.askyesno('Delete', f'Delete {len(selected_cards)} selected question(s)?', parent=self):
+			return
+
+		self.leitner_box.delete_cards(card.id for card in selected_cards)	#one pass over the boxes
+		self.selected_ids.clear()
+		self.refresh()	#refreshing the window
+		logger.info(f'Successfully deleted {len(selected_cards)} user selected question(s)')
+
+	def move_selected_questions(self):
+		'''
+		Action upon pressing the "Move" button.
+		Moves all selected cards to the box chosen next to the button as one batch, then re-renders the list once.
+		'''
+		selected_cards = self.selected_cards()
+		if not selected_cards:
+			messagebox.showerror('Error', 'You have selected no questions to move.', parent=self)
+			return
+		if not self.move_box.get():
+			messagebox.showerror('Error', 'You have not selected a box to move the questions to.', parent=self)
+			return
+
+		self.leitner_box.move_cards((card.id for card in selected_cards), int(self.move_box.get()))
+		self.selected_ids.clear()
+		self.refresh()
+		logger.info(f'Moved {len(selected_cards)} user selected question(s) to box {self.move_box.get()}')
+
+
+class StatsWindow(Toplevel):
+	'''
+	Class created by inheriting Toplevel to show the analytics of the user's cards (analytics.py):
+	a table of the cards, mean recall, leeches and response times per box, the retention curves and the list of leeches.
+
+	Args:
+		root:		Tk() root window
+		analytics:	analytics.DeckAnalytics of the user, its cached analysis is shown
+	'''
+	def __init__(self, root, analytics):
+		logger.info('Opening the stats window')
+		super().__init__(root)
+		self.root = root
+		self.title('Stats')
+		self.geometry('760x620')
+		self.config(bg='Light blue')
+
+		from app.graph import create_retention_graph 	#matplotlib is only loaded when the stats are shown
+		analysis = analytics.get()
+		summary = analysis.summary()
+
+		#Table of the deck and of every box
+		columns = ('box', 'cards', 'recall', 'leeches', 'answers', 'median time', 'slow')
+		table = ttk.Treeview(self, columns=columns, show='headings', height=min(len(summary['boxes']) + 1, 11))
+		for column in columns:
+			table.heading(column, text=column.capitalize())
+			table.column(column, width=100, anchor=CENTER)
+		for row in [summary['deck']] + summary['boxes']:
+			recall = '-' if row['recall'] is None else f'{row["recall"]:.0%}'
+			time = '-' if row['median_time'] is None else f'{row["median_time"]:.1f} s'
+			table.insert('', END, values=(row['box'] or 'All', row['cards'], recall, row['leeches'], row['answers'],
+				time, row['slow']))
+		table.pack(fill=X, padx=10, pady=10)
+
+		#Retention curves
+		graphframe = Frame(self, bd=2, relief=RIDGE, bg='white')
+		graphframe.pack(fill=BOTH, expand=True, padx=10)
+		create_retention_graph(graphframe, analysis)
+
+		#Leeches: cards forgotten again and again
+		Label(self, text=f'Leeches ({summary["leeches"]}):', bg='Light blue',
+			font=('Ariel', 10, 'bold')).pack(anchor=W, padx=10, pady=(10, 0))
+		leech_list = Listbox(self, height=6, font=('Ariel', 10))
+		for data in analytics.leech_cards():
+			question = next((question for question in data['questions'] if question), '')
+			leech_list.insert(END, f'{question.split(",")[0]} -> {data["answer"]} (box {data["box"]})')
+		leech_list.pack(fill=X, padx=10, pady=(0, 10))
+		logger.debug('Stats window created')
+
+class ForecastWindow(Toplevel):
+	'''
+	Class created by inheriting Toplevel to show the workload forecast of the user's cards (forecast.py):
+	the cards due per day over the next 30, 60 or 90 days and the session size they call for.
+
+	Args:
+		root:		Tk() root window
+		forecast:	forecast.WorkloadForecast of the user
+		scheduler:	active scheduling.Scheduler, its algorithm decides when cards are due
+	'''
+	HORIZONS = (30, 60, 90)
+
+	def __init__(self, root, forecast, scheduler):
+		logger.info('Opening the forecast window')
+		super().__init__(root)
+		self.root = root
+		self.forecast = forecast
+		self.scheduler = scheduler
+		self.title('Workload forecast')
+		self.geometry('640x330')
+		self.config(bg='Light blue')
 
+		#Choice of the number of days shown
+		self.days = IntVar(self, self.HORIZONS[0])
+		choices = Frame(self, bg='Light blue')
+		choices.pack(fill=X, padx=10, pady=(10, 0))
+		Label(choices, text='Days:', bg='Light blue', font=('Ariel', 10, 'bold')).pack(side=LEFT)
+		for days in self.HORIZONS:
+			Radiobutton(choices, text=str(days), value=days, variable=self.days, bg='Light blue',
+				command=self.show).pack(side=LEFT)
+		self.summary = Label(choices, bg='Light blue', font=('Ariel', 10))
+		self.summary.pack(side=RIGHT)
+
+		self.graphframe = Frame(self, bd=2, relief=RIDGE, bg='white')
+		self.graphframe.pack(fill=BOTH, expand=True, padx=10, pady=10)
+		self.show()
+
+	def show(self):
+		#Draws the forecast for the chosen number of days
+		from app.graph import create_forecast_graph 	#matplotlib is only loaded when the forecast is shown
+		from app.forecast import suggested_session
+		due = self.forecast.get(self.scheduler, self.days.get())
+		for widget in self.graphframe.winfo_children():
+			widget.destroy()
+		create_forecast_graph(self.graphframe, due)
+		total = due.sum(axis=1)
+		self.summary.config(text=f'Peak: {total.max():.0f} cards a day, suggested session: {suggested_session(due)} questions')
 
 class HelpWindow(Toplevel):
 	'''
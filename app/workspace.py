@@ -0,0 +1,227 @@
+#! python3
+# workspace.py - Workspaces of the users of a long running process (the study service) and their cache.
+#				A Workspace holds what a user's requests work on: their Database (with the card indexes once
+#				opened), the loaded Box, the user data and the scheduler. The cards of the Box are not in the cards
+#				file while they are loaded, so a workspace has to be written back before it is dropped.
+#				WorkspaceCache keeps the workspaces of the recently active users in memory under a budget of
+#				estimated bytes. When a new workspace goes over it, the least recently used ones are evicted and
+#				written back in the background. The next request of an evicted user loads their workspace again.
+
+import asyncio, contextlib, time
+from collections import OrderedDict
+
+from app.models import Box
+from app.scheduling import get_scheduler
+import app.metrics as metrics
+
+from app.app_logging import get_logger
+logger = get_logger(__name__)
+
+MEMORY_BUDGET = 256*1024*1024 	#estimated bytes of the cached workspaces
+#size estimate of a workspace (measured with tracemalloc)
+WORKSPACE_BYTES = 16*1024 		#the Database, the scheduler and the rest of a workspace
+CARD_BYTES = 1024 				#a loaded Card with its review log
+INDEX_ENTRY_BYTES = 2304 		#a card in the search index and the hash index
+SCORE_BYTES = 32 				#a session score of the user data
+
+class Workspace:
+	'''
+	In-memory state of a user. Requests of the same user run one at a time (lock).
+		session:	cards of the running session, position: index of the current card
+		question:	(question, answer, options) of the current card once it was shown, shown_at: perf_counter then
+		changed:	the user data changed since it was saved
+	'''
+	def __init__(self, username:str, database, box:Box, userdata:dict):
+		self.username = username
+		self.database = database
+		self.box = box
+		self.userdata = userdata
+		self.scheduler = get_scheduler(userdata.get('scheduler', 'leitner'))
+		self.lock = asyncio.Lock()
+		self.changed = False
+		self.file_boxes = None 		#(Database.version, cards per box in the cards file) for the stats
+		self.end_session()
+
+	def end_session(self):
+		self.session = []
+		self.position = 0
+		self.correct = 0
+		self.question = None
+		self.shown_at = None
+
+	def size(self) -> int:
+		#Estimated bytes of the workspace
+		database = self.database
+		indexed = max(len(database.search_index or ()), len(database.hash_index or ()))
+		return (WORKSPACE_BYTES + CARD_BYTES*sum(map(len, self.box.boxlist)) + INDEX_ENTRY_BYTES*indexed
+			+ SCORE_BYTES*len(self.userdata['session_data']))
+
+	@property
+	def dirty(self) -> bool:
+		#Holds something that is not on disk: loaded cards, changed user data or changed indexes
+		database = self.database
+		return (any(self.box.boxlist) or self.changed or any(index is not None and index.dirty
+			for index in (database.search_index, database.hash_index)))
+
+	def write_back(self):
+		#Blocking: saves what changed, the answered cards are arranged into their boxes first
+		self.scheduler.arrange(self.box)
+		if any(self.box.boxlist):
+			self.database.save_cards(self.box)
+		if self.changed:
+			self.database.save_userdata(self.userdata)
+			self.changed = False
+		self.database.save_search_index()
+
+def open_workspace(database_factory, username:str) -> Workspace:
+	#Blocking: opens the user's files and loads a sample of their cards
+	database = database_factory(username)
+	box = Box(boxes=database.boxes)
+	database.load_cards(box)
+	userdata = database.load_userdata()
+	userdata.setdefault('session_data', [])
+	return Workspace(username, database, box, userdata)
+
+class WorkspaceCache:
+	'''
+	LRU cache of workspaces under a memory budget. use(key) gives the workspace of a key locked for a request,
+	loading it on a miss. Evicted workspaces are written back in the background, loading the key again waits
+	for that write. The most recently used workspace is kept even if it alone is over the budget.
+
+	Args:
+		load:		blocking callable key -> workspace (Workspace or anything with lock, size(), dirty and write_back())
+		run:		callable (function, *args) -> awaitable, running the blocking loads and write-backs (e.g. on a thread pool)
+		budget:		estimated bytes of the cached workspaces
+	'''
+	def __init__(self, load, run, budget:int=MEMORY_BUDGET):
+		self.load = load
+		self.run = run
+		self.budget = budget
+		self.workspaces = OrderedDict() 	#key -> workspace, least recently used first
+		self.sizes = {} 					#key -> estimated bytes
+		self.used = {} 						#key -> time.monotonic() of the last use
+		self.total = 0
+		self.loading = {} 					#key -> future of the workspace being loaded
+		self.writing = {} 					#key -> future of the write-back of an evicted workspace
+		self.hits = self.misses = self.evictions = self.write_backs = 0
+
+	def __len__(self):
+		return len(self.workspaces)
+
+	def __contains__(self, key):
+		return key in self.workspaces
+
+	async def get(self, key):
+		#The workspace of key, loaded on a miss (once for concurrent misses of the same key)
+		workspace = self.workspaces.get(key)
+		if workspace is not None:
+			self.hits += 1
+			metrics.count('workspace.hits')
+			self.touch(key)
+			return workspace
+		loading = self.loading.get(key)
+		if loading is None:
+			self.misses += 1
+			metrics.count('workspace.misses')
+			loading = self.loading[key] = asyncio.ensure_future(self.load_workspace(key))
+			loading.add_done_callback(lambda done: self.forget(self.loading, key, done))
+		return await asyncio.shield(loading)
+
+	async def load_workspace(self, key):
+		if key in self.writing: 		#the files are read once the last write-back of the key is done
+			await asyncio.wait([self.writing[key]])
+		with metrics.timer('workspace.load'):
+			workspace = await self.run(self.load, key)
+		self.workspaces[key] = workspace
+		self.sizes[key] = workspace.size()
+		self.total += self.sizes[key]
+		self.touch(key)
+		self.shrink()
+		return workspace
+
+	@contextlib.asynccontextmanager
+	async def use(self, key):
+		#async with cache.use(key) as workspace: the workspace of key, locked and not evicted while it is used
+		while True:
+			workspace = await self.get(key)
+			async with workspace.lock:
+				if self.workspaces.get(key) is not workspace: 	#evicted while waiting for the lock
+					continue
+				try:
+					yield workspace
+				finally:
+					self.touch(key)
+					size = workspace.size()
+					self.total += size - self.sizes[key]
+					self.sizes[key] = size
+				break
+		self.shrink()
+
+	def touch(self, key):
+		self.workspaces.move_to_end(key)
+		self.used[key] = time.monotonic()
+
+	def forget(self, futures:dict, key, done):
+		#Done callback of the loads and write-backs: removes the future of key unless a newer one took its place
+		if futures.get(key) is done:
+			del futures[key]
+
+	def shrink(self):
+		#Evicts the least recently used workspaces not in use until the cache is within the budget
+		for key in list(self.workspaces)[:-1]:
+			if self.total <= self.budget:
+				break
+			if not self.workspaces[key].lock.locked():
+				self.evict(key)
+
+	def evict(self, key) -> asyncio.Future:
+		'''
+		Drops the workspace of key and writes it back in the background if it is dirty.
+		Returns the future of the write-back (None if there was nothing to write). The workspace must not be in use.
+		'''
+		workspace = self.workspaces.pop(key)
+		self.total -= self.sizes.pop(key)
+		del self.used[key]
+		self.evictions += 1
+		metrics.count('workspace.evictions')
+		if not workspace.dirty:
+			return None
+		writing = self.writing[key] = asyncio.ensure_future(self.write_back(key, workspace))
+		writing.add_done_callback(lambda done: self.forget(self.writing, key, done))
+		return writing
+
+	async def write_back(self, key, workspace):
+		try:
+			with metrics.timer('workspace.write_back'):
+				await self.run(workspace.write_back)
+			self.write_backs += 1
+			metrics.count('workspace.write_backs')
+		except Exception as error:
+			logger.error(f'Failed to write back the workspace of {key}: {error}')
+
+	async def evict_idle(self, deadline:float):
+		#Evicts the workspaces not used since deadline (time.monotonic()) and waits for their write-backs
+		writes = [self.evict(key) for key in list(self.workspaces)
+			if self.used[key] < deadline and not self.workspaces[key].lock.locked()]
+		await self.flush([writing for writing in writes if writing is not None])
+
+	async def flush(self, writes:list=None):
+		writes = list(self.writing.values()) if writes is None else writes
+		if writes:
+			await asyncio.wait(writes)
+
+	async def close(self):
+		#Evicts every workspace once its request is done and waits until all of them are written back
+		for key in list(self.workspaces):
+			workspace = self.workspaces.get(key)
+			if workspace is not None:
+				async with workspace.lock:
+					if self.workspaces.get(key) is workspace:
+						self.evict(key)
+		await self.flush()
+
+	def stats(self) -> dict:
+		lookups = self.hits + self.misses
+		return {'workspaces': len(self.workspaces), 'bytes': self.total, 'budget': self.budget, 'hits': self.hits,
+			'misses': self.misses, 'hit_rate': self.hits/lookups if lookups else None, 'evictions': self.evictions,
+			'write_backs': self.write_backs}
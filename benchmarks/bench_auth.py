@@ -0,0 +1,45 @@
+#! python3
+# bench_auth.py - Measures password verifications (logins) per second per core for each hashing cost setting.
+#
+# Usage: python -m benchmarks.bench_auth [seconds per setting]
+
+import os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+import app.auth as auth
+
+SETTINGS = [
+	('scrypt', {'n': 2**13, 'r': 8, 'p': 1}),
+	('scrypt', {'n': 2**14, 'r': 8, 'p': 1}),
+	('scrypt', {'n': 2**15, 'r': 8, 'p': 1}),
+	('pbkdf2_sha256', {'iterations': 200000}),
+	('pbkdf2_sha256', {'iterations': 600000}),
+]
+
+def logins_per_second(record, seconds, workers):
+	#Runs verify_password on `workers` threads for about `seconds` and returns verifications per second
+	deadline = time.perf_counter() + seconds
+
+	def worker():
+		count = 0
+		while time.perf_counter() < deadline:
+			auth.verify_password(record, 'benchmark-password')
+			count += 1
+		return count
+
+	start = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		total = sum(pool.map(lambda _: worker(), range(workers)))
+	return total/(time.perf_counter() - start)
+
+def main(seconds=2.0):
+	cores = os.cpu_count() or 1
+	print(f'{"kdf":<15}{"params":<32}{"ms/login":>10}{"logins/s/core":>15}{"logins/s (" + str(cores) + " threads)":>26}')
+	for kdf, params in SETTINGS:
+		record = auth.hash_password('benchmark-password', kdf, params)
+		single = logins_per_second(record, seconds, 1)
+		pooled = logins_per_second(record, seconds, cores)
+		print(f'{kdf:<15}{str(params):<32}{1000/single:>10.1f}{pooled/cores:>15.1f}{pooled:>26.1f}')
+
+if __name__ == '__main__':
+	main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
@@ -0,0 +1,49 @@
+#! python3
+# bench_import.py - Measures the throughput (rows per second) of the bulk importer in streaming and process-pool mode.
+#
+# Usage: python -m benchmarks.bench_import [rows]
+
+import csv, os, shutil, sys, tempfile, time
+
+from app.database import Database
+from app.importer import import_file
+from app.export import csv_row
+from benchmarks.synthetic import generate_cards
+
+class TempDatabase(Database):
+	#Database that keeps its files in a temporary directory instead of data/
+	def __init__(self, username, basepath):
+		self.temp_basepath = basepath
+		super().__init__(username)
+
+	def get_basepath(self, base):
+		return self.temp_basepath
+
+def write_deck(path, rows):
+	#TSV deck of a synthetic deck, in the columns of the csv export
+	with open(path, 'w', newline='') as file:
+		writer = csv.writer(file, delimiter='\t')
+		writer.writerow(['question', 'answer', 'mcq question', 'mcq options', 'tags'])
+		for card in generate_cards(rows):
+			writer.writerow(csv_row(card)[:5])
+
+def main(rows=200000):
+	cores = os.cpu_count() or 1
+	temp_dir = tempfile.mkdtemp()
+	try:
+		deck = os.path.join(temp_dir, 'deck.tsv')
+		write_deck(deck, rows)
+		print(f'{rows} rows, {os.path.getsize(deck)/2**20:.1f} MiB')
+		print(f'{"workers":<10}{"seconds":>10}{"rows/s":>12}')
+		for workers in sorted({0, 2, cores}):
+			shutil.rmtree(os.path.join(temp_dir, 'bench'), ignore_errors=True)
+			database = TempDatabase('bench', temp_dir)
+			start = time.perf_counter()
+			report = import_file(database, deck, workers=workers)
+			seconds = time.perf_counter() - start
+			print(f'{workers:<10}{seconds:>10.2f}{report.rows/seconds:>12.0f}')
+	finally:
+		shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,58 @@
+#! python3
+# bench_logging.py - Measures Database.load_cards with the old synchronous, unsampled logging and with the
+#				queued, sampled logging of app_logging. Logs go to stderr and logs/app.log as in the app
+#				(redirect stderr to compare terminal and file output). The deck is written to a memory
+#				file system when there is one, so the file writes of load_cards do not hide the logging cost.
+#
+# Usage: python -m benchmarks.bench_logging [cards] [repeat]
+
+import os, shutil, statistics, sys, tempfile, time
+from unittest.mock import patch
+
+import app.app_logging as app_logging
+from app.database import Database
+from app.models import Box
+from benchmarks.synthetic import populate
+
+MODES = [
+	('synchronous, unsampled', False, 1),
+	('queued, sampled', True, app_logging.SAMPLE_RATES['app.models']),
+]
+
+def time_load_cards(database, repeat) -> float:
+	#Median seconds of load_cards (the cards are saved back between the calls, untimed)
+	box = Box()
+	times = []
+	for _ in range(repeat):
+		if any(box.boxlist):
+			database.save_cards(box)
+		start = time.perf_counter()
+		database.load_cards(box)
+		times.append(time.perf_counter() - start)
+	database.save_cards(box)
+	return statistics.median(times)
+
+def main(cards=1000, repeat=30):
+	temp_dir = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+	try:
+		with patch.object(Database, 'get_basepath', return_value=temp_dir):
+			database = Database('bench_user')
+		populate(database, cards, sessions=10)
+		results = []
+		for name, asynchronous, every in MODES:
+			app_logging.configure(asynchronous)
+			app_logging.set_sampling('app.models', every)
+			results.append((name, time_load_cards(database, repeat)))
+			app_logging.stop() 		#the queue is written out before the next mode starts
+	finally:
+		app_logging.configure()
+		app_logging.set_sampling('app.models', app_logging.SAMPLE_RATES['app.models'])
+		shutil.rmtree(temp_dir)
+
+	print(f'load_cards, {cards} cards in the deck, median of {repeat}', file=sys.stdout)
+	for name, seconds in results:
+		print(f'{name:<26}{seconds*1000:>10.2f} ms')
+	return results
+
+if __name__ == '__main__':
+	main(*(int(arg) for arg in sys.argv[1:3]))
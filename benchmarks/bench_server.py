@@ -0,0 +1,147 @@
+#! python3
+# bench_server.py - Load generator of the study service (app/server.py): concurrent learners logging in and answering
+#				sessions against a server on localhost. Reports requests per second and the p50/p95/p99 latency.
+#				Without --url it starts a server with synthetic users in a temporary directory: the single process
+#				StudyServer for --workers 0, a sharded ShardedServer (app/pool.py) with that many worker processes else.
+#				Several --workers values run one after the other, to see the throughput scale with the cores.
+#
+# Usage: python -m benchmarks.bench_server [--users 50] [--sessions 3] [--questions 10] [--cards 2000] [--workers 0 1 2 4]
+#								[--url http://127.0.0.1:8080 --password PASSWORD] (users bench0, bench1, ...)
+
+import argparse, asyncio, json, os, random, shutil, statistics, tempfile, time
+from functools import partial
+from urllib.parse import urlsplit
+
+import app.auth as auth
+from app.pool import ShardedServer
+from app.server import StudyServer, read_response
+from benchmarks.bench_import import TempDatabase
+from benchmarks.synthetic import populate
+
+PASSWORD = 'benchmark-password'
+FAST_KDF = ('scrypt', {'n': 2**10, 'r': 8, 'p': 1}) 	#cheap hashing cost of the in-process users, logins are not what is measured
+
+class Client:
+	'''
+	Minimal HTTP/1.1 JSON client on one keep-alive connection. request() returns (status, payload).
+	'''
+	def __init__(self, host:str, port:int):
+		self.host = host
+		self.port = port
+		self.reader = self.writer = None
+		self.token = None
+
+	async def request(self, method:str, path:str, data:dict=None) -> tuple:
+		if self.writer is None:
+			self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+		body = json.dumps(data).encode() if data is not None else b''
+		headers = f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n'
+		if self.token is not None:
+			headers += f'Authorization: Bearer {self.token}\r\n'
+		self.writer.write(headers.encode() + b'\r\n' + body)
+		await self.writer.drain()
+
+		status, body = await read_response(self.reader)
+		return status, json.loads(body)
+
+	async def login(self, username:str, password:str) -> dict:
+		status, payload = await self.request('POST', '/login', {'username': username, 'password': password})
+		if status != 200:
+			raise RuntimeError(f'Login of {username} failed: {payload}')
+		self.token = payload['token']
+		return payload
+
+	async def close(self):
+		if self.writer is not None:
+			self.writer.close()
+			await self.writer.wait_closed()
+			self.writer = None
+
+async def learner(client:Client, username:str, password:str, sessions:int, questions:int, latencies:list, rng):
+	#One user: login, then sessions of card and answer requests, then the stats. Every request time goes to latencies
+	async def timed(method, path, data=None):
+		start = time.perf_counter()
+		status, payload = await client.request(method, path, data)
+		latencies.append(time.perf_counter() - start)
+		if status != 200:
+			raise RuntimeError(f'{method} {path} of {username} failed with {status}: {payload}')
+		return payload
+
+	start = time.perf_counter()
+	await client.login(username, password)
+	latencies.append(time.perf_counter() - start)
+	for _ in range(sessions):
+		await timed('POST', '/session', {'questions': questions})
+		while not (card := await timed('GET', '/card')).get('done'):
+			options = card['options']
+			await timed('POST', '/answer', {'answer': rng.choice(options) if options else 'no idea'})
+	await timed('GET', '/stats')
+	await client.close()
+
+async def run_load(host:str, port:int, users:list, password:str, sessions:int, questions:int, seed:int=0) -> dict:
+	#Runs every user at once and returns the request count, seconds, requests per second and latency percentiles (ms)
+	latencies = []
+	rng = random.Random(seed)
+	start = time.perf_counter()
+	await asyncio.gather(*(learner(Client(host, port), username, password, sessions, questions, latencies, rng)
+		for username in users))
+	seconds = time.perf_counter() - start
+	cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies*99
+	return {'requests': len(latencies), 'seconds': seconds, 'rps': len(latencies)/seconds,
+		'p50': cuts[49]*1000, 'p95': cuts[94]*1000, 'p99': cuts[98]*1000}
+
+def store_args(temp_dir:str) -> dict:
+	#Keyword arguments of the auth.CredentialStore of the synthetic users in temp_dir
+	kdf, params = FAST_KDF
+	return {'key_file': os.path.join(temp_dir, 'secret.key'), 'db_file': os.path.join(temp_dir, 'users.db'),
+		'legacy_file': os.path.join(temp_dir, 'user.enc'), 'kdf': kdf, 'params': params}
+
+def create_users(temp_dir:str, users:int, cards:int) -> auth.CredentialStore:
+	#Credential store and synthetic decks of the users bench0, bench1, ... in temp_dir
+	store = auth.CredentialStore(**store_args(temp_dir))
+	for i in range(users):
+		store.register(f'bench{i}', PASSWORD)
+		populate(TempDatabase(f'bench{i}', temp_dir), cards, sessions=10, seed=i)
+	return store
+
+async def run_local(users:int, sessions:int, questions:int, cards:int, workers:int=0) -> dict:
+	temp_dir = tempfile.mkdtemp()
+	store = create_users(temp_dir, users, cards)
+	database_factory = partial(TempDatabase, basepath=temp_dir)
+	if workers:
+		server = ShardedServer(workers, store_args(temp_dir), database_factory)
+	else:
+		server = StudyServer(store, database_factory)
+	try:
+		await server.start('127.0.0.1', 0)
+		return await run_load('127.0.0.1', server.port, [f'bench{i}' for i in range(users)], PASSWORD, sessions, questions)
+	finally:
+		await server.close()
+		store.close()
+		shutil.rmtree(temp_dir)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Load generator of the study service.')
+	parser.add_argument('--users', type=int, default=50)
+	parser.add_argument('--sessions', type=int, default=3)
+	parser.add_argument('--questions', type=int, default=10)
+	parser.add_argument('--cards', type=int, default=2000, help='cards per synthetic user of the in-process server')
+	parser.add_argument('--workers', type=int, nargs='+', default=[0], help='worker processes of the in-process server, 0: single process')
+	parser.add_argument('--url', help='server to load instead of an in-process one, its users are bench0, bench1, ...')
+	parser.add_argument('--password', default=PASSWORD)
+	args = parser.parse_args(argv)
+
+	print(f'{"workers":<10}{"requests":>10}{"seconds":>10}{"requests/s":>12}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+	if args.url:
+		url = urlsplit(args.url)
+		results = [('remote', asyncio.run(run_load(url.hostname, url.port or 80, [f'bench{i}' for i in range(args.users)],
+			args.password, args.sessions, args.questions)))]
+	else:
+		results = ((workers, asyncio.run(run_local(args.users, args.sessions, args.questions, args.cards, workers)))
+			for workers in args.workers)
+	for workers, result in results:
+		print(f'{workers:<10}{result["requests"]:>10}{result["seconds"]:>10.2f}{result["rps"]:>12.0f}'
+			f'{result["p50"]:>10.2f}{result["p95"]:>10.2f}{result["p99"]:>10.2f}')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,39 @@
+#! python3
+# bench_storage.py - Compares disk footprint and save/load latency of the box file formats on a synthetic deck.
+#
+# Usage: python -m benchmarks.bench_storage [cards]
+
+import os, shutil, sys, tempfile, time
+
+from app.storage import STORAGES, get_storage
+from benchmarks.synthetic import generate_cards
+
+def main(cards=100000):
+	deck = list(generate_cards(cards))
+	temp_dir = tempfile.mkdtemp()
+	try:
+		print(f'{cards} cards')
+		print(f'{"storage":<10}{"size MiB":>10}{"save s":>10}{"load s":>10}{"stream s":>10}')
+		for name in STORAGES:
+			storage = get_storage(name)
+			path = os.path.join(temp_dir, 'box1' + storage.extension)
+
+			start = time.perf_counter()
+			storage.write(path, deck)
+			save = time.perf_counter() - start
+
+			start = time.perf_counter()
+			loaded = storage.read(path)
+			load = time.perf_counter() - start
+			assert loaded == deck
+
+			start = time.perf_counter()
+			for card in storage.iter(path):
+				pass
+			stream = time.perf_counter() - start
+			print(f'{name:<10}{os.path.getsize(path)/2**20:>10.2f}{save:>10.2f}{load:>10.2f}{stream:>10.2f}')
+	finally:
+		shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,249 @@
+#! python3
+# simulator.py - Study simulator for tuning the scheduler (the scheduling algorithm of logic.py, and the box quotas
+#				and re-box thresholds of the Leitner rules, and the number of boxes). Synthetic learners study every day for months with
+#				the real Box and scheduler code (the select and arrange behind get_session_cards and arrange_boxes).
+#				Whether a card is recalled is decided by a forgetting model. Learners are spread over a process pool.
+#				Reports retention, workload per day and cards per box over time, and the throughput of the simulator in simulated reviews per second.
+#				The whole deck of a learner is in memory. load_cards' random 50 cards per box give the same
+#				card distribution, except for 100 question sessions that need more than 50 cards from one box.
+#
+# Usage: python -m benchmarks.simulator [--learners 200] [--days 180] [--session 20] [--new-cards 1] [--boxes 5]
+#								[--variants current strict ...] [--workers N] [--curve exponential|power]
+#								[--growth 2.5] [--lapse 0.5] [--difficulty 0.4] [--every 30] [--output results.json]
+
+import argparse, json, logging, math, os, random, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import app.scheduling as scheduling
+from app.models import Card, Box
+
+#Scheduler variants: the algorithm (scheduling.SCHEDULERS, leitner if not given) and the allocations and thresholds
+#of the Leitner scheduler in place of scheduling.SESSION_ALLOCATIONS (merged per session size) and
+#scheduling.BOX_THRESHOLDS, used by decks of 5 boxes
+VARIANTS = {
+	'current': {},
+	'sm2': {'algorithm': 'sm2'},
+	'fsrs': {'algorithm': 'fsrs'},
+	'strict': {'thresholds': [(9, 5), (7, 4), (5, 3), (3, 2)]},
+	'lenient': {'thresholds': [(6, 5), (4, 4), (3, 3), (1, 2)]},
+	'review-heavy': {'allocations': {10: [3, 3, 2, 1, 1], 20: [6, 5, 4, 3, 2], 50: [16, 13, 10, 7, 4]}},
+}
+
+class ForgettingModel:
+	'''
+	Memory of a learner. Each card has a stability S in days and a difficulty d (0 - 1).
+	t days after its last review a card is recalled with probability exp(-t/S) ('exponential' curve)
+	or 1/(1 + t/(9S)) ('power' curve). A recalled card's stability grows by the factor 1 + (growth-1)*(1-d),
+	a forgotten one's shrinks by the factor lapse.
+	'''
+	def __init__(self, curve:str='exponential', stability:float=1.0, growth:float=2.5, lapse:float=0.5,
+		difficulty:float=0.4, max_stability:float=3650.0):
+		if curve not in ('exponential', 'power'):
+			raise ValueError(f'Unknown forgetting curve: {curve}')
+		self.curve = curve
+		self.stability = stability
+		self.growth = growth
+		self.lapse = lapse
+		self.difficulty = difficulty
+		self.max_stability = max_stability
+
+	def new_memory(self, rng, day:int) -> list:
+		#[stability, day of the last review, difficulty] of a card the learner just wrote
+		return [self.stability, day, rng.uniform(0, self.difficulty)]
+
+	def recall_probability(self, memory:list, day:int) -> float:
+		elapsed = day - memory[1]
+		if self.curve == 'exponential':
+			return math.exp(-elapsed/memory[0])
+		return 1/(1 + elapsed/(9*memory[0]))
+
+	def review(self, memory:list, day:int, recalled:bool):
+		if recalled:
+			memory[0] = min(self.max_stability, memory[0]*(1 + (self.growth - 1)*(1 - memory[2])))
+		else:
+			memory[0] = max(self.stability, memory[0]*self.lapse)
+		memory[1] = day
+
+class StudyPlan:
+	'''
+	What every learner does: starts with initial_cards cards, writes new_cards cards a day
+	and studies one session of session_size questions a day for days days, in a deck of boxes boxes.
+	'''
+	def __init__(self, days:int=180, session_size:int=20, initial_cards:int=50, new_cards:int=1, boxes:int=5):
+		self.days = days
+		self.session_size = session_size
+		self.initial_cards = initial_cards
+		self.new_cards = new_cards
+		self.boxes = boxes
+
+class SimulatedClock:
+	#Day number of the simulation, the clock of the schedulers during a run
+	def __init__(self):
+		self.day = 0
+
+	def __call__(self) -> float:
+		return self.day
+
+def make_scheduler(variant:dict) -> scheduling.Scheduler:
+	#Scheduler of a variant, with a SimulatedClock and its own random.Random (seeded per learner by simulate_learner)
+	options = {}
+	if 'allocations' in variant:
+		options['allocations'] = {**scheduling.SESSION_ALLOCATIONS, **variant['allocations']}
+	if 'thresholds' in variant:
+		options['thresholds'] = variant['thresholds']
+	return scheduling.get_scheduler(variant.get('algorithm', 'leitner'), SimulatedClock(), random.Random(), **options)
+
+@contextmanager
+def quiet_logs():
+	#Per card logs of the models are not wanted for millions of simulated reviews
+	logger = logging.getLogger('app')
+	level = logger.level
+	logger.setLevel(logging.WARNING)
+	try:
+		yield
+	finally:
+		logger.setLevel(level)
+
+def new_stats(days:int, boxes:int=5) -> dict:
+	#Daily totals over the learners of a run
+	return {'learners': 0, 'reviews': [0]*days, 'correct': [0]*days, 'retention': [0.0]*days,
+		'boxes': [[0]*boxes for _ in range(days)]}
+
+def simulate_learner(plan:StudyPlan, model:ForgettingModel, scheduler:scheduling.Scheduler, seed:int, stats:dict):
+	'''
+	Simulates one learner studying with scheduler (of make_scheduler), adding its daily reviews, correct answers,
+	retention (mean recall probability of its cards at the end of the day) and cards per box to stats.
+	'''
+	rng = random.Random(seed)
+	scheduler.rng.seed(seed) 	#the cards a session draws depend only on the learner
+	box = Box(boxes=plan.boxes)
+	memories = {}
+	written = 0
+
+	def write_cards(count, day):
+		nonlocal written
+		for _ in range(count):
+			card = Card(f'a{written}', [f'q{written}?', None], card_id=str(written))
+			box.box1.append(card)
+			memories[card.id] = model.new_memory(rng, day)
+			written += 1
+
+	write_cards(plan.initial_cards, 0)
+	for day in range(plan.days):
+		scheduler.clock.day = day
+		if day:
+			write_cards(plan.new_cards, day)
+		correct = 0
+		session = scheduler.select(box, plan.session_size)
+		for card in session:
+			memory = memories[card.id]
+			recalled = rng.random() < model.recall_probability(memory, day)
+			model.review(memory, day, recalled)
+			card.session_result(recalled)
+			correct += recalled
+		scheduler.arrange(box)
+
+		stats['reviews'][day] += len(session)
+		stats['correct'][day] += correct
+		stats['retention'][day] += sum(model.recall_probability(memory, day + 1) for memory in memories.values())/len(memories)
+		for i, individual_box in enumerate(box.boxlist):
+			stats['boxes'][day][i] += len(individual_box)
+	stats['learners'] += 1
+
+def simulate_learners(plan:StudyPlan, model:ForgettingModel, variant:dict, seeds:list) -> dict:
+	#Simulates the learners with the seeds under the scheduler variant (runs in the worker processes)
+	stats = new_stats(plan.days, plan.boxes)
+	scheduler = make_scheduler(variant)
+	with quiet_logs():
+		for seed in seeds:
+			simulate_learner(plan, model, scheduler, seed, stats)
+	return stats
+
+def merge_stats(total:dict, stats:dict):
+	total['learners'] += stats['learners']
+	for day in range(len(total['reviews'])):
+		total['reviews'][day] += stats['reviews'][day]
+		total['correct'][day] += stats['correct'][day]
+		total['retention'][day] += stats['retention'][day]
+		total['boxes'][day] = [a + b for a, b in zip(total['boxes'][day], stats['boxes'][day])]
+
+def summarize(stats:dict) -> dict:
+	#Daily means per learner
+	learners = max(stats['learners'], 1)
+	return {
+		'reviews_per_day': [reviews/learners for reviews in stats['reviews']],
+		'accuracy': [correct/reviews if reviews else 0.0 for correct, reviews in zip(stats['correct'], stats['reviews'])],
+		'retention': [retention/learners for retention in stats['retention']],
+		'cards_per_box': [[count/learners for count in boxes] for boxes in stats['boxes']],
+	}
+
+def simulate(plan:StudyPlan, model:ForgettingModel, variant:dict=None, learners:int=200, workers:int=0, seed:int=0) -> dict:
+	'''
+	Simulates learners learners under the scheduler variant (None: the default Leitner rules), on workers
+	processes (0: in this process). The results do not depend on the number of workers.
+	Returns the daily means per learner (summarize) with the totals and the throughput in reviews per second.
+	'''
+	variant = variant or {}
+	seeds = [seed*1000003 + learner for learner in range(learners)]
+	total = new_stats(plan.days, plan.boxes)
+	start = time.perf_counter()
+	if workers:
+		chunks = [seeds[i::workers*4] for i in range(workers*4)] 	#several chunks per worker to even out the load
+		with ProcessPoolExecutor(max_workers=workers) as executor:
+			for stats in executor.map(simulate_learners, [plan]*len(chunks), [model]*len(chunks),
+				[variant]*len(chunks), chunks):
+				merge_stats(total, stats)
+	else:
+		merge_stats(total, simulate_learners(plan, model, variant, seeds))
+	seconds = time.perf_counter() - start
+
+	result = summarize(total)
+	reviews = sum(total['reviews'])
+	result.update({'learners': learners, 'days': plan.days, 'reviews': reviews, 'seconds': seconds,
+		'reviews_per_second': reviews/seconds if seconds > 0 else 0.0, 'workers': workers})
+	return result
+
+def print_report(name:str, result:dict, every:int):
+	print(f'\n{name}: {result["learners"]} learners x {result["days"]} days, {result["reviews"]} reviews in '
+		f'{result["seconds"]:.2f} s ({result["reviews_per_second"]:.0f} reviews/s, {result["workers"]} workers)')
+	print(f'{"day":>5}{"reviews":>9}{"accuracy":>10}{"retention":>11}' + ''.join(f'{"box" + str(i):>8}' for i in range(1, len(result['cards_per_box'][0]) + 1)))
+	for day in sorted(set(range(every - 1, result['days'], every)) | {result['days'] - 1}):
+		print(f'{day + 1:>5}{result["reviews_per_day"][day]:>9.1f}{result["accuracy"][day]:>10.1%}'
+			f'{result["retention"][day]:>11.1%}' + ''.join(f'{count:>8.1f}' for count in result['cards_per_box'][day]))
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Simulates learners studying with the Leitner BoB scheduler.')
+	parser.add_argument('--learners', type=int, default=200)
+	parser.add_argument('--days', type=int, default=180)
+	parser.add_argument('--session', type=int, default=20, help='questions per daily session (10, 20, 50 or 100)')
+	parser.add_argument('--initial-cards', type=int, default=50)
+	parser.add_argument('--new-cards', type=int, default=1, help='cards written per day')
+	parser.add_argument('--boxes', type=int, default=5, help='Leitner boxes of the deck')
+	parser.add_argument('--variants', nargs='+', default=['current'], choices=sorted(VARIANTS))
+	parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes (0: no pool)')
+	parser.add_argument('--curve', choices=['exponential', 'power'], default='exponential')
+	parser.add_argument('--stability', type=float, default=1.0, help='stability of a new card in days')
+	parser.add_argument('--growth', type=float, default=2.5)
+	parser.add_argument('--lapse', type=float, default=0.5)
+	parser.add_argument('--difficulty', type=float, default=0.4, help='highest card difficulty (0 - 1)')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--every', type=int, default=30, help='days between report lines')
+	parser.add_argument('--output', help='json file for the daily results')
+	args = parser.parse_args(argv)
+
+	plan = StudyPlan(args.days, args.session, args.initial_cards, args.new_cards, args.boxes)
+	model = ForgettingModel(args.curve, args.stability, args.growth, args.lapse, args.difficulty)
+	results = {}
+	for name in args.variants:
+		results[name] = simulate(plan, model, VARIANTS[name], args.learners, args.workers, args.seed)
+		print_report(name, results[name], args.every)
+
+	if args.output:
+		with open(args.output, 'w') as file:
+			json.dump({'plan': vars(plan), 'model': vars(model), 'variants': {name: VARIANTS[name] for name in args.variants},
+				'results': results}, file, indent=4)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,293 @@
+#! python3
+# suite.py - Benchmarks of the core hot paths at several deck sizes, with regression checks against a baseline.
+#				Measures latency (median and p95 of the timed call), throughput (cards or checks per second)
+#				and peak memory (tracemalloc) of every benchmark. Runs without a display: the graph is rendered
+#				with matplotlib's Agg backend.
+#
+# Usage: python -m benchmarks.suite [--sizes 1000 10000 100000] [--repeat 5] [--only NAME ...]
+#								[--output results.json] [--baseline baseline.json] [--save-baseline]
+#								[--threshold 0.25] [--memory-threshold 0.25]
+# The exit code is 1 if a benchmark regressed against the baseline.
+
+import argparse, json, os, platform, random, shutil, statistics, sys, tempfile, time, tracemalloc
+from unittest.mock import patch
+
+from app.database import Database
+import app.grading as grading
+from app.models import Card, Box
+import app.logic as logic
+from app.scheduling import get_scheduler
+from benchmarks.synthetic import generate_cards, generate_userdata, populate
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25 			#allowed slowdown of the median latency (0.25 = 25%)
+DEFAULT_MEMORY_THRESHOLD = 0.25 	#allowed growth of the peak memory
+MOVED_SHARE = 0.1 					#share of the cards arrange_boxes has to move per session
+SESSION_ANSWERS = 100 				#answers the sm2 and fsrs schedulers apply per arrange
+
+class Benchmark:
+	'''
+	One benchmarked function. setup(size) builds the state once per size, before(state) prepares one
+	timed call (untimed), run(state) is the timed call and returns the number of items it handled.
+	'''
+	def __init__(self, name, setup, run, before=None, teardown=None):
+		self.name = name
+		self.setup = setup
+		self.run = run
+		self.before = before
+		self.teardown = teardown
+
+def make_box(size, seed=0):
+	#Box of Card objects of a synthetic deck
+	return Box([Card(data['answer'], data['questions'], data['history'], data['box'], data['id'], data['tags'])
+		for data in generate_cards(size, seed)])
+
+#Database.load_cards / save_cards on a synthetic user in a temporary directory
+def setup_database(size):
+	temp_dir = tempfile.mkdtemp()
+	with patch.object(Database, 'get_basepath', return_value=temp_dir):
+		database = Database('bench_user')
+	populate(database, size, sessions=100)
+	return {'database': database, 'box': Box(), 'temp_dir': temp_dir, 'size': size}
+
+def teardown_database(state):
+	shutil.rmtree(state['temp_dir'])
+
+def before_load(state):
+	if any(state['box'].boxlist):
+		state['database'].save_cards(state['box'])
+
+def run_load(state):
+	state['database'].load_cards(state['box'])
+	return state['size'] 		#the cards file is read and rewritten
+
+def before_save(state):
+	if not any(state['box'].boxlist):
+		state['database'].load_cards(state['box'])
+
+def run_save(state):
+	state['database'].save_cards(state['box'])
+	return state['size']
+
+#logic.arrange_boxes after a session in which MOVED_SHARE of the cards changed their history
+def setup_arrange(size):
+	box = make_box(size)
+	return {'box': box, 'cards': [card for individual_box in box.boxlist for card in individual_box],
+		'rng': random.Random(0)}
+
+def before_arrange(state):
+	for card in state['rng'].sample(state['cards'], int(len(state['cards'])*MOVED_SHARE)):
+		card.history = [state['rng'].randint(0, 1) for _ in range(10)]
+
+def run_arrange(state):
+	logic.arrange_boxes(state['box'])
+	return len(state['cards'])
+
+#arrange of the sm2 and fsrs schedulers after a session of SESSION_ANSWERS answers
+def setup_scheduler(name):
+	def setup(size):
+		state = setup_arrange(size)
+		state['scheduler'] = get_scheduler(name, clock=lambda: 20000.0)
+		return state
+	return setup
+
+def before_scheduled(state):
+	rng = state['rng']
+	for card in rng.sample(state['cards'], min(SESSION_ANSWERS, len(state['cards']))):
+		card.pending.append(rng.random() < 0.7)
+
+def run_scheduled(state):
+	state['scheduler'].arrange(state['box'])
+	return len(state['cards'])
+
+#logic.get_session_cards for a 50 question session
+def setup_session(size):
+	return {'box': make_box(size)}
+
+def run_session(state):
+	return len(logic.get_session_cards(state['box'], 50))
+
+#grading.is_correct on the answers of a synthetic deck, half of the inputs correct
+def setup_is_correct(size):
+	rng = random.Random(0)
+	checks = []
+	for data in generate_cards(size):
+		answer = data['answer']
+		checks.append((answer if rng.random() < 0.5 else answer[::-1], answer))
+	return {'is_correct': grading.is_correct, 'checks': checks}
+
+def run_is_correct(state):
+	is_correct = state['is_correct']
+	for user_input, answer in state['checks']:
+		is_correct(user_input, answer)
+	return len(state['checks'])
+
+#WorkloadForecast.get over 90 days after a session: the cards file is cached, the loaded cards are counted again
+def setup_forecast(size):
+	from app.forecast import WorkloadForecast
+	state = setup_database(size)
+	state['database'].load_cards(state['box'])
+	state['forecast'] = WorkloadForecast(state['database'], state['box'])
+	state['forecast'].get(logic.scheduler, 90) 			#reads the cards file once
+	state['rng'] = random.Random(0)
+	return state
+
+def before_forecast(state):
+	cards = [card for individual_box in state['box'].boxlist for card in individual_box]
+	for card in state['rng'].sample(cards, min(SESSION_ANSWERS, len(cards))):
+		card.session_result(state['rng'].random() < 0.7)
+	logic.arrange_boxes(state['box'])
+
+def run_forecast(state):
+	state['forecast'].get(logic.scheduler, 90)
+	return state['size']
+
+#create_graphframe with a user data history of size sessions, rendered off screen
+def setup_graph(size):
+	import matplotlib
+	matplotlib.use('Agg')
+	import matplotlib.pyplot as plt
+	from matplotlib.backends.backend_agg import FigureCanvasAgg
+	import app.graph as graph
+
+	class HeadlessCanvas(FigureCanvasAgg):
+		#FigureCanvasTkAgg without Tk: draws into memory
+		def __init__(self, figure, master=None):
+			super().__init__(figure)
+
+		def get_tk_widget(self):
+			return self
+
+		def pack(self, **kwargs):
+			pass
+
+	return {'graph': graph, 'plt': plt, 'canvas': HeadlessCanvas, 'userdata': generate_userdata(size)}
+
+def run_graph(state):
+	with patch.object(state['graph'], 'FigureCanvasTkAgg', state['canvas']):
+		state['graph'].create_graphframe(None, state['userdata'])
+	state['plt'].close('all')
+	return 1
+
+BENCHMARKS = [
+	Benchmark('load_cards', setup_database, run_load, before_load, teardown_database),
+	Benchmark('save_cards', setup_database, run_save, before_save, teardown_database),
+	Benchmark('arrange_boxes', setup_arrange, run_arrange, before_arrange),
+	Benchmark('arrange_boxes_sm2', setup_scheduler('sm2'), run_scheduled, before_scheduled),
+	Benchmark('arrange_boxes_fsrs', setup_scheduler('fsrs'), run_scheduled, before_scheduled),
+	Benchmark('get_session_cards', setup_session, run_session),
+	Benchmark('is_correct', setup_is_correct, run_is_correct),
+	Benchmark('forecast', setup_forecast, run_forecast, before_forecast, teardown_database),
+	Benchmark('create_graphframe', setup_graph, run_graph),
+]
+
+def measure(benchmark, size, repeat) -> dict:
+	'''
+	Runs the benchmark repeat times at the size. Returns latency (ms), throughput (items/s) and peak memory (KiB).
+	'''
+	state = benchmark.setup(size)
+	try:
+		times = []
+		items = 0
+		for _ in range(repeat):
+			if benchmark.before is not None:
+				benchmark.before(state)
+			start = time.perf_counter()
+			items = benchmark.run(state)
+			times.append(time.perf_counter() - start)
+
+		#peak memory of one more call, measured separately because tracemalloc slows the call down
+		if benchmark.before is not None:
+			benchmark.before(state)
+		tracemalloc.start()
+		benchmark.run(state)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	finally:
+		if benchmark.teardown is not None:
+			benchmark.teardown(state)
+
+	times.sort()
+	median = statistics.median(times)
+	return {'median_ms': median*1000, 'p95_ms': times[min(len(times) - 1, int(len(times)*0.95))]*1000,
+		'throughput': items/median if median > 0 else 0, 'peak_kib': peak/1024, 'repeat': repeat}
+
+def run_suite(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, only=None, log=print) -> dict:
+	'''
+	Runs the benchmarks (all, or the ones named in only) at every size.
+	Returns the results keyed by "name[size]" with the details of the machine.
+	'''
+	results = {}
+	for benchmark in BENCHMARKS:
+		if only and benchmark.name not in only:
+			continue
+		for size in sizes:
+			key = f'{benchmark.name}[{size}]'
+			try:
+				results[key] = measure(benchmark, size, repeat)
+			except ImportError as e:		#optional dependency (matplotlib) missing
+				log(f'{key:<28} skipped: {e}')
+				break
+			result = results[key]
+			log(f'{key:<28}{result["median_ms"]:>12.2f} ms{result["p95_ms"]:>12.2f} ms p95'
+				f'{result["throughput"]:>14.0f}/s{result["peak_kib"]:>12.0f} KiB')
+	return {'meta': {'python': platform.python_version(), 'machine': platform.machine(), 'system': platform.system(),
+		'cpus': os.cpu_count(), 'time': time.time(), 'sizes': sizes, 'repeat': repeat}, 'results': results}
+
+def compare(results:dict, baseline:dict, threshold=DEFAULT_THRESHOLD, memory_threshold=DEFAULT_MEMORY_THRESHOLD) -> list:
+	'''
+	Regressions of results against baseline as a list of messages (empty if there are none).
+	A benchmark regresses if its median latency or peak memory grew by more than the threshold.
+	The baseline can override the thresholds per benchmark name: {"thresholds": {"is_correct": 0.5}}.
+	'''
+	overrides = baseline.get('thresholds', {})
+	regressions = []
+	for key, base in baseline['results'].items():
+		result = results['results'].get(key)
+		if result is None:
+			continue
+		allowed = overrides.get(key.split('[')[0], threshold)
+		if result['median_ms'] > base['median_ms']*(1 + allowed):
+			regressions.append(f'{key}: median {result["median_ms"]:.2f} ms vs baseline {base["median_ms"]:.2f} ms')
+		if result['peak_kib'] > base['peak_kib']*(1 + memory_threshold) + 1:
+			regressions.append(f'{key}: peak memory {result["peak_kib"]:.0f} KiB vs baseline {base["peak_kib"]:.0f} KiB')
+	return regressions
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmarks of the Leitner BoB hot paths.')
+	parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+	parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+	parser.add_argument('--only', nargs='+', help='names of the benchmarks to run')
+	parser.add_argument('--output', help='json file for the results')
+	parser.add_argument('--baseline', help='json file of earlier results to compare against')
+	parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+	parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+	parser.add_argument('--memory-threshold', type=float, default=DEFAULT_MEMORY_THRESHOLD)
+	args = parser.parse_args(argv)
+
+	results = run_suite(args.sizes, args.repeat, args.only)
+	if args.output:
+		with open(args.output, 'w') as file:
+			json.dump(results, file, indent=4)
+
+	if args.baseline and args.save_baseline:
+		if os.path.exists(args.baseline):		#keeping the per benchmark thresholds of the old baseline
+			with open(args.baseline, 'r') as file:
+				results['thresholds'] = json.load(file).get('thresholds', {})
+		with open(args.baseline, 'w') as file:
+			json.dump(results, file, indent=4)
+		print(f'Baseline saved to {args.baseline}')
+	elif args.baseline:
+		with open(args.baseline, 'r') as file:
+			baseline = json.load(file)
+		regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+		for message in regressions:
+			print(f'REGRESSION {message}')
+		if regressions:
+			return 1
+		print('No regressions against the baseline.')
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,104 @@
+#! python3
+# synthetic.py - Deterministic synthetic users and decks for scale tests and benchmarks.
+#				The same seed always gives the same cards (ids included), user data and files.
+#				Cards are generated box by box as a stream, so decks of millions of cards are written
+#				without holding them in memory, with any storage of storage.py.
+#
+# Usage: python -m benchmarks.synthetic USERNAME CARDS [--storage json|gzip|lzma] [--sessions N] [--seed N]
+
+import random
+
+BOX_SHARES = [0.35, 0.25, 0.18, 0.13, 0.09] 	#share of the cards per box, most cards are still being learned
+BOX_CORRECT = [(0, 1), (2, 3), (4, 5), (6, 7), (8, 10)]	#correct answers in the 10 session history per box (see logic.arrange_boxes)
+QUESTION_TYPES = [('input', 0.6), ('mcq', 0.15), ('both', 0.25)]
+VOCABULARY_SIZE = 5000
+TAGS = [f'deck{i}' for i in range(20)]
+
+def word(rng) -> str:
+	#Word of a zipf-like vocabulary, so the word frequencies look like real text for the search index
+	rank = int(VOCABULARY_SIZE**rng.random())
+	return f'w{rank}'
+
+def box_counts(cards:int) -> list:
+	#Number of cards in each box for a deck of the given size
+	counts = [int(cards*share) for share in BOX_SHARES]
+	counts[0] += cards - sum(counts)
+	return counts
+
+def make_history(rng, box:int) -> list:
+	#History of 10 sessions with the number of correct answers that puts the card in box
+	correct = rng.randint(*BOX_CORRECT[box-1])
+	history = [0]*10
+	for position in rng.sample(range(10), correct):
+		history[position] = 1
+	return history
+
+def make_card(rng, box:int) -> dict:
+	'''
+	Card data (as in Card.to_dict) of one random card in box.
+	'''
+	answer = ' '.join(word(rng) for _ in range(rng.randint(1, 3)))
+	question_type = rng.choices([name for name, share in QUESTION_TYPES], [share for name, share in QUESTION_TYPES])[0]
+	questions = [None, None]
+	if question_type in ('input', 'both'):
+		questions[0] = ' '.join(word(rng) for _ in range(rng.randint(3, 12))) + '?'
+	if question_type in ('mcq', 'both'):
+		options = [' '.join(word(rng) for _ in range(rng.randint(1, 3))) for _ in range(3)]
+		questions[1] = ' '.join(word(rng) for _ in range(rng.randint(3, 8))) + '?,' + ','.join(options)
+	tags = rng.sample(TAGS, rng.choice([0, 1, 1, 2]))
+	return {'id': f'{rng.getrandbits(128):032x}', 'answer': answer, 'questions': questions, 'box': box,
+		'history': make_history(rng, box), 'tags': tags}
+
+def generate_box(cards:int, box:int, seed:int=0):
+	'''
+	Generator of the cards of one box of a deck with cards cards in total.
+	Every box has its own random stream, so a box can be generated without the others.
+	'''
+	rng = random.Random(f'{seed}-box{box}')
+	for _ in range(box_counts(cards)[box-1]):
+		yield make_card(rng, box)
+
+def generate_cards(cards:int, seed:int=0):
+	#Generator of all cards of a deck, box by box
+	for box in range(1, len(BOX_SHARES) + 1):
+		yield from generate_box(cards, box, seed)
+
+def generate_userdata(sessions:int=1000, seed:int=0) -> dict:
+	'''
+	User data with a long history: the % of correct answers of every session, slowly improving with noise,
+	and the total pomodoro focus time in seconds.
+	'''
+	rng = random.Random(f'{seed}-userdata')
+	session_data = []
+	for session in range(sessions):
+		level = 40 + 45*session/max(sessions - 1, 1)
+		session_data.append(round(min(100, max(0, rng.gauss(level, 12))), 1))
+	return {'session_data': session_data, 'pomodoro': sessions*rng.randint(10, 25)*60}
+
+def populate(database, cards:int, sessions:int=1000, seed:int=0):
+	'''
+	Fills the cards file and the user data of database with a synthetic deck of 5 boxes, replacing what was there.
+	'''
+	database.set_box_count(len(BOX_SHARES))
+	database.write_cards(generate_cards(cards, seed))		#streamed into the file
+	database.save_userdata(generate_userdata(sessions, seed))
+	return database
+
+def main(argv=None):
+	import argparse
+	from app.database import Database
+
+	parser = argparse.ArgumentParser(description='Create a Leitner BoB user with a synthetic deck.')
+	parser.add_argument('username')
+	parser.add_argument('cards', type=int)
+	parser.add_argument('--storage', choices=['json', 'gzip', 'lzma'])
+	parser.add_argument('--sessions', type=int, default=1000)
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args(argv)
+
+	database = populate(Database(args.username, args.storage), args.cards, args.sessions, args.seed)
+	print(f'{args.cards} cards written for {args.username} ({database.disk_usage()} bytes, {database.storage.name})')
+	return 0
+
+if __name__ == '__main__':
+	raise SystemExit(main())
@@ -3,8 +3,9 @@ from app.gui import LeitnerApp
 
 if __name__ == '__main__':
 	username = access.get_username()
-	app = LeitnerApp(username)
-	app.run()
+	if username is not None:	#window closed without logging in
+		app = LeitnerApp(username)
+		app.run()
 
 	
 
@@ -1,8 +1,43 @@
 #!python3
 
 import pytest
+from functools import partial
 from app.app_logging import get_logger
+from app.database import Database
+
+class TmpDatabase(Database):
+	#Database that keeps its files in the test's temporary directory instead of data/,
+	#defined here (not in a fixture) so the pool's spawned workers can unpickle it
+	def __init__(self, username, basepath, storage=None):
+		self.tmp_basepath = basepath
+		super().__init__(username, storage)
+
+	def get_basepath(self, base):
+		return self.tmp_basepath
 
 @pytest.fixture(scope='session', autouse=True)
 def configure_logging():
 	get_logger('tests')
+
+@pytest.fixture
+def database_factory(tmp_path):
+	'''
+	Picklable factory of Databases kept in the test's temporary directory: database_factory(username, storage=None)
+	'''
+	return partial(TmpDatabase, basepath=str(tmp_path))
+
+@pytest.fixture
+def database(database_factory):
+	return database_factory('test_user')
+
+@pytest.fixture
+def synthetic_database(database_factory):
+	'''
+	Factory of Databases filled with a deterministic synthetic deck (benchmarks/synthetic.py), 
+	kept in the test's temporary directory: synthetic_database(cards, storage='json', sessions=100, seed=0)
+	'''
+	from benchmarks.synthetic import populate
+
+	def make(cards, storage='json', sessions=100, seed=0, username='synthetic_user'):
+		return populate(database_factory(username, storage=storage), cards, sessions, seed)
+	return make
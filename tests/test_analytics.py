@@ -0,0 +1,97 @@
+#! python3
+# test_analytics.py - Tests for the retention analytics in analytics.py
+
+import numpy as np
+import pytest
+
+import app.logic as logic
+from app.analytics import DeckAnalytics, analyze, history_matrix, read_card_data, LEECH_LAPSES
+from app.models import Card, Box
+
+def card_data(card_id, history, box=1):
+	return {'id': card_id, 'answer': card_id, 'questions': [f'{card_id}?', None], 'box': box, 'history': history}
+
+def test_history_matrix():
+	matrix = history_matrix([[1]*10, [0, 2], []])		#short histories are padded at the start
+	assert matrix.tolist() == [[1]*10, [0]*9 + [1], [0]*10]
+
+def test_retention_curves_and_recall():
+	rng = np.random.default_rng(0)
+	cards = []
+	for i in range(2000):
+		box = i % 2 + 1
+		recall = 0.5 if box == 1 else 0.9 				#box 2 cards are remembered better
+		history = [1] + (rng.random(9) < recall).astype(int).tolist()
+		cards.append(card_data(str(i), history, box))
+	cards.append(card_data('new', [0]*10))
+	analysis = analyze(*read_card_data(cards), box_count=5)
+
+	assert analysis.curve(1) == pytest.approx(0.5, abs=0.05)
+	assert analysis.curve(2) == pytest.approx(0.9, abs=0.05)
+	assert analysis.retention(2)[0] == pytest.approx(0.9, abs=0.05)
+	assert np.isnan(analysis.retention(3)).all() and analysis.curve(3) == pytest.approx(0.5)
+	assert analysis.trials.sum() == 2000*9 				#the 0s before the first correct answer are not answers
+
+	recall = analysis.recall_of(['0', '1', 'new', 'unknown'])
+	assert recall[0] < recall[1] 						#box 1 card below box 2 card
+	assert recall[2] == pytest.approx(analysis.curve(1)[0], abs=1e-6)
+
+	summary = analysis.summary()
+	assert summary['cards'] == 2001 and [row['cards'] for row in summary['boxes']] == [1001, 1000, 0, 0, 0]
+
+def test_leeches():
+	cards = [card_data('leech', [1, 0, 1, 0, 1, 0, 1, 1, 0, 0]), card_data('lapse', [0, 1, 1, 1, 0, 1, 1, 1, 1, 1]),
+		card_data('new', [0]*10)]
+	analysis = analyze(*read_card_data(cards), box_count=5)
+	assert analysis.lapses.tolist() == [4, 1, 0] and LEECH_LAPSES <= 4
+	assert analysis.leeches() == ['leech']
+
+def test_response_times(database):
+	cards = []
+	for i in range(40):
+		card = Card(str(i), [f'{i}?', None], box=1 + i % 2)
+		for answer in range(4):
+			card.session_result(answer != 0, latency=(2 + i % 2) if i else 20) 	#box 2 answers take longer
+		cards.append(card.to_dict())
+	database.write_cards(cards[1:])
+	box = Box([Card(cards[0]['answer'], cards[0]['questions'], cards[0]['history'], 1, '0', log=cards[0]['log'])])
+	analysis = DeckAnalytics(database, box).get()
+
+	assert analysis.latency[0].sum() == 40*3 					#only the right answers count
+	assert analysis.response_time(1, 0.5) == pytest.approx(2, rel=0.1)
+	assert analysis.response_time(2, 0.5) == pytest.approx(3, rel=0.1)
+	assert np.isnan(analysis.response_time(3))
+	assert analysis.slow_of(['0', '2', 'unknown']).tolist() == [1, 0, 0] 	#slower than the rest of box 1
+	assert analysis.summary()['boxes'][0]['slow'] == 1 and analysis.summary()['deck']['median_time'] is not None
+
+def test_cache_is_invalidated(database):
+	database.write_cards([card_data(str(i), [1, 0]*5, 2) for i in range(10)])
+	box = Box([Card('loaded', ['loaded?', None], [1]*10, box=3)])
+	analytics = DeckAnalytics(database, box)
+
+	first = analytics.get()
+	assert len(first) == 11 and analytics.get() is first
+	assert analytics.leech_cards()[0]['answer'] == '0'
+
+	box.box3[0].session_result(False) 				#a new review
+	second = analytics.get()
+	assert second is not first and second.lapses[0] == 1
+
+	database.append_cards([card_data('new', [0]*10)]) 	#the cards file changed
+	assert len(analytics.get()) == 12
+
+def test_leitner_asks_weak_cards_more_often(database):
+	box = Box()
+	box.box2.extend(Card(f'strong{i}', [f'q{i}', None], [1]*10, box=2) for i in range(20))
+	box.box2.extend(Card(f'weak{i}', [f'q{i}', None], [1, 0]*5, box=2) for i in range(20))
+	active = logic.scheduler
+	try:
+		logic.use_scheduler('leitner')
+		logic.use_analytics(DeckAnalytics(database, box))
+		logic.use_scheduler('leitner') 				#a new scheduler keeps the analytics
+		assert logic.scheduler.analytics is not None and active.analytics is None
+		asked = [card.answer for _ in range(50) for card in logic.scheduler.sample(box.box2, 10)]
+	finally:
+		logic.scheduler = active
+	weak = sum(answer.startswith('weak') for answer in asked)
+	assert weak > 0.7*len(asked) and len(set(asked)) > 20
@@ -0,0 +1,42 @@
+#! python3
+# test_app_logging.py - Tests for the sampling of app_logging.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import app.app_logging as app_logging
+
+def make_record(level):
+	return logging.LogRecord('test', level, __file__, 0, 'message %s', ('arg',), None)
+
+def test_sample_filter_keeps_one_in_every():
+	sample = app_logging.SampleFilter(10)
+	kept = [sample.filter(make_record(logging.INFO)) for _ in range(30)]
+	assert kept.count(True) == 3
+	assert kept[0] 		#the first record is always kept
+
+def test_sample_filter_is_thread_safe():
+	sample = app_logging.SampleFilter(10)
+	with ThreadPoolExecutor(8) as executor:
+		kept = list(executor.map(lambda i: sample.filter(make_record(logging.INFO)), range(8000)))
+	assert kept.count(True) == 800 		#no count is lost or repeated
+
+def test_sample_filter_keeps_warnings():
+	sample = app_logging.SampleFilter(1000)
+	sample.filter(make_record(logging.INFO))
+	assert all(sample.filter(make_record(logging.WARNING)) for _ in range(5))
+	assert all(sample.filter(make_record(logging.ERROR)) for _ in range(5))
+
+def test_set_sampling_replaces_filter():
+	logger = logging.getLogger('test.sampled')
+	app_logging.set_sampling('test.sampled', 5)
+	app_logging.set_sampling('test.sampled', 3)
+	filters = [log_filter for log_filter in logger.filters if isinstance(log_filter, app_logging.SampleFilter)]
+	assert len(filters) == 1 and filters[0].every == 3
+
+	app_logging.set_sampling('test.sampled', 1)
+	assert not logger.filters
+
+def test_models_logger_is_sampled():
+	import app.models
+	assert any(isinstance(log_filter, app_logging.SampleFilter) for log_filter in app.models.logger.filters)
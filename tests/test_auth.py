@@ -0,0 +1,178 @@
+#! python3
+# test_auth.py - Tests for the credential store in auth.py
+
+import io, os, json, sqlite3, pytest
+from cryptography.fernet import Fernet
+
+import app.auth as auth
+from app.auth import CredentialStore
+
+FAST_KDF = {'n': 2**4, 'r': 8, 'p': 1}	#cheap scrypt cost so the tests stay fast
+
+@pytest.fixture
+def store(tmp_path):
+	store = CredentialStore(key_file=str(tmp_path/'secret.key'), db_file=str(tmp_path/'users.db'),
+		legacy_file=str(tmp_path/'user.enc'), kdf='scrypt', params=FAST_KDF)
+	yield store
+	store.close()
+
+def test_store_is_lazy(tmp_path, store):
+	#creating the store must not touch any file
+	assert os.listdir(tmp_path) == []
+
+def test_register_and_login(store):
+	assert store.register('testuser', 'password1')
+	assert not store.register('testuser', 'password2')	#username already taken
+
+	assert store.login('testuser', 'password1')
+	assert not store.login('testuser', 'password2')
+	assert not store.login('nouser', 'password1')
+	assert not store.login('test', 'password1')			#too short
+
+def test_password_is_hashed(store):
+	store.register('testuser', 'password1')
+
+	record, token = store.load_record('testuser')
+	assert 'password' not in record
+	assert record['kdf'] == 'scrypt'
+	assert record['hash'] != 'password1'
+
+def test_legacy_migration_and_rehash(tmp_path, store):
+	key = Fernet.generate_key()
+	with open(tmp_path/'secret.key', 'wb') as file:
+		file.write(key)
+	with open(tmp_path/'user.enc', 'wb') as file:
+		file.write(Fernet(key).encrypt(json.dumps({'olduser': 'oldpass1'}).encode()))
+
+	assert store.login('olduser', 'oldpass1')
+	assert os.path.exists(tmp_path/'user.enc.migrated')
+
+	record, token = store.load_record('olduser')
+	assert 'password' not in record		#plain password replaced after the first login
+	assert store.login('olduser', 'oldpass1')
+
+def test_undecryptable_legacy_file_is_skipped(tmp_path, store):
+	with open(tmp_path/'user.enc', 'wb') as file: 		#encrypted with another key
+		file.write(Fernet(Fernet.generate_key()).encrypt(json.dumps({'olduser': 'oldpass1'}).encode()))
+
+	assert store.register('testuser', 'password1')
+	assert store.login('testuser', 'password1')
+	assert not store.login('olduser', 'oldpass1')
+	assert os.path.exists(tmp_path/'user.enc') 		#kept for recovery
+
+def test_concurrent_legacy_migration(tmp_path, store, monkeypatch):
+	key = Fernet.generate_key()
+	with open(tmp_path/'secret.key', 'wb') as file:
+		file.write(key)
+	with open(tmp_path/'user.enc', 'wb') as file:
+		file.write(Fernet(key).encrypt(json.dumps({'olduser': 'oldpass1'}).encode()))
+
+	def renamed_by_another_process(source, target):
+		raise FileNotFoundError(source)
+	monkeypatch.setattr(auth.os, 'replace', renamed_by_another_process)
+	assert store.login('olduser', 'oldpass1')
+
+def test_verify_cache(store):
+	store.register('testuser', 'password1')
+
+	with pytest.MonkeyPatch.context() as mp:
+		assert store.login('testuser', 'password1')
+		mp.setattr(auth, 'derive_key', lambda *args: pytest.fail('slow hash used for a cached login'))
+		assert store.login('testuser', 'password1')
+
+	assert not store.login('testuser', 'wrongpass')
+
+def test_login_async(store):
+	store.register('testuser', 'password1')
+
+	assert store.login_async('testuser', 'password1').result() is True
+	assert store.login_async('testuser', 'wrongpass').result() is False
+
+def test_short_credentials_are_not_registered(store):
+	assert not store.register('testuser', 'pass')
+	assert not store.register('test', 'password1')
+	assert store.register_async('testuser', 'pass').result() is False
+	assert store.load_record('testuser') == (None, None)
+
+def test_cli_register(store, monkeypatch, capsys):
+	monkeypatch.setattr(auth, 'default_store', store)
+	monkeypatch.setattr('sys.stdin', io.StringIO('pass\n'))
+	assert auth.main(['register', 'testuser']) == 1 		#too short to ever log in
+	monkeypatch.setattr('sys.stdin', io.StringIO('password1\n'))
+	assert auth.main(['register', 'testuser']) == 0
+	monkeypatch.setattr('sys.stdin', io.StringIO('password1\n'))
+	assert auth.main(['login', 'testuser']) == 0
+	assert capsys.readouterr().out.split() == ['failed', 'ok', 'ok']
+
+def test_authenticate(store):
+	store.register('testuser', 'password1')
+	assert auth.authenticate('testuser', 'password1', store)
+
+def test_record_round_trip(tmp_path, store):
+	store.register('testuser', 'password1')
+	store.close()
+
+	connection = sqlite3.connect(tmp_path/'users.db')
+	token = connection.execute('SELECT token FROM credentials').fetchone()[0]
+	connection.close()
+	assert b'testuser' not in token and b'password1' not in token 	#encrypted at rest
+	reopened = CredentialStore(key_file=str(tmp_path/'secret.key'), db_file=str(tmp_path/'users.db'),
+		legacy_file=str(tmp_path/'user.enc'), kdf='scrypt', params=FAST_KDF)
+	assert reopened.load_record('testuser')[0]['username'] == 'testuser'
+	assert reopened.login('testuser', 'password1')
+	reopened.close()
+
+def test_tampered_or_foreign_record_is_rejected(tmp_path, store):
+	store.register('testuser', 'password1')
+	store.register('otheruser', 'password2')
+	store.close()
+
+	connection = sqlite3.connect(tmp_path/'users.db')
+	token = bytearray(connection.execute('SELECT token FROM credentials WHERE user_key = ?', (auth.user_key('testuser'),)).fetchone()[0])
+	token[len(token)//2] ^= 1
+	with connection:
+		connection.execute('UPDATE credentials SET token = ? WHERE user_key = ?', (bytes(token), auth.user_key('testuser')))
+	connection.close()
+	assert not store.login('testuser', 'password1')
+	assert store.login('otheruser', 'password2')
+	store.close()
+
+	with open(tmp_path/'secret.key', 'wb') as file: 	#records of another key
+		file.write(Fernet.generate_key())
+	other_key = CredentialStore(key_file=str(tmp_path/'secret.key'), db_file=str(tmp_path/'users.db'),
+		legacy_file=str(tmp_path/'user.enc'), kdf='scrypt', params=FAST_KDF)
+	assert not other_key.login('otheruser', 'password2')
+	other_key.close()
+
+@pytest.mark.parametrize('kdf, params', [('scrypt', FAST_KDF), ('pbkdf2_sha256', {'iterations': 1000})])
+def test_hash_and_verify(kdf, params):
+	record = auth.hash_password('password1', kdf, params)
+	assert record['kdf'] == kdf and record['params'] == params
+	assert auth.verify_password(record, 'password1')
+	assert not auth.verify_password(record, 'password2')
+	assert auth.hash_password('password1', kdf, params)['salt'] != record['salt'] 	#fresh salt per hash
+
+def test_cache_does_not_accept_a_changed_password(store):
+	store.register('testuser', 'password1')
+	assert store.login('testuser', 'password1') 			#cached now
+
+	record, token = store.load_record('testuser')
+	store.update_record('testuser', token, store.encrypt_hashed_record('testuser', 'password2')) 	#password changed
+	assert not store.login('testuser', 'password1')
+	assert store.login('testuser', 'password2')
+
+def test_rehash_on_login(tmp_path, store):
+	store.register('testuser', 'password1')
+	store.close()
+
+	stronger = {'n': 2**5, 'r': 8, 'p': 1}
+	upgraded = CredentialStore(key_file=str(tmp_path/'secret.key'), db_file=str(tmp_path/'users.db'),
+		legacy_file=str(tmp_path/'user.enc'), kdf='scrypt', params=stronger)
+	assert upgraded.needs_rehash(upgraded.load_record('testuser')[0])
+	assert not upgraded.login('testuser', 'password2') 		#no rehash without the right password
+	assert upgraded.load_record('testuser')[0]['params'] == FAST_KDF
+	assert upgraded.login('testuser', 'password1')
+	record = upgraded.load_record('testuser')[0]
+	assert record['params'] == stronger and not upgraded.needs_rehash(record)
+	assert upgraded.login('testuser', 'password1')
+	upgraded.close()
@@ -0,0 +1,23 @@
+#! python3
+# test_benchmarks.py - Tests for the benchmark suite in benchmarks/suite.py
+
+from benchmarks.suite import run_suite, compare
+
+def test_run_suite_headless():
+	results = run_suite(sizes=[200], repeat=2, only=['load_cards', 'arrange_boxes', 'is_correct'], log=lambda line: None)
+
+	assert set(results['results']) == {'load_cards[200]', 'arrange_boxes[200]', 'is_correct[200]'}
+	for result in results['results'].values():
+		assert result['median_ms'] >= 0 and result['peak_kib'] > 0 and result['repeat'] == 2
+	assert results['results']['is_correct[200]']['throughput'] > 0
+
+def test_compare():
+	baseline = {'results': {'a[10]': {'median_ms': 10, 'peak_kib': 100}, 'b[10]': {'median_ms': 10, 'peak_kib': 100}},
+		'thresholds': {'b': 1.0}}
+	results = {'results': {'a[10]': {'median_ms': 13, 'peak_kib': 100}, 'b[10]': {'median_ms': 19, 'peak_kib': 200}}}
+
+	regressions = compare(results, baseline, threshold=0.25, memory_threshold=0.25)
+
+	assert len(regressions) == 2
+	assert regressions[0].startswith('a[10]: median')		#30% slower than allowed
+	assert regressions[1].startswith('b[10]: peak memory')	#b may be twice as slow, but not use twice the memory
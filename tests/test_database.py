@@ -6,6 +6,7 @@ from unittest.mock import patch, mock_open, MagicMock
 
 from app.database import Database 
 from app.models import Card, Box
+from app.search import card_tokens
 
 #Fixutre for 'data' path 
 @pytest.fixture
@@ -49,14 +50,15 @@ def sample_box():
 
 def test_database_creation(mock_database):
 	assert mock_database.username == 'test_user'
-	assert mock_database.filenames == ['box1.json', 'box2.json', 'box3.json', 'box4.json', 'box5.json']
+	assert mock_database.filename == 'cards.json'
+	assert mock_database.boxes == 5
 
 	#checking username based dir 
 	user_path = os.path.join(mock_database.basepath, 'test_user')
 	assert os.path.exists(user_path)
 
 	#checking creation os default files 
-	for filename in mock_database.filenames:
+	for filename in [mock_database.filename, 'deck.json']:
 		file_path = os.path.join(user_path, filename)
 		assert os.path.exists(file_path)
 
@@ -72,9 +74,8 @@ def test_check_dir(test_data_path):
 
 		assert os.path.exists(user_path)
 
-		for filename in db.filenames:
-			file_path = os.path.join(user_path, filename)
-			assert os.path.exists(file_path)
+		file_path = os.path.join(user_path, db.filename)
+		assert os.path.exists(file_path)
 
 		user_data_path = os.path.join(user_path, 'existing_user.json')
 		assert os.path.exists(user_data_path)
@@ -124,36 +125,25 @@ def test_save_cards(mock_database, sample_box):
 
 	mock_database.save_cards(sample_box)
 
-	box1_path = os.path.join(mock_database.basepath, 'test_user', 'box1.json')
-	with open(box1_path, 'r') as f:
+	cards_path = os.path.join(mock_database.basepath, 'test_user', 'cards.json')
+	with open(cards_path, 'r') as f:
 		data = json.load(f)
 
 	assert len(data) == 5
 
 	assert data[0]['answer'] == "Answer 0"
 	assert data[0]['questions'] == ["Question 0", None]
-	assert len(data[0]['history']) == 10
+	assert data[0]['history'] == [] 			#new cards have no answers yet
+	assert all(card['box'] == 1 for card in data)
 
 	for box in sample_box.boxlist:
 		assert len(box) == 0
 
-	for i in range(5):
-		file_path = os.path.join(mock_database.basepath, 'test_user', f'box{i+1}.json')
-		with open(file_path, 'r') as f:
-			data = json.load(f)
-
-			if i == 0:
-				assert len(data) == 5
-			else:
-				assert len(data) == 0
-
 def test_load_cards(mock_database):
 
-	for i in range(5):
-		card = Card(f'answer{i+1}', [f'question{i+1}'])
-		file_path = os.path.join(mock_database.basepath, 'test_user', f'box{i+1}.json')
-		with open(file_path, 'w') as f:
-			json.dump([card.to_dict()], f)
+	file_path = os.path.join(mock_database.basepath, 'test_user', 'cards.json')
+	with open(file_path, 'w') as f:
+		json.dump([Card(f'answer{i+1}', [f'question{i+1}'], box=i+1).to_dict() for i in range(5)], f)
 
 	box = Box()
 	mock_database.load_cards(box)
@@ -163,12 +153,10 @@ def test_load_cards(mock_database):
 		assert card.get_answer() == f'answer{i+1}'
 		assert card.get_question(0) == f'question{i+1}'
 
-	#check for if files are empty as everything is loaded
-	for i in range(5):
-		file_path = os.path.join(mock_database.basepath, 'test_user', f'box{i+1}.json')
-		with open(file_path, 'r') as f:
-			data = json.load(f)
-			assert len(data) == 0
+	#check for if the file is empty as everything is loaded
+	with open(file_path, 'r') as f:
+		data = json.load(f)
+		assert len(data) == 0
 
 def test_load_cards_many(mock_database):
 	cardlist = []
@@ -188,19 +176,146 @@ def test_load_cards_many(mock_database):
 	assert len(box_other.box1) == 1
 	assert len(box_other.box2) == 50
 
-	box2_path = os.path.join(mock_database.basepath, 'test_user', 'box2.json')
-	with open(box2_path, 'r') as file:
+	cards_path = os.path.join(mock_database.basepath, 'test_user', 'cards.json')
+	with open(cards_path, 'r') as file:
 		data = json.load(file)
 		assert len(data) == 10  
+		assert all(card['box'] == 2 for card in data)
+
+
+
+
+
+
+
+
+
+
+
 
+def test_search_index(mock_database):
+	#cards saved before cards had ids
+	file_path = os.path.join(mock_database.basepath, 'test_user', 'cards.json')
+	with open(file_path, 'w') as f:
+		json.dump([{'answer': 'Paris', 'questions': ['Capital of France?', None], 'box': 2, 'history': [0]*10}], f)
 
+	box = Box()
+	loaded_card = Card('Berlin', ['Capital of Germany?', None])
+	box.box1.append(loaded_card)
+
+	index = mock_database.get_search_index(box)
+	assert box.search_index is index
+
+	with open(file_path, 'r') as f:
+		data = json.load(f)
+	assert index.search('france') == [data[0]['id']]	#the new id is stored with the card
+	assert index.search('germany') == [loaded_card.id]
+
+	assert os.path.exists(os.path.join(mock_database.basepath, 'test_user', 'search_index.json'))
+
+def test_stale_indexes_are_rebuilt(mock_database):
+	mock_database.write_cards([Card(f'answer{i}', [f'question{i}?', None]).to_dict() for i in range(60)])
+	box = Box()
+	mock_database.load_cards(box) 			#the cards file changes before the indexes are opened
+	mock_database.open_indexes(box)
+	mock_database.save_cards(box)
+	mock_database.save_search_index()
+
+	reopened = Database('test_user')
+	reopened.load_cards(Box())
+	with patch.object(Database, 'read_cards', side_effect=AssertionError('rebuilt a valid index')):
+		reopened.open_indexes()
+	assert len(reopened.search_index) == 60
+
+	data = list(reopened.iter_file()) 		#edited by hand
+	data[0]['answer'] = 'Lisbon'
+	with open(reopened.cards_path(), 'w') as f:
+		json.dump(data, f)
+	edited = Database('test_user')
+	assert edited.get_search_index().search('lisbon') == [data[0]['id']]
+	assert edited.hash_index.find('Lisbon', data[0]['questions']) == data[0]['id']
+
+def test_take_cards(mock_database):
+	cards = [Card(f'answer{i}', [f'question{i}?', None], box=i % 5 + 1) for i in range(10)]
+	mock_database.write_cards([card.to_dict() for card in cards])
+	box = Box()
+	taken = mock_database.take_cards(box, [cards[3].id, cards[7].id, 'missing'])
 
+	assert sorted(card.id for card in taken) == sorted([cards[3].id, cards[7].id])
+	assert [card.id for card in box.box4] == [cards[3].id] and [card.id for card in box.box3] == [cards[7].id]
+	assert len(list(mock_database.iter_file())) == 8 	#taken out of the file, no duplicates
+	assert mock_database.take_cards(box, []) == []
 
+def test_dedup_cards(mock_database):
+	card = Card('Paris', ['Capital of France?', None])
+	duplicate = Card('paris', ['capital of france?', None])
+	card.box = 3
+	with open(os.path.join(mock_database.basepath, 'test_user', 'cards.json'), 'w') as f:
+		json.dump([duplicate.to_dict(), card.to_dict(), duplicate.to_dict(),
+			Card('Berlin', ['Capital of Germany?', None]).to_dict()], f)
 
+	box = Box()
+	loaded = Card('PARIS', ['Capital of France?', None])	#duplicate loaded in the session
+	box.box1.append(loaded)
 
+	removed = mock_database.dedup_cards(box)
 
+	assert removed == 3
+	assert box.box1 == []
+	with open(os.path.join(mock_database.basepath, 'test_user', 'cards.json'), 'r') as f:
+		data = json.load(f)
+	assert [(card['answer'], card['box']) for card in data] == [('Paris', 3), ('Berlin', 1)]	#the card with the most progress is kept
+	assert box.is_duplicate('Paris', ['Capital of France?', None])
+
+def test_dedup_reindexes_the_merged_card(mock_database):
+	kept = Card('Paris', ['Capital of France?', None])
+	kept.box = 2
+	duplicate = Card('paris', ['capital of france?', ' ']) 	#same content, a blank question type to merge
+	with open(os.path.join(mock_database.basepath, 'test_user', 'cards.json'), 'w') as f:
+		json.dump([kept.to_dict(), duplicate.to_dict()], f)
+	index = mock_database.get_search_index()
+
+	with patch.object(index, 'add', wraps=index.add) as add:
+		assert mock_database.dedup_cards() == 1
+	with open(os.path.join(mock_database.basepath, 'test_user', 'cards.json'), 'r') as f:
+		data = json.load(f)
+	assert data[0]['questions'] == ['Capital of France?', ' ']
+	add.assert_called_once_with(kept.id, 'Paris', data[0]['questions']) 	#indexed as merged
+	assert index.docs[kept.id] == tuple(card_tokens(kept.answer, data[0]['questions']))
+	assert index.search('france') == [kept.id] and duplicate.id not in index.docs
 
+def test_load_cards_keeps_duplicates(mock_database):
+	#equal card data in a file must not be collapsed when cards are loaded
+	data = Card('answer', ['question', None]).to_dict()
+	with open(os.path.join(mock_database.basepath, 'test_user', 'cards.json'), 'w') as f:
+		json.dump([data]*60, f)
 
+	box = Box()
+	mock_database.load_cards(box)
 
+	assert len(box.box1) == 50
+	with open(os.path.join(mock_database.basepath, 'test_user', 'cards.json'), 'r') as f:
+		assert len(json.load(f)) == 10
 
+def test_set_box_count(mock_database):
+	mock_database.write_cards([Card(f'answer{i}', [f'question{i}', None], box=i+1).to_dict() for i in range(5)])
+	box = Box()
+	mock_database.load_cards(box)
+
+	mock_database.set_box_count(8, box)
+	assert len(box.boxlist) == 8 and box.box8 == []
+	box.move_cards([box.box5[0].id], 8)
+	mock_database.save_cards(box)
 
+	with patch.object(Database, 'get_basepath', return_value=mock_database.basepath):
+		reopened = Database('test_user')
+	assert reopened.boxes == 8
+	box = Box(boxes=reopened.boxes)
+	reopened.load_cards(box)
+	assert [len(individual_box) for individual_box in box.boxlist] == [1, 1, 1, 1, 0, 0, 0, 1]
+
+	reopened.set_box_count(3, box)
+	assert [len(individual_box) for individual_box in box.boxlist] == [1, 1, 3]
+	assert all(card.box == 3 for card in box.box3)
+	with pytest.raises(ValueError):
+		reopened.set_box_count(11)
@@ -0,0 +1,59 @@
+#! python3
+# test_dedup.py - Tests for duplicate detection in dedup.py
+
+from app.dedup import HashIndex, content_hash, merge_card_data
+from app.models import Card, Box
+
+def test_content_hash_normalization():
+	base = content_hash('Paris', ['Capital of France?', 'Capital?,London,Berlin,Rome'])
+
+	assert content_hash('  paris ', ['capital   of FRANCE?', 'capital?, Rome,London ,Berlin']) == base
+	assert content_hash('Paris', ['Capital of France?', None]) != base
+	assert content_hash('Lyon', ['Capital of France?', 'Capital?,London,Berlin,Rome']) != base
+
+def test_hash_index():
+	index = HashIndex()
+	card = Card('Paris', ['Capital of France?', None])
+
+	assert index.add_card(card)
+	assert index.is_duplicate('PARIS', ['capital of france?', None])
+	assert not index.is_duplicate('Paris', ['Capital of France?', None], card.id)	#a card is not its own duplicate
+
+	card.answer = 'Lyon'
+	index.update_card(card)
+	assert not index.is_duplicate('Paris', ['Capital of France?', None])
+
+	index.remove_card(card)
+	assert len(index) == 0
+
+def test_duplicates_survive_removing_the_original(tmp_path):
+	index = HashIndex(str(tmp_path/'hash_index.json'))
+	assert index.add('original', 'Paris', ['Capital of France?', None])
+	assert not index.add('copy', 'paris', ['capital of france?', None])
+
+	index.remove('original') 			#the copy still holds the content
+	assert index.is_duplicate('Paris', ['Capital of France?', None])
+	assert not index.is_duplicate('Paris', ['Capital of France?', None], 'copy')
+	assert not index.add('new', 'PARIS', ['Capital of France?', None])
+
+	index.save()
+	loaded = HashIndex.load(index.path)
+	loaded.remove('copy')
+	assert loaded.find('Paris', ['Capital of France?', None]) == 'new'
+	loaded.remove('new')
+	assert loaded.find('Paris', ['Capital of France?', None]) is None and loaded.by_hash == {}
+
+def test_merge_card_data():
+	kept = {'id': 'a', 'questions': ['Capital of France?', None], 'box': 3}
+	merged = merge_card_data(kept, {'id': 'b', 'questions': [None, 'Capital?,London,Berlin,Rome'], 'box': 1})
+
+	assert merged['questions'] == ['Capital of France?', 'Capital?,London,Berlin,Rome']
+	assert merged['id'] == 'a' and merged['box'] == 3
+
+def test_box_rejects_duplicates():
+	box = Box()
+	box.hash_index = HashIndex()
+
+	assert box.add_question('Paris', ['Capital of France?', None]) is not None
+	assert box.add_question('paris', ['capital of france?', None]) is None
+	assert len(box.box1) == 1
@@ -0,0 +1,107 @@
+#! python3
+# test_export.py - Tests for the exporter and snapshots
+
+import os, csv, json, tarfile, threading, pytest
+from unittest.mock import patch
+
+from app.database import Database
+from app.storage import iter_json_list
+from app.export import export_deck, backup
+from app.importer import import_file
+from app.models import Card, Box
+
+@pytest.fixture
+def database(tmp_path):
+	with patch.object(Database, 'get_basepath', return_value=str(tmp_path / 'data')):
+		os.mkdir(tmp_path / 'data')
+		database = Database('test_user')
+		database.save_userdata({'pomodoro': [60]})
+		database.write_cards([Card(f'answer {i}{j}', [f'question {i}{j}', None], box=i+1).to_dict() for i in range(5) for j in range(3)])
+		yield database
+
+def test_iter_json_list(tmp_path):
+	path = str(tmp_path / 'list.json')
+	data = [{'text': 'x'*100, 'nested': [1, {'a': ']'}], 'i': i} for i in range(200)]
+	with open(path, 'w') as f:
+		json.dump(data, f, indent=4)
+
+	assert list(iter_json_list(path, chunk_size=64)) == data		#items spanning many chunks
+
+	with open(path, 'w') as f:
+		f.write('[]')
+	assert list(iter_json_list(path)) == []
+
+def test_snapshot_is_point_in_time(database):
+	box = Box()
+	box.box2.append(Card('loaded', ['loaded question', None], box=2))
+
+	with database.snapshot(box) as snapshot:
+		database.write_cards([])			#the app keeps saving after the snapshot
+		database.save_userdata({})
+
+		answers = [card['answer'] for card in snapshot.iter_cards()]
+		assert len(answers) == 16
+		assert answers[3:6] == ['answer 10', 'answer 11', 'answer 12'] and answers[-1] == 'loaded'
+		assert snapshot.load_userdata() == {'pomodoro': [60]}
+	assert not os.path.exists(snapshot.path)
+
+def test_export_csv_round_trip(database, tmp_path):
+	database.write_cards([Card('Paris', ['Capital of France?', 'Capital?,London,Berlin,Rome'], tags=['geo']).to_dict()]
+		+ [data for data in database.read_cards() if data['box'] != 1])
+	path = str(tmp_path / 'deck.csv')
+
+	assert export_deck(database, path) == 13
+
+	with open(path, newline='') as f:
+		rows = list(csv.reader(f))
+	assert rows[1][:6] == ['Capital of France?', 'Paris', 'Capital?', 'London,Berlin,Rome', 'geo', '1']
+
+	with patch.object(Database, 'get_basepath', return_value=str(tmp_path / 'other')):
+		os.mkdir(tmp_path / 'other')
+		other = Database('other_user')
+		report = import_file(other, path)			#an export can be imported again
+	assert report.imported == 13 and report.invalid == 0
+
+def test_snapshot_waits_for_an_import(database, tmp_path):
+	path = str(tmp_path / 'new.csv')
+	with open(path, 'w', newline='') as f:
+		csv.writer(f).writerows([[f'new question {i}', f'new answer {i}'] for i in range(30)])
+	threads, counts = [], []
+
+	def export_from_another_thread(report):
+		export_path = str(tmp_path / f'deck{len(threads)}.jsonl')
+		threads.append(threading.Thread(target=lambda: counts.append(export_deck(database, export_path))))
+		threads[-1].start()
+		threads[-1].join(0.2) 				#blocked until the import is done
+
+	import_file(database, path, batch_size=10, progress=export_from_another_thread)
+	for thread in threads:
+		thread.join()
+	assert len(threads) == 3 and counts == [45, 45, 45] 	#every export holds all of the import
+
+def test_failed_export_leaves_no_file(database, tmp_path):
+	path = str(tmp_path / 'deck.csv')
+	with patch('app.export.write_csv', side_effect=OSError('disk full')), pytest.raises(OSError):
+		export_deck(database, path)
+	assert os.listdir(tmp_path) == ['data']
+
+def test_export_jsonl_and_archive(database, tmp_path):
+	jsonl_path = str(tmp_path / 'deck.jsonl')
+	assert export_deck(database, jsonl_path) == 15
+	with open(jsonl_path) as f:
+		lines = [json.loads(line) for line in f]
+	assert lines[0] == {'username': 'test_user', 'userdata': {'pomodoro': [60]}}
+	assert lines[-1]['box'] == 5
+
+	backup_dir = os.path.join(database.basepath, 'test_user', 'backups')
+	os.makedirs(backup_dir)
+	with open(os.path.join(backup_dir, '20000101-000000.tar.gz'), 'w'):
+		pass											#an older backup that is rotated out
+	archive_path = backup(database, keep=1)
+
+	assert os.listdir(backup_dir) == [os.path.basename(archive_path)]
+	with tarfile.open(archive_path) as archive:
+		names = archive.getnames()
+		manifest = json.load(archive.extractfile('manifest.json'))
+	assert {'test_user/cards.json', 'test_user/deck.json', 'test_user/test_user.json'} <= set(names)
+	assert manifest['cards'] == 15
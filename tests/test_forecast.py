@@ -0,0 +1,60 @@
+#! python3
+# test_forecast.py - Tests for the workload forecast in forecast.py
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from app.forecast import WorkloadForecast, review_intervals, histogram, project, suggested_session, MAX_HORIZON
+from app.models import Card, Box
+from app.scheduling import get_scheduler
+
+def card_data(card_id, box=1, state=None):
+	return {'id': card_id, 'answer': card_id, 'questions': [f'{card_id}?', None], 'box': box, 'history': [0]*10, 'state': state}
+
+def test_review_intervals():
+	assert review_intervals(5).tolist() == [1, 3, 7, 21, 63]
+	assert review_intervals(2).tolist() == [1, 3]
+	assert list(review_intervals(8)) == sorted(review_intervals(8)) and review_intervals(8)[0] == 1
+
+def test_projection():
+	intervals = review_intervals(5)
+	counts = histogram(np.zeros(5), np.array([1]), np.array([100.0]), intervals, 31, now=100.5)
+	due = project(counts, intervals, 31, recall=1) 			#a box 1 card due today, always answered right
+	assert np.flatnonzero(due.sum(axis=1)).tolist() == [0, 3, 10]
+	assert due[3, 1] == 1 and due[10, 2] == 1
+
+	counts = histogram(np.array([10, 30, 0, 0, 0]), np.zeros(0, int), np.zeros(0), intervals, 64, now=0)
+	assert counts[1, :3].tolist() == [10, 10, 10] 				#spread over the interval of the box
+	due = project(counts, intervals, 90, recall=0.5)
+	assert due[0].tolist() == [10, 10, 0, 0, 0]
+	assert due.sum(axis=1).min() > 0 and suggested_session(due) == 10
+
+def test_forecast_of_file_and_loaded_cards(database):
+	database.write_cards([card_data(f'file{i}', box=i % 2 + 1) for i in range(40)])
+	box = Box([Card('loaded', ['loaded?', None], box=3)])
+	forecast = WorkloadForecast(database, box)
+	leitner = get_scheduler('leitner', clock=lambda: 1000.0)
+
+	due = forecast.get(leitner)
+	assert due.shape == (30, 5) and due[0].tolist() == pytest.approx([20, 20/3, 1/7, 0, 0])
+	with pytest.raises(ValueError):
+		forecast.get(leitner, MAX_HORIZON + 1)
+
+	with patch.object(forecast, 'read_file', wraps=forecast.read_file) as read_file:
+		box.box3.append(Card('new', ['new?', None], box=3)) 	#loaded cards are counted on every call
+		assert forecast.get(leitner)[0, 2] == pytest.approx(2/7)
+		assert not read_file.called
+		database.append_cards([card_data('appended')]) 		#the cards file changed
+		assert forecast.get(leitner)[0, 0] == 21 and read_file.call_count == 1
+
+def test_forecast_with_due_days(database):
+	database.write_cards([card_data('due', 2, ['sm2', 2, 6, 2.5, 1005]), card_data('overdue', 3, ['sm2', 3, 10, 2.5, 990])])
+	box = Box([Card('fsrs', ['fsrs?', None], box=2)])
+	box.box2[0].state = ['fsrs', 4.0, 5.0, 999.0, 2]
+	forecast = WorkloadForecast(database, box)
+
+	due = forecast.get(get_scheduler('sm2', clock=lambda: 1000.5)).sum(axis=1)
+	assert due[0] == pytest.approx(1 + 1/3) and due[5] >= 1 	#overdue today, due in 5 days, the fsrs card is new to sm2
+	due = forecast.get(get_scheduler('fsrs', clock=lambda: 1000.5)).sum(axis=1)
+	assert due[3] >= 1 and due[0] == pytest.approx(1/3 + 1/7) 	#due after its stability, 3 days from today
@@ -0,0 +1,28 @@
+#! python3
+# test_grading.py - Tests for asking and grading cards in grading.py (no display needed)
+
+import subprocess, sys
+from unittest.mock import patch
+
+import app.grading as grading
+from app.models import Card
+
+def test_format_question():
+	card = Card('4', ['What is 2+2?', None])
+	assert grading.format_question(card) == ('What is 2+2?', '4', None)
+
+def test_format_question_mcq():
+	card = Card('Paris', [None, 'What is the capital of France?,London,Berlin,Rome'])
+	with patch('random.shuffle', side_effect=lambda x:None):
+		assert grading.format_question(card) == ('What is the capital of France?', 'Paris', ['Paris', 'London', 'Berlin', 'Rome'])
+
+def test_is_correct():
+	assert grading.is_correct(' paris ', 'Paris')
+	assert grading.is_correct('the war of 1812', 'War, 1812')
+	assert not grading.is_correct('London', 'Paris')
+
+def test_server_does_not_need_tk():
+	#the study service grades with grading.py, importing it must not load tkinter or the flashcard window
+	check = "import sys, app.server; print('tkinter' in sys.modules, 'app.flashcard' in sys.modules)"
+	result = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True)
+	assert result.stdout.split() == ['False', 'False']
@@ -0,0 +1,87 @@
+#! python3
+# test_importer.py - Tests for the bulk importer in importer.py
+
+import os, json, pytest
+from unittest.mock import patch
+
+from app.importer import import_file, read_options, byte_ranges, to_record
+
+def write(path, text):
+	with open(path, 'w', encoding='utf-8') as f:
+		f.write(text)
+	return str(path)
+
+def box1(database):
+	with open(os.path.join(database.basepath, 'test_user', 'cards.json'), 'r') as f:
+		return [card for card in json.load(f) if card['box'] == 1]
+
+def test_import_csv(database, tmp_path):
+	path = write(tmp_path / 'deck.csv', 'question,answer,mcq question,mcq options,tags\n'
+		'Capital of France?,Paris,Capital?,"London, Berlin ,Rome",geo europe\n'
+		'Capital of Germany?,Berlin\n'
+		'capital of  FRANCE?,paris\n'		#not a duplicate, the first card also has an mcq question
+		'Capital of Germany?,berlin\n'		#duplicate of an earlier row
+		',no question\n'
+		'Pick one?,,,\n'
+		'Capital of Italy?,Rome,Capital?,Paris\n')
+
+	progress = []
+	report = import_file(database, path, batch_size=2, progress=lambda report: progress.append(report.imported))
+
+	assert (report.rows, report.imported, report.duplicates, report.invalid) == (7, 3, 1, 3)
+	assert progress == [2, 3]
+	cards = box1(database)
+	assert cards[0]['questions'] == ['Capital of France?', 'Capital?,London,Berlin,Rome']
+	assert cards[0]['tags'] == ['geo', 'europe']
+	assert [card['answer'] for card in cards] == ['Paris', 'Berlin', 'paris']
+	assert database.search_index.search('germany') == [cards[1]['id']]
+
+	report = import_file(database, path)		#importing again only finds duplicates
+	assert report.imported == 0 and report.duplicates == 4
+
+def test_import_anki(database, tmp_path):
+	path = write(tmp_path / 'deck.txt', '#separator:tab\n#html:true\n#tags column:3\n'
+		'<b>Hund</b>\tdog<br>animal\tgerman nouns\n'
+		'Katze\t&quot;cat&quot;\t\n')
+
+	report = import_file(database, path)
+
+	assert report.imported == 2
+	cards = box1(database)
+	assert cards[0]['questions'] == ['Hund', None]
+	assert cards[0]['answer'] == 'dog animal'
+	assert cards[0]['tags'] == ['german', 'nouns']
+	assert cards[1]['answer'] == '"cat"'
+
+def test_import_appends_to_box_file(database, tmp_path):
+	with open(os.path.join(database.basepath, 'test_user', 'cards.json'), 'w') as f:
+		json.dump([{'id': 'old', 'answer': 'old', 'questions': ['old?', None], 'box': 1, 'history': [0]*10}], f, indent=4)
+	path = write(tmp_path / 'deck.tsv', 'new?\tnew\n')
+
+	import_file(database, path)
+
+	assert [card['answer'] for card in box1(database)] == ['old', 'new']
+
+def test_parallel_import(database, tmp_path):
+	rows = ''.join(f'question {i}\tanswer {i}\n' for i in range(500))
+	path = write(tmp_path / 'deck.tsv', 'question\tanswer\n' + rows + 'broken\t\n')
+
+	options, offset = read_options(path, 'tsv')
+	ranges = list(byte_ranges(path, offset, chunk_size=1000))
+	assert ranges[0][0] == offset and ranges[-1][1] == os.path.getsize(path)
+	assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+
+	with patch('app.importer.CHUNK_SIZE', 1000):
+		report = import_file(database, path, workers=2)
+
+	assert (report.rows, report.imported, report.invalid) == (501, 500, 1)
+	assert [card['answer'] for card in box1(database)] == [f'answer {i}' for i in range(500)]
+
+def test_to_record_validation():
+	options = {'delimiter': ',', 'html': False, 'tags_column': None}
+
+	with pytest.raises(ValueError):
+		to_record(['question?', ''], options)
+	with pytest.raises(ValueError):
+		to_record(['', 'answer', 'mcq?', 'one,two'], options)
+	assert to_record(['  spaced   question ', ' answer '], options)['questions'] == ['spaced question', None]
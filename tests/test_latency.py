@@ -0,0 +1,24 @@
+#! python3
+# test_latency.py - Tests for the response time buckets in latency.py
+
+import numpy as np
+import pytest
+
+from app.latency import BUCKETS, SUB_BUCKETS, UNMEASURED, UPPER_BOUNDS, LOWER_BOUNDS, bucket_of, bucket_seconds, histogram, quantiles
+
+def test_buckets():
+	assert bucket_of(0) == 0 and bucket_of(10**6) == BUCKETS - 1
+	for seconds in np.geomspace(0.13, 500, 200):
+		bucket = bucket_of(seconds)
+		assert LOWER_BOUNDS[bucket] <= seconds < UPPER_BOUNDS[bucket]
+		assert bucket_seconds(bucket) == pytest.approx(seconds, rel=1/SUB_BUCKETS) 	#one byte, 1/8 precision
+	assert np.isnan(bucket_seconds(UNMEASURED))
+
+def test_quantiles():
+	buckets = [bucket_of(seconds) for seconds in [1, 2, 2, 3, 30]] + [UNMEASURED]
+	counts = histogram(buckets, [0, 0, 0, 0, 0, 0], 2)
+	assert counts.sum() == 5 and counts.shape == (2, BUCKETS)
+
+	medians = quantiles(counts, 0.5)
+	assert medians[0] == bucket_of(2) and medians[1] == UNMEASURED 		#row 1 has no answers
+	assert quantiles(counts[0], 1.0) == bucket_of(30) and quantiles(counts[0], 0.0) == bucket_of(1)
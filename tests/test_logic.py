@@ -43,7 +43,7 @@ def test_arrange_boxes():
 
 	for i in range(5):
 		card = Card(f'answer{i+1}', ['question{i+1}',None])
-		card.history = [0,0,0,0,0,0,0,0,0,i*2]
+		card.history = [0]*(10-i*2) + [1]*(i*2)
 		box.box1.append(card)
 
 	assert len(box.box1) == 5
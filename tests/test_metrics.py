@@ -0,0 +1,72 @@
+#! python3
+# test_metrics.py - Tests for the instrumentation in metrics.py
+
+import json, pytest
+
+import app.metrics as metrics
+from app.logic import arrange_boxes
+from app.models import Card, Box
+
+@pytest.fixture
+def enabled_metrics():
+	was_enabled = metrics.enabled
+	metrics.enable()
+	metrics.registry.reset()
+	yield metrics
+	metrics.registry.reset()
+	if not was_enabled:
+		metrics.disable()
+
+def test_disabled_records_nothing():
+	was_enabled = metrics.enabled
+	metrics.disable()
+	metrics.registry.reset()
+
+	@metrics.timed('test.call')
+	def call():
+		return 42
+
+	assert call() == 42
+	with metrics.timer('test.block'):
+		pass
+	metrics.count('test.event')
+	assert metrics.snapshot()['operations'] == {} and metrics.snapshot()['counters'] == {}
+	if was_enabled:
+		metrics.enable()
+
+def test_histograms_and_counters(enabled_metrics):
+	@metrics.timed('test.call')
+	def call(value):
+		return value
+
+	for value in range(10):
+		call(value)
+	metrics.count('test.event', 3)
+
+	snapshot = metrics.snapshot()
+	assert snapshot['operations']['test.call']['count'] == 10
+	assert sum(snapshot['operations']['test.call']['buckets'].values()) == 10
+	assert snapshot['counters'] == {'test.event': 3}
+
+def test_instrumented_hot_path(enabled_metrics):
+	card = Card('answer', ['question', None], history=[1]*10)
+	box = Box([card])
+
+	arrange_boxes(box)
+
+	snapshot = metrics.snapshot()
+	assert snapshot['operations']['logic.arrange_boxes']['count'] == 1
+	assert snapshot['counters']['logic.cards_moved'] == 1
+
+def test_export(enabled_metrics, tmp_path):
+	with metrics.timer('graph.redraw'):
+		pass
+
+	prom_path, json_path = metrics.write(str(tmp_path))
+
+	text = open(prom_path).read()
+	assert '# TYPE leitner_operation_seconds histogram' in text
+	assert 'leitner_operation_seconds_bucket{operation="graph.redraw",le="+Inf"} 1' in text
+	assert 'leitner_operation_seconds_count{operation="graph.redraw"} 1' in text
+	with open(json_path) as f:
+		assert json.load(f)['operations']['graph.redraw']['count'] == 1
@@ -5,7 +5,8 @@
 #					because the tests were not being conducted in correct order and sending errors
 
 import pytest
-from app.models import Card, Box
+from app.models import Card, Box, ReviewLog
+from app.latency import bucket_of, UNMEASURED
 
 #Card object to be tested
 test_card = Card('answer', ['question1', 'question2'])
@@ -19,6 +20,7 @@ def test_card_creation():
 	assert len(test_card.history) == 10
 	for session in test_card.history:
 		assert session == 0
+	assert len(test_card.log) == 0 		#no made up answers in the log
 
 #testing all get* functions
 def test_get_functions():
@@ -41,6 +43,41 @@ def test_session_result():
 	assert history[9] == 0		#newest record should be 0 or incorrect
 	assert len(history) == 10	#total length should remain 10, constant	
 
+#testing the review log behind the history
+def test_review_log():
+	log = ReviewLog([0, 1, 1])
+	for i in range(100):
+		log.append(i % 3 == 0, 1700000000 + i*3600)
+	assert len(log) == 103 and log.untimed == 3
+	assert log.outcome(1) == 1 and log.outcome(3) == 1 and log.outcome(-1) == 1 and log.outcome(-2) == 0
+	assert log.correct() == 2 + 34 and log.correct(-10) == 4 and log.correct(3, 6) == 1
+	assert log.history() == [1, 0, 0, 1, 0, 0, 1, 0, 0, 1]
+	assert log.times()[0] == 1700000000 and log.times()[-1] - log.times()[-2] == 3600
+
+	copy = ReviewLog.decode(log.encode())
+	assert (copy.count, copy.untimed, copy.bits, copy.times(), copy.history()) == (
+		log.count, log.untimed, log.bits, log.times(), log.history())
+
+	card = Card('answer', ['question', None], [1]*10)
+	assert 'log' not in card.to_dict()			#a plain history is all that is saved
+	card.session_result(False, latency=2.5)
+	card.session_result(True)
+	data = card.to_dict()
+	loaded = Card(data['answer'], data['questions'], data['history'], log=data['log'])
+	assert loaded.history == [1]*8 + [0, 1] and len(loaded.log) == 12 and len(loaded.log.times()) == 2
+	assert loaded.log.latencies == bytearray([bucket_of(2.5), UNMEASURED]) 	#response times as buckets
+
+def test_new_card_round_trip():
+	card = Card('answer', ['question', None])
+	data = card.to_dict()
+	assert data['history'] == [] and 'log' not in data
+	loaded = Card(data['answer'], data['questions'], data['history'])
+	assert len(loaded.log) == 0 and loaded.history == [0]*10
+
+	loaded.session_result(True, latency=1.0)
+	loaded.history = [1, 1, 0] 			#replaces the whole log
+	assert len(loaded.log) == 3 and loaded.log.deltas is None and loaded.history == [0]*7 + [1, 1, 0]
+
 #testing changing box state function
 def test_change_box():
 	assert test_card.box == 1
@@ -54,7 +91,8 @@ def test_to_dict():
 	assert card_dict['answer'] == test_card.get_answer()
 	assert card_dict['questions'] == ['question1', 'question2']
 	assert card_dict['box'] == test_card.box 
-	assert card_dict['history'] == test_card.get_history()
+	assert card_dict['history'] == [1, 0] 		#only the real answers are saved
+	assert test_card.get_history() == [0]*8 + [1, 0]
 
 #testing box creation without card list
 def test_box_creation():
@@ -123,4 +161,41 @@ def test_add_question():
 	assert test_boxFour.box1[1].get_answer() == 'answer0'
 
 
-        
\ No newline at end of file
+        
+def test_bulk_operations():
+	cards = [Card(f'answer{i}', [f'question{i}', None]) for i in range(6)]
+	for i, card in enumerate(cards):
+		card.change_box(i%3 + 1)
+	test_box = Box(cards)
+
+	deleted = test_box.delete_cards([cards[0].id, cards[4].id])
+	assert deleted == [cards[0], cards[4]]
+	assert test_box.box1 == [cards[3]]
+	assert test_box.box2 == [cards[1]]
+
+	test_box.move_cards([cards[1].id, cards[3].id], 3)
+	assert test_box.box1 == [] and test_box.box2 == []
+	assert test_box.box3 == [cards[2], cards[5], cards[3], cards[1]]	#moved cards keep their box order
+	assert cards[1].box == 3
+
+	test_box.retag_cards([cards[2].id, cards[5].id], add=['verbs'])
+	test_box.retag_cards([cards[5].id], add=['irregular'], remove=['verbs'])
+	assert cards[2].tags == ['verbs']
+	assert cards[5].tags == ['irregular']
+	assert cards[5].to_dict()['tags'] == ['irregular']
+
+def test_box_count():
+	cards = [Card(f'answer{i}', [f'question{i}', None], box=i+1) for i in range(8)]
+	test_box = Box(cards, boxes=7)
+	assert len(test_box.boxlist) == 7 and test_box.box7 == cards[6:]
+	assert cards[7].box == 7 	#cards of a higher box go to the last one
+
+	test_box.resize(3)
+	assert not hasattr(test_box, 'box4')
+	assert test_box.box3 == [cards[2]] + cards[3:]
+	assert all(card.box == 3 for card in test_box.box3)
+	test_box.resize(4)
+	assert test_box.box4 == [] and test_box.boxlist[3] is test_box.box4
+
+	with pytest.raises(ValueError):
+		Box(boxes=1)
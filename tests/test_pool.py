@@ -0,0 +1,87 @@
+#! python3
+# test_pool.py - Tests for the sharded study service in pool.py, with worker processes on localhost
+
+import asyncio, socket
+from collections import Counter
+from types import SimpleNamespace
+
+from app.auth import CredentialStore
+from app.pool import HashRing, ShardedServer
+from benchmarks.bench_server import Client, store_args, run_local
+from benchmarks.synthetic import populate
+
+PASSWORD = 'secret-password'
+
+def test_hash_ring():
+	names = [f'user{i}' for i in range(4000)]
+	ring = HashRing(4)
+	shares = Counter(map(ring.shard_of, names))
+	assert sorted(shares) == [0, 1, 2, 3] and min(shares.values()) > 0.15*len(names)
+	assert [HashRing(4).shard_of(name) for name in names[:50]] == [ring.shard_of(name) for name in names[:50]]
+
+	grown = HashRing(5) 		#only users taken over by the new shard move
+	moved = [name for name in names if grown.shard_of(name) != ring.shard_of(name)]
+	assert {grown.shard_of(name) for name in moved} == {4} and len(moved) < 0.35*len(names)
+
+def test_sharded_service(tmp_path, database_factory):
+	ring = HashRing(2)
+	users = {ring.shard_of(f'learner{i}'): f'learner{i}' for i in range(20)} 	#one user on each worker
+	store = CredentialStore(**store_args(str(tmp_path)))
+	for username in users.values():
+		store.register(username, PASSWORD)
+		populate(database_factory(username), 100, sessions=3)
+	store.close()
+
+	async def study(client, username):
+		await client.request('POST', '/session', {'questions': 10})
+		while not (await client.request('GET', '/card'))[1].get('done'):
+			await client.request('POST', '/answer', {'answer': 'not the answer'})
+		return (await client.request('GET', '/stats'))[1]
+
+	async def main():
+		server = ShardedServer(2, store_args(str(tmp_path)), database_factory)
+		await server.start('127.0.0.1', 0)
+		clients = {shard: Client('127.0.0.1', server.port) for shard in users}
+		try:
+			assert (await clients[0].request('GET', '/stats'))[0] == 401
+			for shard, username in users.items():
+				assert (await clients[shard].login(username, PASSWORD))['boxes'] == 5
+				assert clients[shard].token.startswith(f'{shard}.')
+			stats = await asyncio.gather(*(study(clients[shard], username) for shard, username in users.items()))
+			assert [row['sessions'] for row in stats] == [4, 4] and [sum(row['boxes']) for row in stats] == [100, 100]
+
+			await server.restart(0) 							#worker 0 saves its user and is replaced
+			assert (await clients[0].request('GET', '/stats'))[0] == 401
+			assert (await clients[1].request('GET', '/stats'))[1]['sessions'] == 4
+			await clients[0].login(users[0], PASSWORD)
+			assert (await clients[0].request('GET', '/stats'))[1]['sessions'] == 4
+		finally:
+			for client in clients.values():
+				await client.close()
+			await server.close()
+	asyncio.run(main())
+	assert all(len(list(database_factory(username).iter_file())) == 100 for username in users.values())
+
+def test_unreachable_worker_is_restarted():
+	async def main():
+		server = ShardedServer(1)
+		worker = server.workers[0]
+		with socket.socket() as closed: 		#a port nothing listens on
+			closed.bind(('127.0.0.1', 0))
+			worker.port = closed.getsockname()[1]
+		worker.process = SimpleNamespace(is_alive=lambda: False)
+		worker.ready.set()
+		restarted = []
+		async def restart(index):
+			restarted.append(index)
+		server.restart = restart
+
+		status, body = await server.respond('GET', '/stats', {'authorization': 'Bearer 0.token'}, b'')
+		await asyncio.sleep(0)
+		assert status == 502 and b'unreachable' in body
+		assert restarted == [0] and worker.in_flight == 0 and worker.idle.is_set()
+	asyncio.run(main())
+
+def test_load_generator_with_workers():
+	result = asyncio.run(run_local(users=4, sessions=1, questions=10, cards=100, workers=2))
+	assert result['requests'] == 4*(1 + 1 + 10*2 + 1 + 1)
@@ -0,0 +1,155 @@
+#!python3
+#test_scheduling.py - Testing the scheduling algorithms and their use through logic.py
+
+import pytest
+from unittest.mock import patch
+
+import app.logic as logic
+import app.scheduling as scheduling
+from app.models import Card, Box
+from app.scheduling import SM2Scheduler, FSRSScheduler, get_scheduler, session_allocation, box_thresholds
+
+DAY = 20000.0
+
+@pytest.fixture
+def box():
+	test_box = Box()
+	for i in range(5):
+		for j in range(20):
+			test_box.boxlist[i].append(Card(f'answer{i}-{j}', [f'question{i}-{j}', None], box=i+1))
+	return test_box
+
+def answer(cards, correct):
+	for card in cards:
+		card.session_result(correct)
+
+def test_leitner_is_the_default():
+	assert logic.scheduler.name == 'leitner'
+	with pytest.raises(ValueError):
+		get_scheduler('anki')
+
+def test_schedulers_implement_the_interface():
+	class SelectOnly(scheduling.Scheduler):
+		def select(self, box, total_question):
+			return []
+
+	with pytest.raises(TypeError):
+		SelectOnly() 			#arrange is missing
+	with pytest.raises(TypeError):
+		scheduling.Scheduler()
+	assert all(get_scheduler(name).name == name for name in scheduling.SCHEDULERS)
+
+def test_sm2_intervals(box):
+	scheduler = SM2Scheduler(clock=lambda: DAY)
+	card = box.box1[0]
+	answer([card], True)
+	scheduler.arrange(box)
+	assert card.state == ['sm2', 1, 1, 2.5, DAY + 1]
+	assert card.box == 2 and card in box.box2
+
+	answer([card], True)
+	answer([card], True) 	#two answers before the boxes are arranged are both applied
+	scheduler.arrange(box)
+	assert card.state[:3] == ['sm2', 3, 15]
+	assert card.box == 4 and not card.pending 	#15 days: box 4
+
+	answer([card], False)
+	scheduler.arrange(box)
+	assert card.state[1:3] == [0, 1]
+	assert card.state[3] < 2.5 	#the ease drops after a wrong answer
+	assert card.box == 1
+
+def test_unanswered_cards_keep_their_box(box):
+	scheduler = FSRSScheduler(clock=lambda: DAY)
+	answer(box.box1[:2], True)
+	moved = scheduler.arrange(box)
+	#a first correct answer gives a stability of 3.7 days: box 3
+	assert [len(individual_box) for individual_box in box.boxlist] == [18, 20, 22, 20, 20]
+	assert moved == 2
+	assert all(card.state is None for card in box.box2)
+	for number, individual_box in enumerate(box.boxlist, 1):
+		assert all(card.box == number for card in individual_box)
+
+def test_fsrs_memory_model(box):
+	scheduler = FSRSScheduler(clock=lambda: DAY)
+	good, again = box.box1[0], box.box1[1]
+	answer([good], True)
+	answer([again], False)
+	scheduler.arrange(box)
+	assert good.state[1] == pytest.approx(FSRSScheduler.WEIGHTS[2], abs=1e-4)
+	assert again.state[1] == pytest.approx(FSRSScheduler.WEIGHTS[0], abs=1e-4)
+	assert again.state[2] > good.state[2] 	#forgotten cards are harder
+
+	states, new = scheduler.read_states([good.state])
+	later = FSRSScheduler(clock=lambda: DAY + good.state[1])
+	assert later.retrievability(states, DAY + good.state[1])[0] == pytest.approx(FSRSScheduler.RETENTION, abs=1e-3)
+
+	stability = good.state[1]
+	scheduler.clock = lambda: DAY + 5
+	answer([good], True)
+	scheduler.arrange(box)
+	assert good.state[1] > stability
+
+def test_sm2_session_order(box):
+	scheduler = SM2Scheduler(clock=lambda: DAY)
+	overdue, due_later = box.box2[:5], box.box2[5:10]
+	for card in overdue:
+		card.state = ['sm2', 2, 6, 2.5, DAY - 3]
+	for card in due_later:
+		card.state = ['sm2', 2, 6, 2.5, DAY + 3]
+	session = scheduler.select(box, 10)
+	assert set(overdue) <= set(session) 	#due cards first, then new cards
+	assert not set(due_later) & set(session)
+	assert len(scheduler.select(box, 1000)) == 100
+
+def test_rebuilding_boxes_gives_the_same_result(box):
+	other = Box([Card(card.answer, card.questions, list(card.history), card.box, card.id)
+		for individual_box in box.boxlist for card in individual_box])
+	for test_box in (box, other):
+		answer(test_box.box1[::2] + test_box.box4[::3], True)
+	SM2Scheduler(clock=lambda: DAY).arrange(box)
+	with patch.object(scheduling, 'MAX_DELETES', 0):
+		SM2Scheduler(clock=lambda: DAY).arrange(other)
+	assert [[card.id for card in individual_box] for individual_box in box.boxlist] == \
+		[[card.id for card in individual_box] for individual_box in other.boxlist]
+
+def test_logic_delegates_to_the_active_scheduler(box):
+	active = logic.scheduler
+	try:
+		logic.use_scheduler('sm2', clock=lambda: DAY)
+		session = logic.get_session_cards(box, 10)
+		answer(session, True)
+		logic.arrange_boxes(box)
+		assert all(card.state[0] == 'sm2' and card.box == 2 for card in session)
+		assert all('state' in card.to_dict() for card in session)
+	finally:
+		logic.scheduler = active
+
+def test_quotas_and_thresholds_follow_the_box_count():
+	with patch.object(scheduling, 'SESSION_ALLOCATIONS', {}), patch.object(scheduling, 'DEFAULT_ALLOCATION', []), \
+		patch.object(scheduling, 'BOX_THRESHOLDS', []):
+		#derived for 5 boxes they are the tables
+		assert [session_allocation(size, 5) for size in (10, 20, 50, 100)] == [[4, 3, 2, 1, 0], [8, 6, 4, 2, 0],
+			[20, 14, 9, 5, 2], [40, 28, 18, 10, 4]]
+		assert box_thresholds(5) == [(8, 5), (6, 4), (4, 3), (2, 2)]
+	for boxes in range(2, 11):
+		allocation = session_allocation(20, boxes)
+		assert len(allocation) == boxes and sum(allocation) == 20
+		assert allocation == sorted(allocation, reverse=True)
+		assert [target for minimum, target in box_thresholds(boxes)] == list(range(boxes, 1, -1))
+
+@pytest.mark.parametrize('name', ['leitner', 'sm2', 'fsrs'])
+def test_decks_with_more_boxes(name):
+	box = Box(boxes=8)
+	for i in range(8):
+		box.boxlist[i].extend(Card(f'answer{i}-{j}', [f'question{i}-{j}', None], [1]*i + [0]*(10 - i), box=i+1)
+			for j in range(10))
+	scheduler = get_scheduler(name, clock=lambda: DAY)
+	session = scheduler.select(box, 20)
+	assert len(session) == 20
+	answer(session, True)
+	scheduler.arrange(box)
+	assert sum(len(individual_box) for individual_box in box.boxlist) == 80
+	for number, individual_box in enumerate(box.boxlist, 1):
+		assert all(card.box == number for card in individual_box)
+	assert any(box.boxlist[5:]) 	#the boxes above the default 5 are used
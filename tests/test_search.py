@@ -0,0 +1,77 @@
+#! python3
+# test_search.py - Tests for the search index in search.py
+
+import pytest
+from app.search import SearchIndex, tokenize, card_tokens
+from app.models import Card, Box
+
+@pytest.fixture
+def index():
+	index = SearchIndex()
+	index.add('paris', 'Paris', [None, 'What is the capital of France?,London,Berlin,Rome'])
+	index.add('berlin', 'Berlin', ['What is the capital of Germany?', None])
+	index.add('egg', 'Egg', ['Why can you not eat raw cookie dough?', None])
+	return index
+
+def test_tokens():
+	assert tokenize('The Capital, of FRANCE?') == ['the', 'capital', 'of', 'france']
+	assert card_tokens('Paris', [None, 'Capital?,London,Berlin,Rome']) == ['paris', 'capital', 'london', 'berlin', 'rome']
+
+def test_exact_search(index):
+	assert index.search('france') == ['paris']
+	assert set(index.search('capital')) == {'paris', 'berlin'}
+	assert index.search('capital germany') == ['berlin']		#cards with every word only
+
+def test_ranking(index):
+	#'berlin' is the answer of one card and an option of another, both match
+	assert set(index.search('berlin')) == {'paris', 'berlin'}
+	#no card has both words: the best partial matches are returned
+	assert index.search('germany cookie')[0] in {'berlin', 'egg'}
+
+def test_substring_and_typo(index):
+	assert index.search('cook') == ['egg']		#substring of a word
+	assert index.search('germnay') == ['berlin']	#typo
+
+def test_within(index):
+	assert index.search('capital', within={'paris'}) == ['paris']
+
+def test_incremental_updates(index):
+	index.remove('egg')
+	assert index.search('cookie') == []
+	assert 'cookie' not in index.postings
+
+	card = Card('Madrid', ['What is the capital of Spain?', None])
+	index.add_card(card)
+	assert index.search('spain') == [card.id]
+
+	card.questions = ['Largest city of Spain?', None]
+	index.update_card(card)
+	assert index.search('largest') == [card.id]
+	assert card.id not in index.search('capital')
+
+def test_save_and_load(tmp_path, index):
+	path = str(tmp_path/'search_index.json')
+	index.path = path
+	index.save()
+
+	loaded = SearchIndex.load(path)
+	assert len(loaded) == 3
+	assert loaded.search('france') == ['paris']
+	assert loaded.search('germnay') == ['berlin']
+
+	assert SearchIndex.load(str(tmp_path/'missing.json')) is None
+
+def test_box_updates_index():
+	box = Box()
+	box.search_index = SearchIndex()
+
+	card = box.add_question('Paris', ['Capital of France?', None])
+	assert box.search_index.search('france') == [card.id]
+
+	box.edit_card(card, 'Paris', ['City of light?', None])
+	assert box.search_index.search('france') == []
+	assert box.search_index.search('light') == [card.id]
+
+	box.remove_card(card)
+	assert card not in box.box1
+	assert box.search_index.search('light') == []
@@ -0,0 +1,79 @@
+#! python3
+# test_server.py - Tests for the study service in server.py, against a server on localhost
+
+import asyncio
+import pytest
+
+from app.auth import CredentialStore
+from app.server import StudyServer
+from benchmarks.bench_server import Client, run_local
+from benchmarks.synthetic import populate
+
+FAST_KDF = {'n': 2**4, 'r': 8, 'p': 1}	#cheap scrypt cost so the tests stay fast
+PASSWORD = 'secret-password'
+
+@pytest.fixture
+def store(tmp_path, database_factory):
+	store = CredentialStore(key_file=str(tmp_path/'secret.key'), db_file=str(tmp_path/'users.db'),
+		legacy_file=str(tmp_path/'user.enc'), kdf='scrypt', params=FAST_KDF)
+	store.register('learner', PASSWORD)
+	populate(database_factory('learner'), 200, sessions=10)
+	yield store
+	store.close()
+
+def run_server(store, database_factory, test, **kwargs):
+	#Runs test(server, client) against a server on a free port of localhost
+	async def main():
+		server = StudyServer(store, database_factory=database_factory, **kwargs)
+		await server.start('127.0.0.1', 0)
+		client = Client('127.0.0.1', server.port)
+		try:
+			await test(server, client)
+		finally:
+			await client.close()
+			await server.close()
+	asyncio.run(main())
+
+def stored_cards(database_factory):
+	return len(list(database_factory('learner').iter_file()))
+
+def test_study_session(store, database_factory):
+	async def test(server, client):
+		assert (await client.request('POST', '/login', {'username': 'learner', 'password': 'wrong-password'}))[0] == 401
+		assert (await client.request('GET', '/card'))[0] == 401
+		assert (await client.login('learner', PASSWORD))['boxes'] == 5
+		assert (await client.request('GET', '/card'))[0] == 409 			#no session yet
+		assert (await client.request('POST', '/session', {'questions': 7}))[0] == 400
+
+		assert await client.request('POST', '/session', {'questions': 10}) == (200, {'questions': 10})
+		answers = 0
+		while not (card := (await client.request('GET', '/card'))[1]).get('done'):
+			assert (await client.request('GET', '/card'))[1] == card 		#the same card until it is answered
+			status, result = await client.request('POST', '/answer', {'answer': 'not the answer'})
+			answers += 1
+			assert status == 200 and result['remaining'] == 10 - answers and result['done'] == (answers == 10)
+		assert (await client.request('POST', '/answer', {'answer': 'late'}))[0] == 409
+
+		status, stats = await client.request('GET', '/stats')
+		assert status == 200 and sum(stats['boxes']) == 200 and stats['sessions'] == 11
+		assert stats['session'] == {'position': 10, 'total': 10, 'correct': 0}
+		assert (await client.request('POST', '/logout'))[1] == {'logged_out': True}
+		assert (await client.request('GET', '/stats'))[0] == 401 and 'learner' in server.cache
+		await client.login('learner', PASSWORD) 					#the workspace was kept
+		assert (await client.request('GET', '/stats'))[1]['sessions'] == 11
+		assert server.cache.stats()['misses'] == 1 and server.cache.stats()['hits'] > 20
+	run_server(store, database_factory, test)
+	assert stored_cards(database_factory) == 200 			#the loaded cards went back to the cards file
+
+def test_idle_users_are_evicted(store, database_factory):
+	async def test(server, client):
+		await client.login('learner', PASSWORD)
+		assert 'learner' in server.cache and stored_cards(database_factory) < 200 	#a sample of the cards is loaded
+		await asyncio.sleep(0.5)
+		assert not len(server.cache) and (await client.request('GET', '/stats'))[0] == 401
+		assert stored_cards(database_factory) == 200
+	run_server(store, database_factory, test, idle_timeout=0.1)
+
+def test_load_generator():
+	result = asyncio.run(run_local(users=3, sessions=1, questions=10, cards=100))
+	assert result['requests'] == 3*(1 + 1 + 10*2 + 1 + 1) and result['p50'] <= result['p99']
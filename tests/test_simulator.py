@@ -0,0 +1,73 @@
+#! python3
+# test_simulator.py - Tests for the study simulator (benchmarks/simulator.py)
+
+import random
+import pytest
+
+import app.scheduling as scheduling
+from app.models import Box
+from benchmarks.simulator import ForgettingModel, StudyPlan, VARIANTS, make_scheduler, simulate
+
+PLAN = StudyPlan(days=20, session_size=10, initial_cards=30, new_cards=2)
+
+def test_simulation_is_deterministic():
+	model = ForgettingModel()
+	first = simulate(PLAN, model, learners=3, seed=1)
+	second = simulate(PLAN, model, learners=3, seed=1)
+	assert first['retention'] == second['retention']
+	assert first['cards_per_box'] == second['cards_per_box']
+	assert first['reviews'] == sum(first['reviews_per_day'])*3
+
+def test_daily_results():
+	result = simulate(PLAN, ForgettingModel('power'), learners=2)
+	assert len(result['retention']) == PLAN.days
+	for day, boxes in enumerate(result['cards_per_box']):
+		assert sum(boxes) == PLAN.initial_cards + PLAN.new_cards*day 	#no card is lost or duplicated
+	assert all(0 <= retention <= 1 for retention in result['retention'])
+	assert all(reviews <= PLAN.session_size for reviews in result['reviews_per_day'])
+	assert result['reviews_per_second'] > 0
+
+def test_process_pool_gives_same_results():
+	model = ForgettingModel()
+	serial = simulate(PLAN, model, learners=4, workers=0)
+	pooled = simulate(PLAN, model, learners=4, workers=2)
+	assert pooled['reviews_per_day'] == serial['reviews_per_day']
+	assert pooled['cards_per_box'] == serial['cards_per_box']
+	assert pooled['retention'] == pytest.approx(serial['retention'])
+
+def test_variant_schedulers():
+	strict = make_scheduler(VARIANTS['strict'])
+	assert scheduling.box_thresholds(5, strict.thresholds) == VARIANTS['strict']['thresholds']
+	assert scheduling.session_allocation(20, 5, strict.allocations) == [8, 6, 4, 2, 0]
+	heavy = make_scheduler(VARIANTS['review-heavy'])
+	assert scheduling.session_allocation(20, 5, heavy.allocations) == [6, 5, 4, 3, 2]
+	assert scheduling.session_allocation(100, 5, heavy.allocations) == scheduling.DEFAULT_ALLOCATION
+	assert make_scheduler(VARIANTS['fsrs']).name == 'fsrs'
+	assert scheduling.BOX_THRESHOLDS == [(8, 5), (6, 4), (4, 3), (2, 2)] 	#the app's tables are not touched
+	assert scheduling.SESSION_ALLOCATIONS[20] == [8, 6, 4, 2, 0]
+
+def test_global_random_is_not_used():
+	state = random.getstate()
+	simulate(PLAN, ForgettingModel(), VARIANTS['strict'], learners=2)
+	assert random.getstate() == state
+
+def test_variant_thresholds_are_used():
+	box = Box()
+	card = box.add_question('a', ['q?', None])
+	for _ in range(6):
+		card.session_result(True)
+	make_scheduler({}).arrange(box)
+	assert card.box == 4
+	make_scheduler(VARIANTS['strict']).arrange(box)
+	assert card.box == 3
+
+@pytest.mark.parametrize('name', ['sm2', 'fsrs'])
+def test_simulates_other_algorithms(name):
+	result = simulate(PLAN, ForgettingModel(), VARIANTS[name], learners=2)
+	assert sum(result['cards_per_box'][-1]) == PLAN.initial_cards + PLAN.new_cards*(PLAN.days - 1)
+	assert sum(result['cards_per_box'][-1][1:]) > 0 	#cards answered right leave box 1
+
+def test_simulates_more_boxes():
+	plan = StudyPlan(days=20, session_size=10, initial_cards=30, new_cards=2, boxes=7)
+	result = simulate(plan, ForgettingModel(), learners=2)
+	assert all(len(boxes) == 7 and sum(boxes) == 30 + 2*day for day, boxes in enumerate(result['cards_per_box']))
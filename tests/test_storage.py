@@ -0,0 +1,79 @@
+#! python3
+# test_storage.py - Tests for the box file formats in storage.py
+
+import os, gzip, pytest
+from unittest.mock import patch
+
+from app.database import Database
+from app.storage import CompressedStorage, encode_record, decode_record
+from app.importer import import_file
+from app.models import Card, Box
+
+@pytest.fixture
+def data_path(tmp_path):
+	with patch.object(Database, 'get_basepath', return_value=str(tmp_path)):
+		yield tmp_path
+
+def test_record_round_trip():
+	data = Card('Paris', ['Capital of France?', 'Capital?,London,Berlin,Rome'], [0, 1]*5, 3, tags=['geo']).to_dict()
+	assert decode_record(encode_record(data)) == data
+
+	old = {'answer': 'a', 'questions': ['q', None], 'box': 1, 'history': [0, 2], 'note': 'kept'}
+	assert decode_record(encode_record(old)) == dict(old, tags=[])		#no id, odd history and extra keys survive
+
+@pytest.mark.parametrize('compression', ['gzip', 'lzma'])
+def test_compressed_storage(tmp_path, compression):
+	storage = CompressedStorage(compression)
+	path = str(tmp_path / ('cards' + storage.extension))
+	cards = [Card(f'answer {i}', [f'question {i}', None]).to_dict() for i in range(100)]
+
+	storage.write(path, iter(cards))
+	storage.append(path, [storage.encode(card) for card in cards[:2]])
+
+	assert list(storage.iter(path)) == cards + cards[:2]
+
+def test_database_with_compressed_storage(data_path):
+	database = Database('test_user', 'gzip')
+	assert database.filename == 'cards.jsonl.gz'
+
+	box = Box([Card(f'answer {i}', [f'question {i}', None]) for i in range(60)])
+	database.save_cards(box)
+	assert len(database.read_cards()) == 60
+	with gzip.open(os.path.join(database.basepath, 'test_user', 'cards.jsonl.gz'), 'rt') as f:
+		assert '"answer"' not in f.read().split('\n', 1)[1]		#records after the header have no keys
+
+	database.load_cards(box)
+	assert len(box.box1) == 50 and len(database.read_cards()) == 10
+
+	with open(data_path / 'deck.tsv', 'w') as f:
+		f.write('new question\tnew answer\n')
+	import_file(database, str(data_path / 'deck.tsv'), box=box)
+	assert database.read_cards()[-1]['answer'] == 'new answer'
+
+	assert Database('test_user').storage.name == 'gzip'			#detected from the existing files
+
+def test_convert_storage(data_path):
+	database = Database('test_user')
+	cards = [Card(f'answer {i}', [f'question {i}', None], box=i % 5 + 1).to_dict() for i in range(20)]
+	database.write_cards(cards)
+
+	database.convert_storage('lzma')
+
+	user_path = os.path.join(database.basepath, 'test_user')
+	assert not os.path.exists(os.path.join(user_path, 'cards.json'))
+	assert sorted(database.iter_cards(), key=lambda card: card['answer']) == sorted(cards, key=lambda card: card['answer'])
+	with database.snapshot() as snapshot:
+		assert len(list(snapshot.iter_cards())) == 20
+
+@pytest.mark.parametrize('compression', ['json', 'lzma'])
+def test_box_files_are_migrated(data_path, compression):
+	storage = Database('test_user', compression).storage
+	user_path = data_path / 'test_user'
+	os.remove(user_path / ('cards' + storage.extension))
+	for i in range(5):
+		storage.write(str(user_path / f'box{i+1}{storage.extension}'), [Card(f'answer {i}', [f'question {i}', None]).to_dict()])
+
+	database = Database('test_user')
+	assert database.storage.name == compression and database.filename == 'cards' + storage.extension
+	assert [card['box'] for card in database.iter_cards()] == [1, 2, 3, 4, 5]
+	assert sorted(os.listdir(user_path)) == sorted(['cards' + storage.extension, 'deck.json', 'test_user.json'])
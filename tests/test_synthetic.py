@@ -0,0 +1,53 @@
+#! python3
+# test_synthetic.py - Tests for the synthetic deck generator and tests at a realistic deck size
+
+import pytest
+
+from benchmarks.synthetic import generate_cards, generate_userdata, box_counts
+from app.models import Card, Box
+from app.logic import arrange_boxes, get_session_cards
+
+def test_generator_is_deterministic():
+	assert list(generate_cards(200, seed=1)) == list(generate_cards(200, seed=1))
+	assert list(generate_cards(200, seed=1)) != list(generate_cards(200, seed=2))
+	assert generate_userdata(50, seed=1) == generate_userdata(50, seed=1)
+
+def test_distributions():
+	cards = list(generate_cards(10000))
+
+	assert len(cards) == 10000
+	assert [sum(1 for card in cards if card['box'] == box) for box in range(1, 6)] == box_counts(10000)
+	assert len({card['id'] for card in cards}) == 10000
+
+	#the history of every card puts it in its own box
+	box = Box([Card(data['answer'], data['questions'], data['history'], data['box'], data['id']) for data in cards])
+	before = [len(individual_box) for individual_box in box.boxlist]
+	arrange_boxes(box)
+	assert [len(individual_box) for individual_box in box.boxlist] == before
+
+	userdata = generate_userdata(2000)
+	assert len(userdata['session_data']) == 2000
+	assert all(0 <= value <= 100 for value in userdata['session_data'])
+
+@pytest.mark.parametrize('storage', ['json', 'gzip', 'lzma'])
+def test_synthetic_database(synthetic_database, storage):
+	database = synthetic_database(5000, storage)
+
+	assert sum(1 for card in database.iter_cards()) == 5000
+	assert len(database.load_userdata()['session_data']) == 100
+
+	box = Box()
+	database.load_cards(box)
+	assert [len(individual_box) for individual_box in box.boxlist] == [50]*5
+	assert len(get_session_cards(box, 50)) == 50
+	database.save_cards(box)
+	assert sum(1 for card in database.iter_cards()) == 5000
+
+def test_search_index_at_scale(synthetic_database):
+	database = synthetic_database(20000)
+	box = Box()
+
+	index = database.get_search_index(box)
+	assert len(index) == 20000
+	first = next(database.iter_cards())
+	assert first['id'] in index.search(first['answer'], limit=100)
@@ -0,0 +1,125 @@
+#! python3
+# test_timers.py - Tests for the TimerService in timers.py
+
+import pytest
+from app.timers import TimerService
+
+class FakeClock:
+	#monotonic clock that only moves when the test says so
+	def __init__(self):
+		self.now = 100.0
+
+	def __call__(self):
+		return self.now
+
+class FakeRoot:
+	#records after() calls instead of using a Tk event loop
+	def __init__(self):
+		self.pending = {}
+		self.count = 0
+
+	def after(self, ms, callback):
+		self.count += 1
+		self.pending[self.count] = (ms, callback)
+		return self.count
+
+	def after_cancel(self, after_id):
+		self.pending.pop(after_id, None)
+
+	def fire(self):
+		#runs the pending calls like the Tk event loop would once they are due
+		for after_id in list(self.pending):
+			ms, callback = self.pending.pop(after_id)
+			callback()
+
+@pytest.fixture
+def service():
+	root = FakeRoot()
+	clock = FakeClock()
+	return root, clock, TimerService(root, clock)
+
+def test_single_pending_call(service):
+	root, clock, timers = service
+
+	timers.schedule('a', lambda: None, 1.0)
+	timers.schedule('b', lambda: None, 5.0)
+	timers.schedule('a', lambda: None, 1.0)		#replacing job must not stack a chain
+
+	assert len(root.pending) == 1
+	ms, callback = list(root.pending.values())[0]
+	assert ms == 1000
+
+def test_idle_service_is_not_armed(service):
+	root, clock, timers = service
+
+	timers.schedule('a', lambda: None, 1.0)
+	timers.cancel('a')
+
+	assert root.pending == {}
+	assert timers.after_id is None
+
+def test_repeat_without_drift(service):
+	root, clock, timers = service
+	calls = []
+
+	timers.schedule('a', lambda: calls.append(clock()), 1.0)
+	start = clock()
+
+	clock.now = start + 1.3		#event loop was late
+	root.fire()
+	assert timers.jobs['a'][0] == start + 2.0	#next deadline is on the grid, not 1s after the late tick
+
+	clock.now = start + 5.5		#missed several ticks
+	root.fire()
+	assert len(calls) == 2						#missed ticks are coalesced into one call
+	assert timers.jobs['a'][0] == start + 6.0
+
+def test_one_shot(service):
+	root, clock, timers = service
+	calls = []
+
+	timers.schedule('once', lambda: calls.append(1), 2.0, repeat=False)
+	clock.now += 2.0
+	root.fire()
+
+	assert calls == [1]
+	assert not timers.is_scheduled('once')
+	assert root.pending == {}
+
+def test_failing_job_does_not_stop_others(service):
+	root, clock, timers = service
+	calls = []
+
+	def fail():
+		raise ValueError('broken job')
+
+	timers.schedule('bad', fail, 1.0)
+	timers.schedule('good', lambda: calls.append(1), 1.0)
+	clock.now += 1.0
+	root.fire()
+
+	assert calls == [1]
+	assert timers.is_scheduled('bad')
+
+def test_delay_is_rounded_up(service):
+	root, clock, timers = service
+
+	timers.schedule('a', lambda: None, 0.0015)
+	assert [ms for ms, _ in root.pending.values()] == [2] 	#1 ms would fire before the deadline
+
+def test_job_cancelled_in_the_same_tick(service):
+	root, clock, timers = service
+	calls = []
+
+	def cancel_others():
+		timers.cancel('once')
+		timers.cancel('repeat')
+
+	timers.schedule('first', cancel_others, 1.0)
+	timers.schedule('once', lambda: calls.append('once'), 1.0, repeat=False)
+	timers.schedule('repeat', lambda: calls.append('repeat'), 1.0)
+	clock.now += 1.0
+	root.fire()
+
+	assert calls == [] 		#neither cancelled job runs
+	assert list(timers.jobs) == ['first']
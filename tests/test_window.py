@@ -7,7 +7,8 @@ from unittest.mock import MagicMock, patch
 from tkinter import *
 
 from app.models import Card, Box
-from app.window import QuestionWindow, QuestionListbox
+from app.search import SearchIndex
+from app.window import QuestionWindow, QuestionListbox, QuestionListModel
 
 '''
 First section of tests: Testing Question Window
@@ -190,8 +191,8 @@ def test_edit_question(mock_question_window, setup_listbox_window):
 	mock_question_window.assert_called_once_with(root, box, box.box1[0])
 	root.destroy()
 
-@patch('tkinter.messagebox.showinfo')
-def test_delete_question(mock_info, setup_listbox_window):
+@patch('tkinter.messagebox.askyesno', return_value=True)
+def test_delete_question(mock_confirm, setup_listbox_window):
 	root, box, type, window = setup_listbox_window('DELETE')
 	window.select_box.get.return_value = '1'
 
@@ -202,5 +203,70 @@ def test_delete_question(mock_info, setup_listbox_window):
 
 	window.delete_selected_question()
 
+	mock_confirm.assert_called_once()
 	assert box.box1[0].get_answer() == 'answer2'
-	root.destroy()
\ No newline at end of file
+	root.destroy()
+
+@patch('tkinter.messagebox.askyesno', return_value=True)
+def test_delete_many_questions(mock_confirm, setup_listbox_window):
+	root, box, type, window = setup_listbox_window('DELETE')
+	window.select_box.get.return_value = '1'
+
+	window.display_questions()
+
+	window.question_listbox = MagicMock()
+	window.question_listbox.curselection.return_value = (0, 2, 3)
+
+	window.delete_selected_question()
+
+	mock_confirm.assert_called_once()		#one confirmation for the whole batch
+	assert [card.get_answer() for card in box.box1] == ['answer2', 'answer5']
+	root.destroy()
+
+def test_search_covers_the_whole_deck():
+	root = Tk()
+	root.withdraw()
+	box = Box()
+	loaded = Card('Berlin', ['Capital of Germany?', None])
+	stored = Card('Paris', ['Capital of France?', None], box=3)
+	box.box1.append(loaded)
+	box.search_index = SearchIndex()
+	for card in (loaded, stored):
+		box.search_index.add_card(card)
+	database = MagicMock()
+	database.take_cards.side_effect = lambda box, card_ids: [box.box3.append(stored) or stored] if stored.id in card_ids else []
+
+	window = QuestionListbox(root, box, 'VIEW', database)
+	window.search_entry.insert(0, 'capital')
+	window.search_questions()
+
+	assert {card.id for card in window.model.cards} == {loaded.id, stored.id} 	#the card in the cards file too
+	database.take_cards.assert_called_once_with(box, [stored.id])
+	root.destroy()
+
+'''
+Third section of tests: Testing QuestionListModel (no window needed)
+'''
+
+def test_list_model_rows():
+	cards = [Card(f'answer{i}', [f'question{i}', None]) for i in range(200)]
+	cards.append(Card('mcq answer', [None, 'mcq question,option1,option2,option3']))
+	model = QuestionListModel(cards)
+
+	assert len(model) == 201
+	assert model.rows(0, 3) == ['question0', 'question1', 'question2']
+	assert model.rows(199, 12) == ['question199', 'mcq question']	#short last page, MCQ shown without options
+	assert model.card(5) is cards[5]
+
+def test_list_model_bounded_cache():
+	cards = [Card(f'answer{i}', [f'question{i}', None]) for i in range(QuestionListModel.PAGE_SIZE*20)]
+	model = QuestionListModel(cards)
+
+	for start in range(0, len(cards), QuestionListModel.PAGE_SIZE):
+		model.rows(start, 12)
+
+	assert len(model.pages) == QuestionListModel.MAX_PAGES
+
+	cards[0].questions = ['edited', None]
+	model.invalidate()
+	assert model.rows(0, 1) == ['edited']
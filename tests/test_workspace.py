@@ -0,0 +1,69 @@
+#! python3
+# test_workspace.py - Tests for the workspace cache in workspace.py
+
+import asyncio
+from functools import partial
+
+from app.workspace import WorkspaceCache, open_workspace
+from benchmarks.synthetic import populate
+
+def run_io(function, *args):
+	return asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+def make_cache(database_factory, users, budget_workspaces):
+	#Cache of the workspaces of users with 100 cards each, with a budget for budget_workspaces of them
+	for username in users:
+		populate(database_factory(username), 100, sessions=3)
+	load = partial(open_workspace, database_factory)
+	workspace = load(users[0])
+	budget = int(workspace.size()*(budget_workspaces + 0.5))
+	workspace.write_back() 				#the measured workspace goes back to the files
+	return WorkspaceCache(load, run_io, budget)
+
+def stored_cards(database_factory, username):
+	return len(list(database_factory(username).iter_file()))
+
+def test_lru_eviction_and_write_back(database_factory):
+	users = ['ann', 'bob', 'cid']
+	cache = make_cache(database_factory, users, 2)
+
+	async def main():
+		async with cache.use('ann') as ann:
+			ann.userdata['session_data'].append(100.0)
+			ann.changed = True
+		async with cache.use('bob'):
+			pass
+		async with cache.use('ann'):				#ann is used more recently than bob
+			pass
+		async with cache.use('cid'):
+			pass
+		assert list(cache.workspaces) == ['ann', 'cid'] and cache.total <= cache.budget
+		await cache.flush()
+		assert stored_cards(database_factory, 'bob') == 100 	#bob was written back
+
+		async with cache.use('bob'):				#loaded again, ann goes
+			pass
+		await cache.flush()
+		assert list(cache.workspaces) == ['cid', 'bob']
+		assert database_factory('ann').load_userdata()['session_data'][-1] == 100.0
+		assert cache.stats() | {'bytes': 0, 'budget': 0} == {'workspaces': 2, 'bytes': 0, 'budget': 0, 'hits': 1,
+			'misses': 4, 'hit_rate': 0.2, 'evictions': 2, 'write_backs': 2}
+		await cache.close()
+	asyncio.run(main())
+	assert all(stored_cards(database_factory, username) == 100 for username in users) and not len(cache)
+
+def test_workspaces_in_use_are_kept(database_factory):
+	cache = make_cache(database_factory, ['ann', 'bob'], 1)
+
+	async def main():
+		loads = await asyncio.gather(cache.get('ann'), cache.get('ann')) 	#one load for both
+		assert loads[0] is loads[1] and cache.misses == 1
+		async with cache.use('ann'):
+			async with cache.use('bob'): 			#over the budget, but ann is in use
+				assert list(cache.workspaces) == ['ann', 'bob']
+		async with cache.use('bob'):
+			pass
+		assert list(cache.workspaces) == ['bob']
+		await cache.evict_idle(float('inf'))
+		assert not len(cache) and stored_cards(database_factory, 'bob') == 100
+	asyncio.run(main())